@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+from utils import *
+
+
+class Allocator(Component):
+    """
+    Free-list allocator handing out byte ranges of a fixed size memory
+
+    ...
+    Parameters
+    ----------
+    size : int
+        Number of bytes managed by the allocator.
+    alignment : int, optional
+        Default alignment of every allocation in bytes.
+
+    Attributes
+    ----------
+    size : int
+        Number of bytes managed by the allocator.
+    alignment : int
+        Default alignment of every allocation in bytes.
+    top : int
+        Start of the never allocated space at the end of the memory.
+    high_water : int
+        Largest value top has ever reached.
+    used : int
+        Number of allocated bytes.
+    allocated : dict(offset: size)
+        Every live allocation.
+    free : dict(offset: size)
+        Every hole below top. Holes are always coalesced, so no two of them are adjacent.
+    bins : dict(int: set(offset))
+        The holes segregated by size class, class k holds the holes of size [2**(k-1), 2**k).
+
+    Examples
+    --------
+    >>> alloc = Allocator(16)
+    >>> alloc.alloc(4), alloc.alloc(4), alloc.alloc(4)
+    (0, 4, 8)
+    >>> alloc.release(0)
+    >>> alloc.release(4)
+    >>> alloc.free
+    {0: 8}
+    >>> alloc.alloc(2)
+    0
+    """
+    def __init__(self, size: int, alignment: int=1):
+        super(Allocator, self).__init__('Allocator')
+        self.size = size
+        self.alignment = alignment
+        self.top = 0
+        self.high_water = 0
+        self.used = 0
+        self.allocated = {}
+        self.free = {}
+        self._ends = {}
+        self.bins = {}
+
+    def alloc(self, size: int, alignment: int=None) -> int:
+        """
+        Allocate a range of bytes.
+
+        Parameters
+        ----------
+        size : int
+            Number of bytes to allocate.
+        alignment : int, optional
+            Alignment of the range, defaults to the allocator alignment.
+
+        Returns
+        -------
+        int
+            Offset of the first allocated byte.
+
+        Raises
+        ------
+        OutOfMemory
+            If no hole and not enough space above top is left for the allocation.
+        """
+        if size <= 0:
+            raise ValueError('Cannot allocate {0} bytes'.format(size))
+        if alignment is None:
+            alignment = self.alignment
+
+        for size_class in range(size.bit_length(), self.size.bit_length() + 1):
+            for offset in self.bins.get(size_class, ()):
+                hole = self.free[offset]
+                start = -(-offset // alignment) * alignment
+                if start + size <= offset + hole:
+                    self._take(offset)
+                    if start > offset:
+                        self._give(offset, start - offset)
+                    if start + size < offset + hole:
+                        self._give(start + size, offset + hole - start - size)
+                    return self._allocated(start, size)
+
+        start = -(-self.top // alignment) * alignment
+        if start + size > self.size:
+            raise OutOfMemory('Cannot allocate {0} bytes, {1} of {2} bytes in use'.format(
+                size, self.used, self.size))
+        if start > self.top:
+            self._give(self.top, start - self.top)
+        self.top = start + size
+        self.high_water = max(self.high_water, self.top)
+        return self._allocated(start, size)
+
+    def release(self, offset: int):
+        """
+        Give an allocated range back, merging it with the neighbouring holes.
+
+        Parameters
+        ----------
+        offset : int
+            Offset returned by alloc().
+        """
+        try:
+            size = self.allocated.pop(offset)
+        except KeyError:
+            raise ValueError('Nothing is allocated at offset {0}'.format(offset))
+        self.used -= size
+        self._give(offset, size)
+
+    def reset(self):
+        """
+        Release every allocation at once.
+        """
+        self.top = 0
+        self.used = 0
+        self.allocated.clear()
+        self.free.clear()
+        self._ends.clear()
+        self.bins.clear()
+
+    def dump(self) -> dict:
+        """
+        Returns
+        -------
+        dict
+            The complete allocator state as plain python objects, for load().
+        """
+        return {'size': self.size,
+                'alignment': self.alignment,
+                'top': self.top,
+                'high_water': self.high_water,
+                'allocated': sorted(self.allocated.items()),
+                'free': sorted(self.free.items())}
+
+    def load(self, state: dict):
+        """
+        Replace the allocator state with one returned by dump().
+        """
+        self.reset()
+        self.size = state['size']
+        self.alignment = state['alignment']
+        self.high_water = state['high_water']
+        for offset, size in state['allocated']:
+            self._allocated(offset, size)
+        for offset, size in state['free']:
+            self.free[offset] = size
+            self._ends[offset + size] = offset
+            self.bins.setdefault(size.bit_length(), set()).add(offset)
+        self.top = state['top']
+
+    def stats(self) -> dict:
+        """
+        Returns
+        -------
+        dict
+            size, used and free bytes, number of allocations and holes, the largest
+            allocation that would currently succeed, occupancy (used / size),
+            fragmentation (share of the free bytes outside of the largest free range)
+            and the high water mark of the allocations.
+        """
+        free = self.size - self.used
+        largest = max(max(self.free.values(), default=0), self.size - self.top)
+        return {'size': self.size,
+                'used': self.used,
+                'free': free,
+                'allocations': len(self.allocated),
+                'holes': len(self.free),
+                'largest_free': largest,
+                'occupancy': self.used / self.size if self.size else 0.0,
+                'fragmentation': 1 - largest / free if free else 0.0,
+                'high_water': self.high_water}
+
+    def _allocated(self, offset, size):
+        self.allocated[offset] = size
+        self.used += size
+        return offset
+
+    def _take(self, offset):
+        size = self.free.pop(offset)
+        del self._ends[offset + size]
+        self.bins[size.bit_length()].discard(offset)
+        return size
+
+    def _give(self, offset, size):
+        end = offset + size
+        if end in self.free:
+            end += self._take(end)
+        if offset in self._ends:
+            offset = self._ends[offset]
+            self._take(offset)
+
+        if end == self.top:
+            self.top = offset
+            return
+        self.free[offset] = end - offset
+        self._ends[end] = offset
+        self.bins.setdefault((end - offset).bit_length(), set()).add(offset)
+
+    def __repr__(self):
+        return str(self.stats())
+
+    def __str__(self):
+        return "{0} of {1} bytes allocated in {2} blocks, {3} holes".format(
+            self.used, self.size, len(self.allocated), len(self.free))
+
+
+if __name__ == "__main__":
+    alloc = Allocator(64, alignment=4)
+    blocks = [alloc.alloc(size) for size in (1, 2, 4, 8, 1)]
+    alloc.release(blocks[1])
+    alloc.release(blocks[3])
+    print(alloc)
+    print(repr(alloc))
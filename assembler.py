@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+import re
+from utils import *
+from register import RegisterFile
+from memory import Address
+from commands import masm_commands
+
+# Operand kinds of a decoded instruction
+REG = 0
+IMM = 1
+VAR = 2
+LABEL = 3
+MEM = 4
+OFFSET = 5
+
+_registers = frozenset(name for names in RegisterFile.layout for name in names if name is not None)
+_identifier = re.compile(r'^[A-Za-z_@$?][\w@$?]*$')
+_ignored = frozenset(('END', 'ENDP', 'INCLUDE', 'INCLUDELIB', 'OPTION', 'TITLE'))
+_prefixes = frozenset(('REP', 'REPE', 'REPZ', 'REPNE', 'REPNZ'))
+_dup = re.compile(r'^(.+?)\s+DUP\s*\((.*)\)$', re.IGNORECASE)
+_ptr = re.compile(r'^(\w+)\s+PTR\s+(.*)$', re.IGNORECASE)
+_indexed = re.compile(r'^([A-Za-z_@$?][\w@$?]*)?\s*\[(.*)\]$')
+_offset = re.compile(r'^OFFSET\s+(.*)$', re.IGNORECASE)
+# Size of every register in bytes
+_register_sizes = {name: size for names in RegisterFile.layout
+                   for name, size in zip(names, (4, 2, 1, 1)) if name is not None}
+
+
+def parse_number(token: str):
+    """
+    Parse a MASM integer constant.
+
+    Parameters
+    ----------
+    token : str
+        Decimal (10, 10d), hexadecimal (0Ah, 0xA), binary (1010b),
+        octal (12o, 12q) or character ('A') constant, optionally negated.
+
+    Returns
+    -------
+    int or None
+        The value of the constant, None if token is not a constant.
+
+    """
+    token = token.strip()
+    sign = 1
+    if token[:1] in ('-', '+'):
+        sign = -1 if token[0] == '-' else 1
+        token = token[1:].strip()
+
+    if len(token) == 3 and token[0] == token[2] and token[0] in '\'"':
+        return sign * ord(token[1])
+
+    lower = token.lower()
+    try:
+        if lower.startswith('0x'):
+            return sign * int(lower[2:], 16)
+        if not lower or not lower[0].isdigit():
+            return None
+        if lower[-1] == 'h':
+            return sign * int(lower[:-1], 16)
+        if lower[-1] == 'b':
+            return sign * int(lower[:-1], 2)
+        if lower[-1] in 'oq':
+            return sign * int(lower[:-1], 8)
+        if lower[-1] == 'd':
+            return sign * int(lower[:-1], 10)
+        return sign * int(lower, 10)
+    except ValueError:
+        return None
+
+
+def split_operands(text: str) -> list:
+    """
+    Split an operand list on the commas that are not inside brackets or quotes.
+    """
+    operands = []
+    depth = 0
+    quote = None
+    start = 0
+    for i, char in enumerate(text):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            operands.append(text[start:i].strip())
+            start = i + 1
+    last = text[start:].strip()
+    if last or operands:
+        operands.append(last)
+    return operands
+
+
+def parse_initializer(text: str, dtype) -> tuple:
+    """
+    Parse the initializer list of an array declaration.
+
+    Parameters
+    ----------
+    text : str
+        Comma separated constants, ? for uninitialized elements, quoted
+        strings of several characters and count DUP(list) repetitions,
+        which may be nested.
+    dtype : np.dtype
+        Type of the elements.
+
+    Returns
+    -------
+    values : ndarray
+        Value of every element, 0 for ? elements.
+    initialized : bool
+        False if every element is ?.
+
+    Raises
+    ------
+    ValueError
+        On a malformed list.
+    OverflowError
+        On a constant that does not fit dtype.
+
+    Examples
+    --------
+    >>> values, initialized = parse_initializer('1, 2 DUP(3, ?), "ab"', np.uint8)
+    >>> values.tolist(), initialized
+    ([1, 3, 0, 3, 0, 97, 98], True)
+    """
+    parts = []
+    initialized = False
+    for item in split_operands(text):
+        match = _dup.match(item)
+        if match is not None:
+            count = parse_number(match.group(1))
+            if count is None or count < 1:
+                raise ValueError('invalid DUP count {0}'.format(match.group(1)))
+            values, init = parse_initializer(match.group(2), dtype)
+            parts.append(np.tile(values, count))
+            initialized |= init
+        elif item == '?':
+            parts.append(np.zeros(1, dtype=dtype))
+        elif len(item) > 3 and item[0] == item[-1] and item[0] in '\'"':
+            parts.append(np.array([ord(char) for char in item[1:-1]], dtype=dtype))
+            initialized = True
+        else:
+            value = parse_number(item)
+            if value is None:
+                raise ValueError('invalid initializer {0}'.format(item))
+            parts.append(np.array([value], dtype=dtype))
+            initialized = True
+    if not parts:
+        raise ValueError('empty initializer')
+    return np.concatenate(parts), initialized
+
+
+def parse_address(text: str, variables) -> tuple:
+    """
+    Parse the expression inside the brackets of a memory operand.
+
+    Parameters
+    ----------
+    text : str
+        Terms joined by + and -: 32-bit registers, at most one of them
+        scaled as reg*scale or scale*reg, constants, and a variable.
+    variables : container(str)
+        Names of the declared variables.
+
+    Returns
+    -------
+    tuple(base, index, scale, disp, variable)
+        Register names or None, the scale of index, the sum of the
+        constants and the variable name or None.
+
+    Raises
+    ------
+    ValueError
+        On a malformed expression, or one using esp.
+
+    Examples
+    --------
+    >>> parse_address('esi + ebx*4 - 8', ())
+    ('esi', 'ebx', 4, -8, None)
+    """
+    base = index = variable = None
+    scale = 1
+    disp = 0
+    terms = re.split(r'([+-])', text.replace(' ', '').replace('\t', ''))
+    if terms[0] == '':
+        terms = ['+'] + terms[1:]
+    else:
+        terms = ['+'] + terms
+    for sign, term in zip(terms[::2], terms[1::2]):
+        value = parse_number(term)
+        if value is not None:
+            disp += value if sign == '+' else -value
+            continue
+        if sign == '-':
+            raise ValueError('only constants can be subtracted')
+        factors = term.lower().split('*')
+        if len(factors) == 2:
+            if factors[0] in _registers:
+                factors.reverse()
+            number = parse_number(factors[0])
+            if number not in (1, 2, 4, 8) or factors[1] not in _registers:
+                raise ValueError('invalid scaled index {0}'.format(term))
+            if index is not None:
+                raise ValueError('more than one index register')
+            if _register_sizes[factors[1]] != 4:
+                raise ValueError('{0} is not a 32-bit register'.format(factors[1]))
+            index, scale = factors[1], number
+        elif len(factors) != 1:
+            raise ValueError('invalid term {0}'.format(term))
+        elif term.lower() in _registers:
+            if _register_sizes[term.lower()] != 4:
+                raise ValueError('{0} is not a 32-bit register'.format(term))
+            if base is None:
+                base = term.lower()
+            elif index is None:
+                index = term.lower()
+            else:
+                raise ValueError('more than two registers')
+        elif term in variables:
+            if variable is not None:
+                raise ValueError('more than one variable')
+            variable = term
+        else:
+            raise ValueError('unknown term {0}'.format(term))
+    if 'esp' in (base, index):
+        raise ValueError('the stack is not mapped into memory, esp cannot address it')
+    return base, index, scale, disp, variable
+
+
+def strip_comment(line: str) -> str:
+    """
+    Remove a ; comment that is not inside quotes.
+    """
+    quote = None
+    for i, char in enumerate(line):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char == ';':
+            return line[:i]
+    return line
+
+
+class Program:
+    """
+    Pre-decoded assembly program
+
+    ...
+    Parameters
+    ----------
+    names : tuple(str)
+        Mnemonic of every distinct instruction in the program.
+    opcodes : ndarray(np.uint16)
+        Index into names of every instruction.
+    operands : tuple(tuple(tuple(kind, payload)))
+        Decoded operands of every instruction. Registers are (REG, name),
+        constants (IMM, value), variables (VAR, name), jump targets
+        (LABEL, instruction index), OFFSET name (OFFSET, name) and memory
+        operands (MEM, (base, index, scale, disp, variable, size, signed)).
+    lines : tuple(int)
+        Source line of every instruction.
+    labels : dict(name: int)
+        Instruction index of every label.
+    data : tuple(tuple(name, word, value))
+        The .data declarations in order, value is None for uninitialized variables.
+        For arrays, value is a tuple (length, values) of the number of elements
+        and an ndarray of their values, None for uninitialized arrays.
+    source : str, optional
+        The assembled source.
+
+    Attributes
+    ----------
+    cache : dict
+        Storage for code derived from the program, such as compiled blocks.
+        It is not pickled, a copy of the program starts with an empty cache.
+
+    Examples
+    --------
+    >>> program = assemble('''
+    ... .data
+    ... x DWORD 5
+    ... .code
+    ... main:
+    ...     MOV eax, x
+    ...     ADD eax, 0Ah
+    ... ''')
+    >>> program.operands
+    (((0, 'eax'), (2, 'x')), ((0, 'eax'), (1, 10)))
+    """
+    def __init__(self, names, opcodes, operands, lines, labels, data, source=''):
+        self.names = tuple(names)
+        self.opcodes = np.asarray(opcodes, dtype=np.uint16)
+        self.operands = tuple(operands)
+        self.lines = tuple(lines)
+        self.labels = dict(labels)
+        self.data = tuple(data)
+        self.source = source
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.operands)
+
+    def __getstate__(self):
+        # The cache holds compiled code objects, which cannot be pickled, and is rebuilt on demand
+        state = self.__dict__.copy()
+        state['cache'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def mnemonic(self, index: int) -> str:
+        """
+        Returns
+        -------
+        str
+            Mnemonic of the instruction at index.
+        """
+        return self.names[self.opcodes[index]]
+
+    def load(self, computer):
+        """
+        Declare the .data variables of the program in the memory of a computer.
+
+        Variables that already exist are reinitialized with their declared value,
+        and those declared with ? are zeroed and uninitialized again, so the same
+        program can be loaded repeatedly.
+        """
+        mem = computer.mem
+        for name, word, value in self.data:
+            vt = computer.vt[word]
+            if isinstance(value, tuple):
+                length, values = value
+                if name not in mem.variables:
+                    mem.declare_array(name, length, vt.bytes, vt.signed, values)
+                elif values is not None:
+                    mem.write_array(name, values)
+                else:
+                    mem.clear(name)
+            elif name not in mem.variables:
+                mem.set(name, value, vt.bytes, vt.signed)
+            elif value is not None:
+                mem.set(name, value)
+            else:
+                mem.clear(name)
+
+    def resolve(self, computer) -> list:
+        """
+        Resolve the operands of every instruction against a computer.
+
+        Returns
+        -------
+        list(tuple)
+            For every instruction, its operands as the objects the commands
+            operate on: Registers, References to variables, Addresses for
+            memory operands, ints for constants, variable offsets and
+            instruction indices for jump targets.
+        """
+        references = {}
+        resolved = []
+        for operands in self.operands:
+            instruction = []
+            for kind, payload in operands:
+                if kind == REG:
+                    instruction.append(computer.reg[payload])
+                elif kind == VAR:
+                    if payload not in references:
+                        references[payload] = computer.mem.reference(payload)
+                    instruction.append(references[payload])
+                elif kind == MEM:
+                    base, index, scale, disp, variable, size, signed = payload
+                    instruction.append(Address(
+                        computer.mem, None if base is None else computer.reg[base],
+                        None if index is None else computer.reg[index],
+                        scale, disp, variable, size, signed))
+                elif kind == OFFSET:
+                    try:
+                        instruction.append(computer.mem.variables[payload][0])
+                    except KeyError:
+                        raise VariableNotDefined('Variable {0} has not been defined'.format(payload))
+                else:
+                    instruction.append(payload)
+            resolved.append(tuple(instruction))
+        return resolved
+
+    def __repr__(self):
+        return '\n'.join('{0:>4}  {1} {2}'.format(i, self.mnemonic(i), operands)
+                         for i, operands in enumerate(self.operands))
+
+    def __str__(self):
+        return "Program with {0} instructions and {1} variables".format(len(self), len(self.data))
+
+
+def assemble(source: str, commands: dict=None, types: dict=None) -> Program:
+    """
+    Assemble MASM source into a pre-decoded Program.
+
+    Parameters
+    ----------
+    source : str
+        Program source with optional .data and .code sections.
+    commands : dict(name: Command), optional
+        Instruction set, masm_commands by default.
+    types : dict(name: VarType), optional
+        Variable types allowed in .data declarations, Computer.vt by default.
+
+    Returns
+    -------
+    Program
+        The decoded program.
+
+    Raises
+    ------
+    AssemblerError
+        On any syntax error, unknown instruction, type or operand, label
+        defined twice or constant initializer out of the range of its type.
+    """
+    if commands is None:
+        commands = masm_commands
+    if types is None:
+        from main import Computer
+        types = Computer.vt
+
+    section = '.code'
+    data = []
+    # Type of every declared variable
+    variables = {}
+    labels = {}
+    instructions = []
+
+    for number, line in enumerate(source.splitlines(), 1):
+        line = strip_comment(line).strip()
+        if not line:
+            continue
+
+        def error(message):
+            return AssemblerError('line {0}: {1}: {2}'.format(number, message, line))
+
+        head = line.split(None, 1)[0]
+        if head.startswith('.'):
+            if head.lower() in ('.data', '.code'):
+                section = head.lower()
+            continue
+        if head.upper() in _ignored:
+            continue
+
+        # Labels
+        words = line.split()
+        if len(words) >= 2 and words[1].upper() in ('PROC', 'ENDP'):
+            if words[1].upper() == 'PROC':
+                if words[0] in labels:
+                    raise error('label {0} already defined'.format(words[0]))
+                labels[words[0]] = len(instructions)
+            continue
+        match = re.match(r'^([A-Za-z_@$?][\w@$?]*)\s*:(?!:)\s*(.*)$', line)
+        if match is not None:
+            if match.group(1) in labels:
+                raise error('label {0} already defined'.format(match.group(1)))
+            labels[match.group(1)] = len(instructions)
+            line = match.group(2)
+            if not line:
+                continue
+
+        if section == '.data':
+            words = line.split(None, 2)
+            if len(words) < 2 or words[1].upper() not in types or not _identifier.match(words[0]):
+                raise error('invalid declaration')
+            name, word = words[0], words[1].upper()
+            if name in variables:
+                raise error('variable {0} already defined'.format(name))
+            initializer = words[2].strip() if len(words) == 3 else '?'
+            if initializer == '?':
+                value = None
+            elif parse_number(initializer) is not None:
+                value = parse_number(initializer)
+                descriptor = types[word].descriptor
+                if not descriptor.min <= value <= descriptor.max:
+                    raise error('initializer {0} out of range for {1}'.format(initializer, word))
+            else:
+                try:
+                    values, initialized = parse_initializer(initializer, types[word].descriptor.dtype)
+                except (ValueError, OverflowError):
+                    raise error('invalid initializer {0}'.format(initializer))
+                value = (len(values), values if initialized else None)
+            variables[name] = word
+            data.append((name, word, value))
+            continue
+
+        words = line.split(None, 1)
+        mnemonic = words[0].upper()
+        if mnemonic in _prefixes and len(words) == 2:
+            # A prefixed instruction is a mnemonic of its own, such as 'REP MOVSB'
+            words = words[1].split(None, 1)
+            mnemonic = mnemonic + ' ' + words[0].upper()
+        if mnemonic not in commands:
+            raise error('unknown instruction {0}'.format(mnemonic))
+        operands = split_operands(words[1]) if len(words) == 2 else []
+        instructions.append((number, mnemonic, operands, error))
+
+    names = []
+    opcodes = []
+    decoded = []
+    lines = []
+    for number, mnemonic, operands, error in instructions:
+        if mnemonic not in names:
+            names.append(mnemonic)
+        opcodes.append(names.index(mnemonic))
+        lines.append(number)
+
+        instruction = []
+        for operand in operands:
+            word = None
+            match = _ptr.match(operand)
+            if match is not None:
+                word = match.group(1).upper()
+                if word not in types:
+                    raise error('unknown type {0}'.format(match.group(1)))
+                operand = match.group(2).strip()
+            match = _indexed.match(operand)
+            offset = _offset.match(operand)
+            value = parse_number(operand)
+            if match is not None:
+                # Memory operand, var[expr] adds the offset of var to expr
+                expression = match.group(2)
+                if match.group(1) is not None:
+                    expression = match.group(1) + '+' + expression
+                try:
+                    base, index, scale, disp, variable = parse_address(expression, variables)
+                except ValueError as e:
+                    raise error('invalid memory operand {0}: {1}'.format(operand, e))
+                instruction.append((MEM, [base, index, scale, disp, variable, word]))
+            elif word is not None and operand in variables:
+                instruction.append((MEM, [None, None, 1, 0, operand, word]))
+            elif word is not None:
+                raise error('PTR needs a memory operand: {0}'.format(operand))
+            elif value is not None:
+                instruction.append((IMM, value))
+            elif operand.lower() in _registers:
+                instruction.append((REG, operand.lower()))
+            elif operand in variables:
+                instruction.append((VAR, operand))
+            elif operand in labels:
+                instruction.append((LABEL, labels[operand]))
+            elif offset is not None and offset.group(1).strip() in variables:
+                instruction.append((OFFSET, offset.group(1).strip()))
+            else:
+                raise error('unknown operand {0}'.format(operand))
+
+        # Size of memory operands without PTR: their variable, else the register operand
+        registers = [_register_sizes[payload] for kind, payload in instruction if kind == REG]
+        for i, (kind, payload) in enumerate(instruction):
+            if kind != MEM:
+                continue
+            base, index, scale, disp, variable, word = payload
+            if word is not None:
+                size, signed = types[word].bytes, types[word].signed
+            elif variable is not None:
+                size, signed = types[variables[variable]].bytes, types[variables[variable]].signed
+            elif registers:
+                size, signed = registers[0], False
+            else:
+                raise error('size of memory operand unknown, use PTR')
+            instruction[i] = (MEM, (base, index, scale, disp, variable, size, signed))
+        decoded.append(tuple(instruction))
+
+    return Program(names, opcodes, decoded, lines, labels, data, source)
+
+
+if __name__ == "__main__":
+    program = assemble('''
+    .data
+    x DWORD 5
+    y SBYTE ?
+
+    .code
+    main PROC
+        MOV eax, x     ; load x
+        ADD eax, 0Ah
+        MOV ebx, eax
+    main ENDP
+    END main
+    ''')
+    print(program)
+    print(repr(program))
@@ -0,0 +1,790 @@
+#!/usr/bin/env python3
+import sys
+from functools import partial
+from time import perf_counter
+from utils import *
+from memory import Memory
+from register import RegisterFile
+from assembler import REG, IMM, VAR, LABEL, MEM, OFFSET
+from flags import CF, PF, AF, ZF, SF, DF, OF, STATUS_MASK, RESERVED, carry, jumps
+
+# Operation of a flags record, by its index in BatchFlags.op
+operations = ('add', 'sub', 'inc', 'dec', 'set')
+ADD, SUB, INC, DEC, SET = range(len(operations))
+
+# Instructions whose first operand is written, vectorized for register, variable and memory destinations
+_destinations = frozenset(('MOV', 'ADD', 'SUB', 'CMP', 'INC', 'DEC', 'POP'))
+
+_ones = np.uint64(0xFFFFFFFFFFFFFFFF)
+# Whether or not a byte has an even number of set bits
+_parity = np.array([bin(byte).count('1') % 2 == 0 for byte in range(256)])
+
+
+class BatchFlags(Component):
+    """
+    The status flags of every lane, kept as flags records in arrays
+
+    ...
+    Parameters
+    ----------
+    lanes : int
+        Number of lanes.
+
+    Attributes
+    ----------
+    op : ndarray(np.uint8)
+        Operation of the record of every lane, an index into operations.
+    a, b : ndarray(np.uint64)
+        Destination and source operands of the records, masked to bits.
+        For 'set' records, a holds the EFLAGS word.
+    bits : ndarray(np.uint64)
+        Width of the operation of the records.
+    cf : ndarray(bool)
+        The carry flag 'inc' and 'dec' records keep from the record before them.
+    df : ndarray(bool)
+        The direction flag of every lane.
+
+    Notes
+    -----
+    Every lane holds the record a Flags would, see flags.py, and flags are
+    computed from the records the same way when a conditional jump or
+    PUSHF reads them, for all lanes at once. INC and DEC leave the carry
+    flag alone, so the carry of the record they replace is computed when
+    they execute instead of keeping that record.
+    """
+    def __init__(self, lanes):
+        super(BatchFlags, self).__init__('BatchFlags')
+        self.op = np.full((lanes,), SET, dtype=np.uint8)
+        self.a = np.full((lanes,), RESERVED, dtype=np.uint64)
+        self.b = np.zeros((lanes,), dtype=np.uint64)
+        self.bits = np.full((lanes,), 32, dtype=np.uint64)
+        self.cf = np.zeros((lanes,), dtype=bool)
+        self.df = np.zeros((lanes,), dtype=bool)
+
+    def set(self, mask, op, a, b, bits):
+        """
+        Record an operation in the lanes of mask, as the instructions of commands.py set Flags.last.
+
+        Parameters
+        ----------
+        mask : ndarray(bool)
+            The lanes that executed the operation.
+        op : int
+            The operation, ADD, SUB, INC, DEC or SET.
+        a, b : ndarray or int
+            Destination and source operands as the instruction read them.
+        bits : int
+            Width of the operation.
+        """
+        ones = np.uint64((1 << bits) - 1)
+        if op == INC or op == DEC:
+            self.cf[mask] = self.carry()[mask]
+        self.op[mask] = op
+        self.a[mask] = self._masked(a, ones)[mask]
+        self.b[mask] = self._masked(b, ones)[mask]
+        self.bits[mask] = bits
+
+    def _masked(self, values, ones):
+        if isinstance(values, np.ndarray):
+            return values.astype(np.uint64) & ones
+        return np.broadcast_to(np.uint64(int(values) & int(ones)), self.op.shape)
+
+    @property
+    def value(self) -> np.ndarray:
+        """
+        The flags of every lane as EFLAGS words.
+        """
+        word = (RESERVED | self.carry().astype(np.uint64) << CF | self.parity().astype(np.uint64) << PF |
+                self.adjust().astype(np.uint64) << AF | self.zero().astype(np.uint64) << ZF |
+                self.sign().astype(np.uint64) << SF | self.overflow().astype(np.uint64) << OF)
+        word = np.where(self.op == SET, self.a, word) | self.df.astype(np.uint64) << DF
+        return word.astype(np.uint32)
+
+    def set_value(self, mask, words):
+        """
+        Load EFLAGS words in the lanes of mask, like assigning Flags.value.
+        """
+        words = np.asarray(words).astype(np.uint64)
+        self.set(mask, SET, (words & STATUS_MASK) | RESERVED, 0, 32)
+        self.df[mask] = (words[mask] >> DF & 1).astype(bool)
+
+    def store(self, lane: int, record):
+        """
+        Set the flags record of a lane from a record as Flags.last holds it.
+        """
+        op, a, b, bits, previous = record
+        ones = (1 << bits) - 1
+        self.op[lane] = operations.index(op)
+        self.a[lane] = int(a) & ones
+        self.b[lane] = int(b) & ones
+        self.bits[lane] = bits
+        if previous is not None:
+            self.cf[lane] = carry(previous)
+
+    def record(self, lane: int) -> tuple:
+        """
+        The flags record of a lane, as Flags.last holds it.
+        """
+        op = operations[self.op[lane]]
+        previous = None
+        if op == 'inc' or op == 'dec':
+            previous = ('set', RESERVED | int(self.cf[lane]) << CF, 0, 32, None)
+        return op, int(self.a[lane]), int(self.b[lane]), int(self.bits[lane]), previous
+
+    def _bit(self, bit):
+        return (self.a >> bit & 1).astype(bool)
+
+    def result(self) -> np.ndarray:
+        adds = (self.op == ADD) | (self.op == INC)
+        return np.where(adds, self.a + self.b, self.a - self.b) & (_ones >> (64 - self.bits))
+
+    def carry(self) -> np.ndarray:
+        adds = (self.op == ADD) | (self.op == INC)
+        carry = np.where(adds, self.result() < self.a, self.a < self.b)
+        carry = np.where((self.op == INC) | (self.op == DEC), self.cf, carry)
+        return np.where(self.op == SET, self._bit(CF), carry)
+
+    def parity(self) -> np.ndarray:
+        return np.where(self.op == SET, self._bit(PF), _parity[(self.result() & 0xFF).astype(np.intp)])
+
+    def adjust(self) -> np.ndarray:
+        adjust = ((self.a ^ self.b ^ self.result()) >> 4 & 1).astype(bool)
+        return np.where(self.op == SET, self._bit(AF), adjust)
+
+    def zero(self) -> np.ndarray:
+        return np.where(self.op == SET, self._bit(ZF), self.result() == 0)
+
+    def sign(self) -> np.ndarray:
+        sign = (self.result() >> (self.bits - 1) & 1).astype(bool)
+        return np.where(self.op == SET, self._bit(SF), sign)
+
+    def overflow(self) -> np.ndarray:
+        a, b, r = self.a, self.b, self.result()
+        adds = (self.op == ADD) | (self.op == INC)
+        overflow = (np.where(adds, (a ^ r) & (b ^ r), (a ^ b) & (a ^ r)) >> (self.bits - 1) & 1).astype(bool)
+        return np.where(self.op == SET, self._bit(OF), overflow)
+
+    def test(self, condition: str) -> np.ndarray:
+        """
+        Evaluate a condition code such as 'E' or 'GE' in every lane.
+        """
+        return conditions[condition](self)
+
+
+# Condition of every conditional jump, evaluated on the flags of every lane, see flags.conditions
+conditions = {
+    'O': lambda flags: flags.overflow(),
+    'NO': lambda flags: ~flags.overflow(),
+    'B': lambda flags: flags.carry(),
+    'AE': lambda flags: ~flags.carry(),
+    'E': lambda flags: flags.zero(),
+    'NE': lambda flags: ~flags.zero(),
+    'BE': lambda flags: flags.carry() | flags.zero(),
+    'A': lambda flags: ~(flags.carry() | flags.zero()),
+    'S': lambda flags: flags.sign(),
+    'NS': lambda flags: ~flags.sign(),
+    'P': lambda flags: flags.parity(),
+    'NP': lambda flags: ~flags.parity(),
+    'L': lambda flags: flags.sign() != flags.overflow(),
+    'GE': lambda flags: flags.sign() == flags.overflow(),
+    'LE': lambda flags: flags.zero() | (flags.sign() != flags.overflow()),
+    'G': lambda flags: ~flags.zero() & (flags.sign() == flags.overflow())
+}
+
+
+class BatchResult:
+    """
+    Outcome of BatchComputer.run
+
+    ...
+    Attributes
+    ----------
+    steps : ndarray(int)
+        Number of instructions executed by every lane.
+    ip : ndarray(int)
+        Index of the next instruction of every lane.
+    halted : ndarray(bool)
+        Which lanes ran past the last instruction.
+    errors : list(Exception or None)
+        The exception every faulted lane would have raised on its own Computer.
+    elapsed : float
+        Wall time of the run in seconds.
+    """
+    def __init__(self, steps, ip, halted, errors, elapsed):
+        self.steps = steps
+        self.ip = ip
+        self.halted = halted
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def ips(self) -> float:
+        """
+        Executed instructions per second, summed over all lanes.
+        """
+        return self.steps.sum() / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return "Executed {} instructions over {} lanes in {:.6f} s ({:,.0f} instructions/sec)".format(
+            self.steps.sum(), len(self.steps), self.elapsed, self.ips)
+
+
+class BatchComputer(Component):
+    """
+    Runs one program over many independent machine states at once
+
+    ...
+    Parameters
+    ----------
+    lanes : int
+        Number of independent machine states.
+    mem_size : int
+        Size of the memory of every lane in bytes.
+    stack_size : int
+        Size of the stack of every lane in levels.
+
+    Attributes
+    ----------
+    lanes : int
+        Number of independent machine states.
+    mem : Memory
+        Holds the variable table and allocation shared by all lanes.
+    memory : ndarray(np.uint8)
+        Memory bytes of every lane, shape (lanes, mem_size).
+    buffer : ndarray(np.uint8)
+        Register file of every lane, shape (lanes, 32), laid out like RegisterFile.buffer.
+    reg : dict(name: ndarray)
+        Every register as a view with one value per lane into buffer.
+    stack : ndarray(np.uint8)
+        Stack bytes of every lane, shape (lanes, 4 * stack_size), addressed through esp.
+    flags : BatchFlags
+        The status and direction flags of every lane.
+    initialized : dict(name: ndarray(bool))
+        Whether or not a variable is initialized, per lane.
+    vt : dict(name: VarType)
+        The variable types of Computer.
+
+    Notes
+    -----
+    Every step executes the lowest instruction index any running lane is at,
+    as one vectorized operation over the lanes at that index. Lanes that took
+    different branches therefore wait for each other at the next common
+    instruction. A lane stops when it runs past the last instruction, reaches
+    max_steps or faults; a fault is recorded for the lane instead of raised.
+    Conditional jumps test the flags of every lane, so lanes branch apart
+    on the data they hold.
+
+    Instructions without a vectorized form, such as the string instructions,
+    whose element count differs per lane, are executed lane by lane by the
+    commands of the interpreter on a Computer the state of each lane is
+    copied into and back from.
+
+    Examples
+    --------
+    >>> batch = BatchComputer(3)
+    >>> program = batch.assemble('ADD eax, ebx')
+    >>> batch.reg['ebx'][:] = [1, 2, 3]
+    >>> result = batch.run(program)
+    >>> batch.reg['eax'].tolist()
+    [1, 2, 3]
+    """
+    def __init__(self, lanes, mem_size=1024, stack_size=1024):
+        super(BatchComputer, self).__init__('BatchComputer')
+        from main import Computer
+        self.vt = Computer.vt
+        self.lanes = lanes
+        self.mem = Memory(mem_size)
+        self.memory = np.zeros((lanes, mem_size), dtype=np.uint8)
+        self.buffer = np.zeros((lanes, 4 * len(RegisterFile.layout)), dtype=np.uint8)
+        self.reg = {}
+        for i, (extended, word, high, low) in enumerate(RegisterFile.layout):
+            self.reg[extended] = self.buffer[:, 4 * i:4 * i + 4].view('>u4')[:, 0]
+            self.reg[word] = self.buffer[:, 4 * i + 2:4 * i + 4].view('>u2')[:, 0]
+            if high is not None:
+                self.reg[high] = self.buffer[:, 4 * i + 2]
+                self.reg[low] = self.buffer[:, 4 * i + 3]
+        self.stack = np.zeros((lanes, 4 * stack_size), dtype=np.uint8)
+        self.reg['esp'][:] = self.stack.shape[1]
+        self.flags = BatchFlags(lanes)
+        self.initialized = {}
+        self._scratch = None
+        self._code = []
+        # Handlers return None when their lanes continue with the next
+        # instruction, anything else when they set the ip of their lanes
+        self._handlers = {
+            'MOV': self._mov,
+            'ADD': partial(self._arithmetic, ADD),
+            'SUB': partial(self._arithmetic, SUB),
+            'CMP': partial(self._arithmetic, SUB, store=False),
+            'INC': partial(self._step, INC),
+            'DEC': partial(self._step, DEC),
+            'JMP': self._jmp,
+            'LOOP': self._loop,
+            'PUSH': self._push,
+            'POP': self._pop,
+            'PUSHF': self._pushf,
+            'POPF': self._popf,
+            'CLD': self._cld,
+            'STD': self._std
+        }
+        self._handlers.update((name, partial(self._jcc, condition)) for name, condition in jumps.items())
+
+    def assemble(self, source):
+        from assembler import assemble
+        return assemble(source, types=self.vt)
+
+    def load(self, program):
+        """
+        Declare the .data variables of a program in every lane.
+        """
+        program.load(self)
+        for name, (offset, size, signed, init) in self.mem.variables.items():
+            size = self.mem.extent(name)
+            self.memory[:, offset:offset + size] = self.mem.memory[offset:offset + size]
+            self.initialized[name] = np.full((self.lanes,), init)
+
+    def variable(self, name, signed=None) -> np.ndarray:
+        """
+        View of a variable with one value per lane.
+
+        Parameters
+        ----------
+        name : str
+            Name of the variable.
+        signed : bool, optional
+            Interpret the bytes as signed, defaults to the signedness of the variable.
+        """
+        try:
+            offset, size, var_signed, init = self.mem.variables[name]
+        except KeyError:
+            raise VariableNotDefined('Variable {0} has not been defined'.format(name))
+        if signed is None:
+            signed = var_signed
+        dtype = descriptors[size, bool(signed)].dtype
+        return self.memory[:, offset:offset + size].view(dtype)[:, 0]
+
+    def set(self, name, values):
+        """
+        Assign one value per lane to a variable, marking it initialized.
+        """
+        view = self.variable(name, signed=False)
+        view[:] = split_many(np.broadcast_to(values, view.shape), view.itemsize).view(view.dtype)[:, 0]
+        self.initialized[name][:] = True
+
+    def computer(self, lane: int):
+        """
+        Build a Computer holding the state of one lane.
+        """
+        from main import Computer
+        comp = Computer(self.memory.shape[1], self.stack.shape[1] // 4, stack_mode='typed')
+        comp.mem.allocator.load(self.mem.allocator.dump())
+        comp.mem.arrays = dict(self.mem.arrays)
+        self._load_lane(comp, lane)
+        comp.mem.pages.touch_all()
+        comp.stack.pages.touch_all()
+        return comp
+
+    def _load_lane(self, comp, lane):
+        """
+        Copy the registers, memory, variable table, stack and flags of a lane into a Computer.
+        """
+        comp.reg.restore(self.buffer[lane])
+        comp.mem.memory[:] = self.memory[lane]
+        comp.mem.variables = {name: (offset, size, signed, bool(self.initialized[name][lane]))
+                              for name, (offset, size, signed, init) in self.mem.variables.items()}
+        comp.mem.version += 1
+        comp.stack.stack[:] = self.stack[lane]
+        comp.flags.last = self.flags.record(lane)
+        comp.flags.df = bool(self.flags.df[lane])
+
+    def _store_lane(self, comp, lane):
+        """
+        Copy the state of a Computer back into a lane, see _load_lane().
+        """
+        self.buffer[lane] = comp.reg.buffer
+        self.memory[lane] = comp.mem.memory
+        for name, (offset, size, signed, init) in comp.mem.variables.items():
+            self.initialized[name][lane] = init
+        self.stack[lane] = comp.stack.stack
+        self.flags.store(lane, comp.flags.last)
+        self.flags.df[lane] = comp.flags.df
+
+    def _prepare(self, program) -> list:
+        """
+        Bind a program to the Computer interpreted instructions run on and pick the handler of every instruction.
+
+        Binding raises the errors Computer.run would for the whole program,
+        such as VariableNotDefined for a memory operand of an undeclared variable.
+        """
+        if self._scratch is None:
+            from main import Computer
+            self._scratch = Computer(self.memory.shape[1], self.stack.shape[1] // 4, stack_mode='typed')
+        comp = self._scratch
+        comp.mem.variables = dict(self.mem.variables)
+        comp.mem.arrays = dict(self.mem.arrays)
+        comp.mem.version += 1
+        self._code = comp.cpu.bind(program, comp)
+
+        handlers = []
+        for index, operands in enumerate(program.operands):
+            name = program.mnemonic(index)
+            kinds = [kind for kind, payload in operands]
+            if name not in self._handlers:
+                vectorized = False
+            elif name in _destinations:
+                vectorized = kinds[0] in (REG, VAR, MEM)
+            elif comp.cpu.commands[name].jumps:
+                vectorized = kinds == [LABEL]
+            else:
+                vectorized = True
+            handlers.append(self._handlers[name] if vectorized else partial(self._interpret, index))
+        return handlers
+
+    def run(self, program, max_steps=None, load=True):
+        """
+        Execute a program on every lane.
+
+        Parameters
+        ----------
+        program : Program or str
+            Assembled program, or source to assemble.
+        max_steps : int, optional
+            Stop every lane after executing this many instructions.
+        load : bool, optional
+            Whether or not to (re)initialize the .data variables of the program first.
+
+        Returns
+        -------
+        BatchResult
+            Steps, final instruction index and errors of every lane.
+        """
+        if isinstance(program, str):
+            program = self.assemble(program)
+        if load:
+            self.load(program)
+
+        handlers = self._prepare(program)
+        end = len(program)
+        limit = sys.maxsize if max_steps is None else max_steps
+        self._ip = ip = np.zeros((self.lanes,), dtype=np.int64)
+        self._steps = steps = np.zeros((self.lanes,), dtype=np.int64)
+        self._faulted = np.zeros((self.lanes,), dtype=bool)
+        self._errors = [None] * self.lanes
+
+        begin = perf_counter()
+        while True:
+            running = (ip < end) & (steps < limit) & ~self._faulted
+            if not running.any():
+                break
+            current = ip[running].min()
+            mask = running & (ip == current)
+            target = handlers[current](mask, *program.operands[current])
+            mask &= ~self._faulted
+            if target is None:
+                ip[mask] += 1
+            steps[mask] += 1
+        elapsed = perf_counter() - begin
+        return BatchResult(steps, ip, ip >= end, self._errors, elapsed)
+
+    def _fault(self, mask, failing, error):
+        """
+        Stop the lanes of mask that are in failing with an error.
+
+        Returns
+        -------
+        ndarray(bool)
+            The lanes of mask that can continue.
+        """
+        failing = mask & failing
+        for lane in np.flatnonzero(failing):
+            self._errors[lane] = error
+        self._faulted |= failing
+        return mask & ~failing
+
+    def _read(self, mask, operand):
+        """
+        Returns
+        -------
+        values : ndarray or int
+            The value of the operand in every lane, in the numpy type the interpreter
+            reads it as, or the constant itself.
+        size : int or None
+            Size of the operand in bytes, None for constants.
+        mask : ndarray(bool)
+            The lanes of mask that did not fault reading the operand.
+        """
+        kind, payload = operand
+        if kind == REG:
+            values = self.reg[payload]
+            return values.astype(values.dtype.newbyteorder('=')), values.itemsize, mask
+        if kind == VAR:
+            mask = self._fault(mask, ~self.initialized[payload], VariableNotInitialized(
+                'Variable {0} has not been initialized'.format(payload)))
+            values = self.variable(payload)
+            return values.astype(values.dtype.newbyteorder('=')), values.itemsize, mask
+        if kind == MEM:
+            size, signed = payload[5:]
+            address, mask = self._address(mask, payload)
+            lanes = np.flatnonzero(mask)
+            dtype = descriptors[size, bool(signed)].dtype
+            values = np.zeros((self.lanes,), dtype=dtype.newbyteorder('='))
+            values[lanes] = self.memory[lanes[:, None], address[lanes, None] + np.arange(size)].view(dtype)[:, 0]
+            return values, size, mask
+        if kind == OFFSET:
+            return self.mem.variables[payload][0], None, mask
+        return payload, None, mask
+
+    def _address(self, mask, payload):
+        """
+        The effective address of a memory operand in every lane, see Address.address().
+
+        Returns
+        -------
+        address : ndarray(np.int64)
+            The address of the operand in every lane.
+        mask : ndarray(bool)
+            The lanes of mask the operand lies inside memory in, the others fault with InvalidAddress.
+        """
+        base, index, scale, disp, variable, size, signed = payload
+        if variable is not None:
+            disp += self.mem.variables[variable][0]
+        address = np.full((self.lanes,), disp, dtype=np.int64)
+        if base is not None:
+            address += self.reg[base]
+        if index is not None:
+            address += self.reg[index].astype(np.int64) * scale
+        address &= 0xFFFFFFFF
+        failing = mask & (address + size > self.memory.shape[1])
+        for lane in np.flatnonzero(failing):
+            self._errors[lane] = InvalidAddress('Bytes {0} to {1} are outside of memory of size {2}'.format(
+                address[lane], address[lane] + size, self.memory.shape[1]))
+        self._faulted |= failing
+        return address, mask & ~failing
+
+    def _write(self, mask, operand, values):
+        """
+        Store values, already wrapped to the operand size, in the lanes of mask.
+
+        Variables written to, or overlapping the bytes written through a memory operand, become initialized.
+        """
+        kind, payload = operand
+        if kind == MEM:
+            size = payload[5]
+            address, mask = self._address(mask, payload)
+            lanes = np.flatnonzero(mask)
+            data = np.broadcast_to(values, (self.lanes,))[lanes].astype(descriptors[size, False].dtype)
+            self.memory[lanes[:, None], address[lanes, None] + np.arange(size)] = data.view(np.uint8).reshape(-1, size)
+            for name, (offset, var_size, signed, init) in self.mem.variables.items():
+                stop = offset + self.mem.extent(name)
+                self.initialized[name][lanes] |= (address[lanes] < stop) & (offset < address[lanes] + size)
+            return
+        if kind == REG:
+            view = self.reg[payload]
+        else:
+            view = self.variable(payload, signed=False)
+            self.initialized[payload] |= mask
+        view[mask] = np.broadcast_to(values, view.shape)[mask].astype(view.dtype, copy=False)
+
+    def _destination_type(self, operand):
+        kind, payload = operand
+        if kind == REG:
+            return descriptors[self.reg[payload].itemsize, False].type
+        if kind == MEM:
+            return descriptors[payload[5], bool(payload[6])].type
+        offset, size, signed, init = self.mem.variables[payload]
+        return descriptors[size, bool(signed)].type
+
+    def _interpret(self, index, mask, *operands):
+        """
+        Execute an instruction in every lane of mask in turn, by the command of the interpreter.
+        """
+        comp = self._scratch
+        code = self._code[index]
+        for lane in np.flatnonzero(mask):
+            self._load_lane(comp, lane)
+            try:
+                target = code()
+            except Exception as error:
+                self._errors[lane] = error
+                self._faulted[lane] = True
+            else:
+                self._ip[lane] = index + 1 if target is None else target
+            self._store_lane(comp, lane)
+        return True
+
+    def _convert(self, mask, destination, values, size):
+        """
+        Convert source values the way assigning them to a destination does.
+
+        Returns
+        -------
+        values : ndarray
+            The values wrapped to the unsigned type of the destination.
+        mask : ndarray(bool)
+            The lanes of mask that did not fault.
+        """
+        _type = self._destination_type(destination)
+        bits = np.dtype(_type).itemsize * 8
+        unsigned = descriptors[bits // 8, False].type
+        if size is None:
+            if destination[0] == REG:
+                valid = -(1 << (bits - 1)) <= values <= (1 << bits) - 1
+                error = ValueError('{0} is too big for size {1}'.format(values, bits // 8))
+            else:
+                valid = np.iinfo(_type).min <= values <= np.iinfo(_type).max
+                error = OverflowError('Python integer {0} out of bounds for {1}'.format(
+                    values, np.dtype(_type).name))
+            if not valid:
+                return values, self._fault(mask, mask, error)
+            return unsigned(values & ((1 << bits) - 1)), mask
+
+        if destination[0] == REG and size > bits // 8:
+            failing = values > (1 << bits) - 1
+            if values.dtype.kind == 'i':
+                failing |= values < -(1 << (bits - 1))
+            for lane in np.flatnonzero(mask & failing):
+                self._errors[lane] = ValueError('{0} is too big for size {1}'.format(values[lane], bits // 8))
+            self._faulted |= mask & failing
+            mask = mask & ~failing
+        return values.astype(unsigned), mask
+
+    def _mov(self, mask, destination, source):
+        values, size, mask = self._read(mask, source)
+        values, mask = self._convert(mask, destination, values, size)
+        self._write(mask, destination, values)
+
+    def _arithmetic(self, operation, mask, destination, source, store=True):
+        """
+        ADD and SUB, and CMP which does not store the difference.
+        """
+        current, destination_size, mask = self._read(mask, destination)
+        operand, size, mask = self._read(mask, source)
+        if size is None:
+            _type = self._destination_type(destination)
+            if not np.iinfo(_type).min <= operand <= np.iinfo(_type).max:
+                self._fault(mask, mask, OverflowError('Python integer {0} out of bounds for {1}'.format(
+                    operand, np.dtype(_type).name)))
+                return
+        elif destination_size < size:
+            self._fault(mask, mask, IncompatibleVariableSizes())
+            return
+        unsigned = descriptors[destination_size, False].type
+        if size is None:
+            values = unsigned(operand & ((1 << destination_size * 8) - 1))
+        else:
+            values = operand.astype(unsigned)
+        self.flags.set(mask, operation, current, operand, destination_size * 8)
+        if store:
+            if operation == ADD:
+                self._write(mask, destination, current.astype(unsigned) + values)
+            else:
+                self._write(mask, destination, current.astype(unsigned) - values)
+
+    def _step(self, operation, mask, destination):
+        """
+        INC and DEC, which keep the carry flag.
+        """
+        current, size, mask = self._read(mask, destination)
+        unsigned = descriptors[size, False].type
+        self.flags.set(mask, operation, current, 1, size * 8)
+        if operation == INC:
+            self._write(mask, destination, current.astype(unsigned) + unsigned(1))
+        else:
+            self._write(mask, destination, current.astype(unsigned) - unsigned(1))
+
+    def _jmp(self, mask, target):
+        target = target[1]
+        self._ip[mask] = target
+        return target
+
+    def _jcc(self, condition, mask, target):
+        target = target[1]
+        taken = self.flags.test(condition)
+        self._ip[mask & taken] = target
+        self._ip[mask & ~taken] += 1
+        return target
+
+    def _loop(self, mask, target):
+        target = target[1]
+        ecx = self.reg['ecx']
+        ecx[mask] -= 1
+        taken = ecx != 0
+        self._ip[mask & taken] = target
+        self._ip[mask & ~taken] += 1
+        return target
+
+    def _push(self, mask, source):
+        values, size, mask = self._read(mask, source)
+        esp = self.reg['esp'].astype(np.int64) - 4
+        mask = self._fault(mask, esp < 0, StackFull())
+        if size is None:
+            if not -(1 << 31) <= values <= (1 << 32) - 1:
+                self._fault(mask, mask, ValueError('{0} is too big for size 4'.format(values)))
+                return
+            values = np.full((self.lanes,), values & 0xFFFFFFFF, dtype=np.uint32)
+        elif size > 4:
+            failing = (values > (1 << 32) - 1) | (values.astype(np.int64) < -(1 << 31))
+            mask = self._fault(mask, failing, ValueError('Value is too big for size 4'))
+        self._push_values(mask, esp, values)
+
+    def _push_values(self, mask, esp, values):
+        """
+        Store values below the stack pointer of the lanes of mask, esp already lowered.
+        """
+        lanes = np.flatnonzero(mask)
+        columns = esp[lanes, None] + np.arange(4)
+        self.stack[lanes[:, None], columns] = split_many(values[lanes].astype(np.int64) & 0xFFFFFFFF, 4)
+        self.reg['esp'][mask] = esp[mask]
+
+    def _pop_values(self, mask):
+        """
+        Returns
+        -------
+        values : ndarray(np.uint32)
+            The value on top of the stack of every lane of mask.
+        mask : ndarray(bool)
+            The lanes of mask whose stack was not empty.
+        """
+        esp = self.reg['esp'].astype(np.int64)
+        mask = self._fault(mask, esp + 4 > self.stack.shape[1], NoMoreObjectsInStack())
+        lanes = np.flatnonzero(mask)
+        columns = esp[lanes, None] + np.arange(4)
+        values = np.zeros((self.lanes,), dtype=np.uint32)
+        values[lanes] = combine_many(self.stack[lanes[:, None], columns], 4)
+        self.reg['esp'][mask] = esp[mask] + 4
+        return values, mask
+
+    def _pop(self, mask, destination):
+        values, mask = self._pop_values(mask)
+        values, mask = self._convert(mask, destination, values, 4)
+        self._write(mask, destination, values)
+
+    def _pushf(self, mask):
+        esp = self.reg['esp'].astype(np.int64) - 4
+        mask = self._fault(mask, esp < 0, StackFull())
+        self._push_values(mask, esp, self.flags.value)
+
+    def _popf(self, mask):
+        values, mask = self._pop_values(mask)
+        self.flags.set_value(mask, values)
+
+    def _cld(self, mask):
+        self.flags.df[mask] = False
+
+    def _std(self, mask):
+        self.flags.df[mask] = True
+
+
+if __name__ == "__main__":
+    batch = BatchComputer(4)
+    program = batch.assemble('''
+    .data
+    total DWORD 0
+    .code
+    top:
+        ADD total, ecx
+        LOOP top
+    ''')
+    batch.reg['ecx'][:] = [1, 10, 100, 1000]
+    print(batch.run(program))
+    print(batch.variable('total'))
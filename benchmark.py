@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+from timeit import Timer
+from utils import *
+
+
+def legacy_split_number(number, size: int) -> list:
+    """
+    Reference string based implementation of split_number().
+    """
+    try:
+        if abs(number) > max_value[size]:
+            raise ValueError('{0} is too big for size {1}'.format(number, size))
+    except KeyError:
+        raise InvalidSize(size)
+
+    binary = np.binary_repr(number, width=(size * 8))[:size * 8]
+    binary = [binary[curr * 8:(curr + 1) * 8] for curr in range(size)]
+    return [eval('0b{0}'.format(num)) for num in binary]
+
+
+def legacy_combine_number(memory_seg, signed: bool=False) -> np.generic:
+    """
+    Reference string based implementation of combine_number().
+    """
+    binary = [np.binary_repr(number, width=8) for number in memory_seg]
+    binary = ''.join(binary)
+    size = len(memory_seg)
+    return variable_det_to_type(size, signed)(eval('0b{}'.format(binary)))
+
+
+def measure(function, number: int=10000, repeat: int=3) -> float:
+    """
+    Measure the throughput of a function.
+
+    Parameters
+    ----------
+    function : callable
+        Function taking no arguments to measure.
+    number : int, optional
+        Number of calls per timing run.
+    repeat : int, optional
+        Number of timing runs, the fastest one is kept.
+
+    Returns
+    -------
+    float
+        Calls per second.
+
+    """
+    best = min(Timer(function).repeat(repeat=repeat, number=number))
+    return number / best
+
+
+def memory_profile(function, number: int=1000) -> dict:
+    """
+    Measure the memory use of a function with tracemalloc.
+
+    Parameters
+    ----------
+    function : callable
+        Function taking no arguments to measure.
+    number : int, optional
+        Number of calls to average the allocations over.
+
+    Returns
+    -------
+    dict
+        'allocations': memory blocks allocated and still alive after a call, on average,
+        'allocated_bytes': their size in bytes, and 'peak_bytes': the largest amount
+        of memory a single call had allocated at once.
+    """
+    function()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        function()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+
+        before = tracemalloc.take_snapshot()
+        for _ in range(number):
+            function()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+    return {'allocations': max(0, sum(stat.count_diff for stat in stats)) / number,
+            'allocated_bytes': max(0, sum(stat.size_diff for stat in stats)) / number,
+            'peak_bytes': max(0, peak)}
+
+
+def profile(function, number: int=10000, repeat: int=3) -> dict:
+    """
+    Measure the throughput and memory use of a function.
+
+    Returns
+    -------
+    dict
+        'ops_per_sec' from measure() and the entries of memory_profile().
+    """
+    result = {'ops_per_sec': measure(function, number, repeat)}
+    result.update(memory_profile(function, max(1, number // 10)))
+    return result
+
+
+def bench_codec(number: int=10000) -> dict:
+    """
+    Compare the byte codec against the string based reference implementation.
+
+    Returns
+    -------
+    dict(name: float)
+        Operations per second of every measured function. The batch
+        entries count every converted value as one operation.
+
+    """
+    values = np.arange(-500, 500, dtype=np.int64)
+    memory_seg = np.array([0, 1, 2, 3], dtype=np.uint8)
+    batch = split_many(values, 4)
+    results = {
+        'legacy_split_number': measure(lambda: legacy_split_number(-12345, 4), number),
+        'split_number': measure(lambda: split_number(-12345, 4), number),
+        'legacy_combine_number': measure(lambda: legacy_combine_number(memory_seg), number),
+        'combine_number': measure(lambda: combine_number(memory_seg), number),
+        'split_many': measure(lambda: split_many(values, 4), number // 100) * len(values),
+        'combine_many': measure(lambda: combine_many(batch, 4, True), number // 100) * len(values)
+    }
+    return results
+
+
+def bench_dispatch(number: int=10000) -> dict:
+    """
+    Compare the fast operator dispatch against multipledispatch.
+
+    Returns
+    -------
+    dict(name: float)
+        Operations per second of every operator under both dispatch modes.
+
+    """
+    from register import RegisterFile
+    from memory import Memory
+
+    reg = RegisterFile()
+    eax, ebx = reg['eax'], reg['ebx']
+    mem = Memory(64)
+    mem['x'] = 1
+    cases = {
+        'add_int': lambda: eax + 1,
+        'iadd_int': lambda: eax.__iadd__(1),
+        'add_register': lambda: eax + ebx,
+        'iadd_register': lambda: eax.__iadd__(ebx),
+        'memory_setitem': lambda: mem.__setitem__('x', 5)
+    }
+
+    results = {}
+    try:
+        for mode in ('multipledispatch', 'fast'):
+            set_dispatch(mode)
+            for name, case in cases.items():
+                eax(0)
+                results['{0}_{1}'.format(mode, name)] = measure(case, number)
+    finally:
+        set_dispatch('fast')
+    return results
+
+
+jit_program = '''
+.data
+total DWORD 0
+.code
+    MOV ecx, {0}
+top:
+    ADD eax, 3
+    ADD ebx, eax
+    MOV edx, ebx
+    ADD dl, al
+    ADD total, edx
+    LOOP top
+'''
+
+
+def bench_jit(iterations: int=2000) -> dict:
+    """
+    Compare the interpreter against the basic-block compiler on an arithmetic loop.
+
+    Returns
+    -------
+    dict(name: float)
+        Instructions per second with and without the compiler.
+
+    """
+    from main import Computer
+
+    results = {}
+    for jit in (False, True):
+        comp = Computer()
+        program = comp.assemble(jit_program.format(iterations))
+        comp.run(program, jit=jit)
+        results['jit' if jit else 'interpreter'] = max(comp.run(program, jit=jit).ips for _ in range(3))
+    return results
+
+
+def suite_codec(number: int=10000) -> dict:
+    """
+    Byte codec of split_number and combine_number.
+    """
+    values = np.arange(-500, 500, dtype=np.int64)
+    memory_seg = np.array([0, 1, 2, 3], dtype=np.uint8)
+    return {
+        'split_number': profile(lambda: split_number(-12345, 4), number),
+        'combine_number': profile(lambda: combine_number(memory_seg), number),
+        'combine_number_signed': profile(lambda: combine_number(memory_seg, True), number),
+        'split_many_1000': profile(lambda: split_many(values, 4), number // 100),
+    }
+
+
+def suite_register(number: int=10000) -> dict:
+    """
+    Register.value get and set, on 32-bit registers and sub-registers.
+    """
+    from register import RegisterFile
+
+    reg = RegisterFile()
+    eax, ax, ah, al = reg['eax'], reg['ax'], reg['ah'], reg['al']
+    eax.value = 0x12345678
+
+    def set_eax():
+        eax.value = 0x12345678
+
+    def set_ax():
+        ax.value = 0x1234
+
+    def set_al():
+        al.value = 0x12
+
+    return {
+        'get_eax': profile(lambda: eax.value, number),
+        'get_ax': profile(lambda: ax.value, number),
+        'get_ah': profile(lambda: ah.value, number),
+        'set_eax': profile(set_eax, number),
+        'set_ax': profile(set_ax, number),
+        'set_al': profile(set_al, number),
+    }
+
+
+def suite_active(number: int=10000) -> dict:
+    """
+    Active operators on registers, constants and variable references.
+    """
+    from register import RegisterFile
+    from memory import Memory
+
+    reg = RegisterFile()
+    eax, ebx = reg['eax'], reg['ebx']
+    mem = Memory(64)
+    mem.set('x', 1, 4)
+    x = mem.reference('x')
+    return {
+        'add_int': profile(lambda: eax + 1, number),
+        'add_register': profile(lambda: eax + ebx, number),
+        'iadd_int': profile(lambda: eax.__iadd__(1), number),
+        'iadd_register': profile(lambda: eax.__iadd__(ebx), number),
+        'iadd_reference': profile(lambda: x.__iadd__(1), number),
+        'sub_register': profile(lambda: eax - ebx, number),
+    }
+
+
+def suite_memory(number: int=10000) -> dict:
+    """
+    Memory.set, Memory.get, reads and writes through handles, loads and stores by address
+    and creating and deleting variables.
+    """
+    from memory import Memory
+
+    mem = Memory(1024)
+    mem.set('x', 1, 4)
+
+    def set_new_dell():
+        mem.set('y', 5, 4)
+        mem.dell('y')
+
+    handle = mem.handle('x')
+
+    def handle_set():
+        handle.value = 7
+
+    return {
+        'set': profile(lambda: mem.set('x', 7), number),
+        'get': profile(lambda: mem.get('x'), number),
+        'read': profile(lambda: mem.read('x'), number),
+        'handle_set': profile(handle_set, number),
+        'load': profile(lambda: mem.load(0, 4), number),
+        'store': profile(lambda: mem.store(0, 4, 7), number),
+        'load_unaligned': profile(lambda: mem.load(1, 2), number),
+        'set_new_dell': profile(set_new_dell, number),
+    }
+
+
+def suite_stack(number: int=10000) -> dict:
+    """
+    A push followed by a pop on both stack implementations.
+    """
+    from stack import Stack, ByteStack
+
+    stack = Stack(1024)
+    byte_stack = ByteStack(1024)
+
+    def push_pop(stack):
+        stack.push(7)
+        stack.pop()
+
+    return {
+        'object_push_pop': profile(lambda: push_pop(stack), number),
+        'byte_push_pop': profile(lambda: push_pop(byte_stack), number),
+    }
+
+
+def suite_program(iterations: int=2000) -> dict:
+    """
+    Whole-program throughput of a Computer, ops_per_sec counts executed instructions.
+    """
+    from main import Computer
+
+    results = {}
+    for jit in (False, True):
+        comp = Computer()
+        program = comp.assemble(jit_program.format(iterations))
+
+        def run():
+            return comp.run(program, jit=jit)
+
+        result = {'ops_per_sec': max(run().ips for _ in range(3))}
+        result.update(memory_profile(run, 3))
+        results['jit' if jit else 'interpreter'] = result
+    return results
+
+
+# Run in a fresh interpreter by suite_startup, prints the import time and memory of a module
+import_script = '''
+import sys, json, tracemalloc
+from time import perf_counter
+if sys.argv[2] == 'memory':
+    tracemalloc.start()
+begin = perf_counter()
+__import__(sys.argv[1])
+seconds = perf_counter() - begin
+current, peak = tracemalloc.get_traced_memory()
+print(json.dumps({'seconds': seconds, 'allocated_bytes': current, 'peak_bytes': peak,
+                  'allocations': len(tracemalloc.take_snapshot().traces) if tracemalloc.is_tracing() else 0}))
+'''
+
+
+def measure_import(module: str, repeat: int=5) -> dict:
+    """
+    Measure importing a module in fresh interpreters.
+
+    Returns
+    -------
+    dict
+        'ops_per_sec', imports per second of the fastest of repeat imports,
+        and the entries of memory_profile() for one import.
+    """
+    def run(mode):
+        output = subprocess.run([sys.executable, '-c', import_script, module, mode], capture_output=True,
+                                text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return json.loads(output.stdout)
+
+    result = {'ops_per_sec': 1 / min(run('time')['seconds'] for _ in range(repeat))}
+    memory = run('memory')
+    del memory['seconds']
+    result.update(memory)
+    return result
+
+
+def suite_startup(number: int=10000) -> dict:
+    """
+    Import time of the package and construction of a Computer, what short runs and farm workers pay first.
+    """
+    from main import Computer
+
+    repeat = max(1, number // 2000)
+    return {
+        'import_numpy': measure_import('numpy', repeat),
+        'import_main': measure_import('main', repeat),
+        'construct_computer': profile(Computer, max(1, number // 10)),
+    }
+
+
+# Every benchmark group of the suite
+suites = {
+    'codec': suite_codec,
+    'register': suite_register,
+    'active': suite_active,
+    'memory': suite_memory,
+    'stack': suite_stack,
+    'program': suite_program,
+    'startup': suite_startup
+}
+
+
+def environment() -> dict:
+    """
+    Describe the machine and source tree the benchmarks ran on.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'commit': commit,
+            'time': datetime.now(timezone.utc).isoformat()}
+
+
+def run_suite(groups=None, scale: float=1.0) -> dict:
+    """
+    Run benchmark groups.
+
+    Parameters
+    ----------
+    groups : list(str), optional
+        Names of the groups in suites to run, all of them by default.
+    scale : float, optional
+        Multiplies the number of calls of every benchmark.
+
+    Returns
+    -------
+    dict
+        {'environment': environment(), 'results': {group: {benchmark: profile()}}}
+    """
+    if groups is None:
+        groups = list(suites)
+    results = {}
+    for group in groups:
+        if group == 'program':
+            results[group] = suites[group](max(1, int(2000 * scale)))
+        else:
+            results[group] = suites[group](max(100, int(10000 * scale)))
+    return {'environment': environment(), 'results': results}
+
+
+def print_comparisons(codec: dict, dispatch: dict, jit: dict):
+    for name, ops in codec.items():
+        print('{0:<24}{1:>16,.0f} ops/sec'.format(name, ops))
+    print('split speedup:   {0:.1f}x'.format(codec['split_number'] / codec['legacy_split_number']))
+    print('combine speedup: {0:.1f}x'.format(codec['combine_number'] / codec['legacy_combine_number']))
+
+    for name, ops in dispatch.items():
+        print('{0:<32}{1:>16,.0f} ops/sec'.format(name, ops))
+
+    for name, ips in jit.items():
+        print('{0:<24}{1:>16,.0f} instructions/sec'.format(name, ips))
+    print('jit speedup:     {0:.1f}x'.format(jit['jit'] / jit['interpreter']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of the emulator.')
+    parser.add_argument('groups', nargs='*', metavar='group',
+                        help='Benchmark groups to run, all of them by default: {0}.'.format(', '.join(suites)))
+    parser.add_argument('--json', metavar='PATH', help="Write the results as JSON to PATH, '-' for stdout.")
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply the number of calls of every benchmark.')
+    parser.add_argument('--compare', action='store_true',
+                        help='Also compare against the legacy codec, multipledispatch and the interpreter.')
+    args = parser.parse_args(argv)
+    for group in args.groups:
+        if group not in suites:
+            parser.error('unknown benchmark group {0}'.format(group))
+
+    report = run_suite(args.groups or None, args.scale)
+    if args.compare:
+        report['comparisons'] = {'codec': bench_codec(), 'dispatch': bench_dispatch(), 'jit': bench_jit()}
+
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return report
+    for group, results in report['results'].items():
+        print(group)
+        for name, result in results.items():
+            print('  {0:<24}{1:>16,.0f} ops/sec {2:>8.2f} allocs {3:>10,.0f} B peak'.format(
+                name, result['ops_per_sec'], result['allocations'], result['peak_bytes']))
+    if args.compare:
+        print_comparisons(**report['comparisons'])
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(report, output, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
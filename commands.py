@@ -1,19 +1,130 @@
 #!/usr/bin/env python3
+from functools import partial
 from utils import *
 from register import Register
-from memory import Memory, Variable
+from memory import Memory, Variable, Reference, Address
+from flags import conditions, jumps
 
 class Command():
+    # Whether or not the command may transfer control to another instruction
+    jumps = False
+    # How the command accesses each of its operands, 'r', 'w' or 'rw'
+    modes = ()
 
     def __init__(self, name, help=''):
         self.name = name
         self.help = help
 
     def __call__(self, *args, **xargs):
-        self.__run__(*args, **xargs)
+        return self.__run__(*args, **xargs)
 
     def __run__(self, *args, **xargs):
-    	pass
+        """
+        Execute the command.
+
+        Returns
+        -------
+        int or None
+            Index of the next instruction for commands that jump,
+            None to continue with the following instruction.
+        """
+        pass
+
+    def bind(self, computer, *operands):
+        """
+        Pre-bind the command to its resolved operands.
+
+        Commands that use registers or other parts of the computer
+        implicitly override this to bind them as well.
+
+        Returns
+        -------
+        callable
+            Executes the instruction when called without arguments.
+        """
+        return partial(self.__run__, *operands)
+
+    def footprint(self, computer, *operands) -> tuple:
+        """
+        Bytes of memory and registers one execution of the command touches.
+
+        Commands that use registers or the stack implicitly override this
+        to count them as well.
+
+        Returns
+        -------
+        memory : int
+            Bytes of memory and stack.
+        registers : int
+            Bytes of registers.
+        """
+        memory = registers = 0
+        for operand in operands:
+            if isinstance(operand, Register):
+                registers += operand.size
+            elif isinstance(operand, Active):
+                memory += operand.size
+        return memory, registers
+
+    def accesses(self, computer, registers, *operands) -> list:
+        """
+        Bytes of memory and registers one execution of the command accessed.
+
+        Called after the execution, for the watches of a Debugger. Commands
+        that use registers implicitly override this to report them as well.
+
+        Parameters
+        ----------
+        computer : Computer
+            The computer the command ran on.
+        registers : ndarray
+            Copy of the register buffer from before the execution.
+
+        Returns
+        -------
+        list(tuple(space, start, stop, access))
+            'memory' or 'register', the range of bytes of the memory or the
+            register buffer and 'r' or 'w', the reads first.
+        """
+        accesses = []
+        for operand, mode in zip(operands, self.modes):
+            accesses += operand_accesses(operand, mode, registers)
+        return ordered(accesses)
+
+
+def operand_accesses(operand, mode, registers=None) -> list:
+    """
+    Accesses of an operand for Command.accesses, with the registers an address is computed from.
+    """
+    if isinstance(operand, Register):
+        span = operand._range
+        return [('register', span.start, span.stop, access) for access in mode]
+    if isinstance(operand, Address):
+        accesses = [('register', register._range.start, register._range.stop, 'r')
+                    for register in operand.registers if register is not None]
+        start = operand.address(registers)
+        return accesses + [('memory', start, start + operand.size, access) for access in mode]
+    if isinstance(operand, Reference):
+        start = operand.memory.variables[operand.name][0]
+        return [('memory', start, start + operand.size, access) for access in mode]
+    return []
+
+
+def stack_accesses(computer) -> list:
+    """
+    Accesses of esp by a push or a pop, when the stack is addressed through it.
+    """
+    pointer = computer.stack.pointer
+    if isinstance(pointer, Register) and pointer._value is computer.reg.buffer:
+        return operand_accesses(pointer, 'rw')
+    return []
+
+
+def ordered(accesses) -> list:
+    """
+    Accesses with the reads before the writes, as an instruction reads its operands before writing its result.
+    """
+    return sorted(accesses, key=lambda access: access[3] == 'w')
 
 
 def runc(command, *args, **xargs):
@@ -21,23 +132,541 @@ def runc(command, *args, **xargs):
 
 
 class ADD(Command):
+    modes = ('rw', 'r')
 
     def __init__(self):
         super(ADD, self).__init__('ADD', 'INSERT HELP')
 
-    def __run__(self, destination, source):
+    def bind(self, computer, destination, source):
+        return partial(self.__run__, destination, source, computer.flags)
+
+    def __run__(self, destination, source, flags=None):
+        before = destination.value
+        operand = source.value if isinstance(source, Active) else source
         destination += source
+        if flags is not None:
+            flags.last = ('add', before, operand, destination.size * 8, None)
+
+
+class SUB(Command):
+    modes = ('rw', 'r')
+
+    def __init__(self):
+        super(SUB, self).__init__('SUB', 'INSERT HELP')
+
+    def bind(self, computer, destination, source):
+        return partial(self.__run__, destination, source, computer.flags)
+
+    def __run__(self, destination, source, flags=None):
+        before = destination.value
+        operand = source.value if isinstance(source, Active) else source
+        destination -= source
+        if flags is not None:
+            flags.last = ('sub', before, operand, destination.size * 8, None)
+
+
+class CMP(Command):
+    modes = ('r', 'r')
+
+    def __init__(self):
+        super(CMP, self).__init__('CMP', 'INSERT HELP')
+
+    def bind(self, computer, destination, source):
+        return partial(self.__run__, destination, source, computer.flags)
+
+    def __run__(self, destination, source, flags=None):
+        operand = source.value if isinstance(source, Active) else source
+        # Subtracting checks the operands like SUB does, the difference is dropped
+        destination - source
+        if flags is not None:
+            flags.last = ('sub', destination.value, operand, destination.size * 8, None)
+
+
+class INC(Command):
+    modes = ('rw',)
+
+    def __init__(self):
+        super(INC, self).__init__('INC', 'INSERT HELP')
+
+    def bind(self, computer, destination):
+        return partial(self.__run__, destination, computer.flags)
+
+    def __run__(self, destination, flags=None):
+        before = destination.value
+        destination += 1
+        if flags is not None:
+            flags.last = ('inc', before, 1, destination.size * 8, flags.last[4] or flags.last)
+
+
+class DEC(Command):
+    modes = ('rw',)
+
+    def __init__(self):
+        super(DEC, self).__init__('DEC', 'INSERT HELP')
+
+    def bind(self, computer, destination):
+        return partial(self.__run__, destination, computer.flags)
+
+    def __run__(self, destination, flags=None):
+        before = destination.value
+        destination -= 1
+        if flags is not None:
+            flags.last = ('dec', before, 1, destination.size * 8, flags.last[4] or flags.last)
 
 
 class MOV(Command):
+    modes = ('w', 'r')
 
     def __init__(self):
         super(MOV, self).__init__('MOV', 'INSERT HELP')
 
     def __run__(self, destination, source):
+        if isinstance(source, Active):
+            source = source.value
         destination.value = source
 
 
+class JMP(Command):
+    jumps = True
+
+    def __init__(self):
+        super(JMP, self).__init__('JMP', 'INSERT HELP')
+
+    def __run__(self, target):
+        return target
+
+
+class Jcc(Command):
+    """
+    Conditional jump, taken when a condition code such as 'E' or 'GE' holds on the flags
+    """
+    jumps = True
+
+    def __init__(self, name, condition):
+        super(Jcc, self).__init__(name, 'INSERT HELP')
+        self.condition = condition
+
+    def bind(self, computer, target):
+        return partial(self.__run__, target, computer.flags)
+
+    def __run__(self, target, flags):
+        if conditions[self.condition](flags.last):
+            return target
+
+
+class LOOP(Command):
+    jumps = True
+
+    def __init__(self):
+        super(LOOP, self).__init__('LOOP', 'INSERT HELP')
+
+    def bind(self, computer, target):
+        return partial(self.__run__, target, computer.reg['ecx'])
+
+    def footprint(self, computer, target):
+        return 0, 4
+
+    def accesses(self, computer, registers, target):
+        return operand_accesses(computer.reg['ecx'], 'rw')
+
+    def __run__(self, target, counter):
+        counter -= 1
+        if counter.value != 0:
+            return target
+
+
+class PUSH(Command):
+    modes = ('r',)
+
+    def __init__(self):
+        super(PUSH, self).__init__('PUSH', 'INSERT HELP')
+
+    def bind(self, computer, source):
+        return partial(self.__run__, source, computer.stack)
+
+    def footprint(self, computer, source):
+        memory, registers = super(PUSH, self).footprint(computer, source)
+        return memory + 4, registers + 4
+
+    def accesses(self, computer, registers, source):
+        accesses = super(PUSH, self).accesses(computer, registers, source)
+        return ordered(accesses + stack_accesses(computer))
+
+    def __run__(self, source, stack):
+        if isinstance(source, Active):
+            source = source.value
+        stack.push(source)
+
+
+class POP(Command):
+    modes = ('w',)
+
+    def __init__(self):
+        super(POP, self).__init__('POP', 'INSERT HELP')
+
+    def bind(self, computer, destination):
+        return partial(self.__run__, destination, computer.stack)
+
+    def footprint(self, computer, destination):
+        memory, registers = super(POP, self).footprint(computer, destination)
+        return memory + 4, registers + 4
+
+    def accesses(self, computer, registers, destination):
+        accesses = super(POP, self).accesses(computer, registers, destination)
+        return ordered(accesses + stack_accesses(computer))
+
+    def __run__(self, destination, stack):
+        destination.value = stack.pop()
+
+
+class PUSHF(Command):
+
+    def __init__(self):
+        super(PUSHF, self).__init__('PUSHF', 'INSERT HELP')
+
+    def bind(self, computer):
+        return partial(self.__run__, computer.flags, computer.stack)
+
+    def footprint(self, computer):
+        return 4, 4
+
+    def accesses(self, computer, registers):
+        return ordered(stack_accesses(computer))
+
+    def __run__(self, flags, stack):
+        stack.push(flags.value)
+
+
+class POPF(Command):
+
+    def __init__(self):
+        super(POPF, self).__init__('POPF', 'INSERT HELP')
+
+    def bind(self, computer):
+        return partial(self.__run__, computer.flags, computer.stack)
+
+    def footprint(self, computer):
+        return 4, 4
+
+    def accesses(self, computer, registers):
+        return ordered(stack_accesses(computer))
+
+    def __run__(self, flags, stack):
+        flags.value = stack.pop()
+
+
+class CLD(Command):
+
+    def __init__(self):
+        super(CLD, self).__init__('CLD', 'INSERT HELP')
+
+    def bind(self, computer):
+        return partial(self.__run__, computer.flags)
+
+    def footprint(self, computer):
+        return 0, 0
+
+    def __run__(self, flags):
+        flags.df = False
+
+
+class STD(Command):
+
+    def __init__(self):
+        super(STD, self).__init__('STD', 'INSERT HELP')
+
+    def bind(self, computer):
+        return partial(self.__run__, computer.flags)
+
+    def footprint(self, computer):
+        return 0, 0
+
+    def __run__(self, flags):
+        flags.df = True
+
+
+class StringCommand(Command):
+    """
+    String instruction, stepping esi and edi through memory by elements of width bytes
+
+    ...
+    Parameters
+    ----------
+    width : [1, 2, 4]
+        Size of an element in bytes, the B, W and D forms of the instruction.
+    prefix : ['REP', 'REPE', 'REPZ', 'REPNE', 'REPNZ'], optional
+        Repeat the instruction ecx times, REPE and REPNE also stop early
+        on the flags of a comparison.
+
+    Notes
+    -----
+    esi and edi are byte offsets into Memory.memory. They step up by width
+    after every element, or down when the direction flag is set.
+
+    A repeated instruction runs as whole array operations on the memory
+    rather than one element at a time, with the same results: esi, edi and
+    ecx end where the last executed element leaves them, and the flags are
+    those of the last comparison. When an element falls outside of memory,
+    the elements before it are executed, the registers are left pointing at
+    it and InvalidAddress is raised.
+    """
+    # Register every element width loads from or stores to
+    accumulators = {1: 'al', 2: 'ax', 4: 'eax'}
+    suffixes = {1: 'B', 2: 'W', 4: 'D'}
+    # Prefixes the instruction accepts
+    prefixes = ('REP',)
+    # Pointer registers the instruction steps, with how it accesses the elements they point at
+    pointers = ()
+    # How the instruction accesses the accumulator, if at all
+    accumulator_mode = ''
+
+    def __init__(self, width, prefix=None):
+        name = type(self).__name__ + self.suffixes[width]
+        super(StringCommand, self).__init__(name if prefix is None else prefix + ' ' + name, 'INSERT HELP')
+        self.width = width
+        self.prefix = prefix
+
+    def bind(self, computer):
+        reg = computer.reg
+        return partial(self.__run__, computer.mem, computer.flags,
+                       reg['esi'], reg['edi'], reg['ecx'], reg[self.accumulators[self.width]])
+
+    def footprint(self, computer):
+        # One element, the pointers, the counter and the accumulator
+        return 2 * self.width, 12 + self.width
+
+    def accesses(self, computer, registers):
+        # The elements executed, from where the pointers started to how far the counter went
+        reg = computer.reg
+        accesses = []
+        executed = 1
+        if self.prefix is not None:
+            ecx = reg['ecx']
+            executed = int(ecx.descriptor.unpack(registers[ecx._range]))
+            if executed == 0:
+                return operand_accesses(ecx, 'r')
+            executed -= int(ecx.value)
+            accesses += operand_accesses(ecx, 'rw')
+        for name, mode in self.pointers:
+            pointer = reg[name]
+            offset, size = self.span(int(pointer.descriptor.unpack(registers[pointer._range])),
+                                     executed, computer.flags.df)
+            accesses += operand_accesses(pointer, 'rw')
+            accesses.append(('memory', offset, offset + size, mode))
+        accesses += operand_accesses(reg[self.accumulators[self.width]], self.accumulator_mode)
+        return ordered(accesses)
+
+    def count(self, ecx) -> int:
+        return int(ecx.value) if self.prefix is not None else 1
+
+    def span(self, pointer, count, down) -> tuple:
+        """
+        Returns
+        -------
+        tuple(int, int)
+            Lowest offset and size in bytes of count elements starting at pointer.
+        """
+        if down:
+            return pointer - (count - 1) * self.width, count * self.width
+        return pointer, count * self.width
+
+    def valid(self, memory, pointer, count, down) -> int:
+        """
+        Number of the first count elements starting at pointer that lie inside memory.
+        """
+        if pointer + self.width > len(memory.memory):
+            return 0
+        if down:
+            return min(count, pointer // self.width + 1)
+        return min(count, (len(memory.memory) - pointer) // self.width)
+
+    def elements(self, memory, pointer, count, down) -> np.ndarray:
+        """
+        Returns
+        -------
+        ndarray(np.int64)
+            Values of count elements starting at pointer, in execution order.
+        """
+        offset, size = self.span(pointer, count, down)
+        values = memory.read_bytes(offset, size).view(descriptors[self.width, False].dtype)
+        values = values.astype(np.int64)
+        return values[::-1] if down else values
+
+    def finish(self, pointers, ecx, executed, count, down, fault=False):
+        """
+        Step the pointers and the counter past the executed elements.
+
+        Raises
+        ------
+        InvalidAddress
+            When fault is set, after updating the registers.
+        """
+        step = -self.width if down else self.width
+        for register, start in pointers:
+            register.value = (start + step * executed) & 0xFFFFFFFF
+        if self.prefix is not None:
+            ecx.value = count - executed
+        if fault:
+            raise InvalidAddress('{0} element {1} is outside of memory'.format(self.name, executed))
+
+
+class MOVS(StringCommand):
+    pointers = (('esi', 'r'), ('edi', 'w'))
+
+    def __run__(self, memory, flags, esi, edi, ecx, accumulator):
+        count = self.count(ecx)
+        if count == 0:
+            return
+        down = flags.df
+        source, destination = int(esi.value), int(edi.value)
+        run = min(self.valid(memory, source, count, down), self.valid(memory, destination, count, down))
+        if run > 0:
+            self.copy(memory, source, destination, run, down)
+        self.finish(((esi, source), (edi, destination)), ecx, run, count, down, run < count)
+
+    def copy(self, memory, source, destination, count, down):
+        """
+        Copy count elements as if one at a time, in the order the direction flag gives.
+        """
+        width = self.width
+        source, size = self.span(source, count, down)
+        destination, _ = self.span(destination, count, down)
+        # Distance by which a later element reads bytes an earlier one wrote
+        distance = source - destination if down else destination - source
+        if distance <= 0 or distance >= size:
+            # Nothing is read after being written, so one copy of the source is exact
+            memory.write_bytes(destination, memory.read_bytes(source, size).copy())
+        elif distance >= width:
+            # Every element past the first distance bytes copies one that was
+            # just written, repeating those bytes through the destination
+            if down:
+                pattern = memory.read_bytes(source + size - distance, distance).copy()
+                indices = (np.arange(size) - (size - distance)) % distance
+            else:
+                pattern = memory.read_bytes(source, distance).copy()
+                indices = np.arange(size) % distance
+            memory.write_bytes(destination, pattern[indices])
+        else:
+            # Elements overlap their own predecessors, copy them in order
+            step = -width if down else width
+            first = (count - 1) * width if down else 0
+            for i in range(count):
+                offset = first + step * i
+                memory.write_bytes(destination + offset, memory.read_bytes(source + offset, width).copy())
+
+
+class STOS(StringCommand):
+    pointers = (('edi', 'w'),)
+    accumulator_mode = 'r'
+
+    def __run__(self, memory, flags, esi, edi, ecx, accumulator):
+        count = self.count(ecx)
+        if count == 0:
+            return
+        down = flags.df
+        destination = int(edi.value)
+        run = self.valid(memory, destination, count, down)
+        if run > 0:
+            offset, _ = self.span(destination, run, down)
+            memory.write_bytes(offset, np.tile(accumulator.mem, run))
+        self.finish(((edi, destination),), ecx, run, count, down, run < count)
+
+
+class LODS(StringCommand):
+    pointers = (('esi', 'r'),)
+    accumulator_mode = 'w'
+
+    def __run__(self, memory, flags, esi, edi, ecx, accumulator):
+        count = self.count(ecx)
+        if count == 0:
+            return
+        down = flags.df
+        source = int(esi.value)
+        run = self.valid(memory, source, count, down)
+        if run > 0:
+            # Only the last element loaded stays in the accumulator
+            last = source + (-self.width if down else self.width) * (run - 1)
+            accumulator.mem[:] = memory.read_bytes(last, self.width)
+        self.finish(((esi, source),), ecx, run, count, down, run < count)
+
+
+class CMPS(StringCommand):
+    prefixes = ('REP', 'REPE', 'REPZ', 'REPNE', 'REPNZ')
+    pointers = (('esi', 'r'), ('edi', 'r'))
+
+    def __run__(self, memory, flags, esi, edi, ecx, accumulator):
+        count = self.count(ecx)
+        if count == 0:
+            return
+        down = flags.df
+        source, destination = int(esi.value), int(edi.value)
+        run = min(self.valid(memory, source, count, down), self.valid(memory, destination, count, down))
+        executed, stopped = 0, False
+        if run > 0:
+            first = self.elements(memory, source, run, down)
+            second = self.elements(memory, destination, run, down)
+            executed, stopped = self.compare(flags, first, second)
+        self.finish(((esi, source), (edi, destination)), ecx, executed, count, down,
+                    not stopped and run < count)
+
+    def compare(self, flags, first, second) -> int:
+        """
+        Compare elements in order up to where the prefix stops.
+
+        Returns
+        -------
+        executed : int
+            Number of elements compared.
+        stopped : bool
+            Whether the prefix stopped the repetition.
+        """
+        executed = len(first)
+        stopped = False
+        if self.prefix is not None:
+            stops = (first == second) if self.prefix in ('REPNE', 'REPNZ') else (first != second)
+            if stops.any():
+                executed = int(stops.argmax()) + 1
+                stopped = True
+        flags.last = ('sub', int(first[executed - 1]), int(second[executed - 1]), self.width * 8, None)
+        return executed, stopped
+
+
+class SCAS(CMPS):
+    pointers = (('edi', 'r'),)
+    accumulator_mode = 'r'
+
+    def __run__(self, memory, flags, esi, edi, ecx, accumulator):
+        count = self.count(ecx)
+        if count == 0:
+            return
+        down = flags.df
+        destination = int(edi.value)
+        run = self.valid(memory, destination, count, down)
+        executed, stopped = 0, False
+        if run > 0:
+            elements = self.elements(memory, destination, run, down)
+            executed, stopped = self.compare(flags, np.full(run, int(accumulator.value), dtype=np.int64), elements)
+        self.finish(((edi, destination),), ecx, executed, count, down, not stopped and run < count)
+
+
 masm_commands = {
     'ADD': ADD(),
-    'MOV': MOV()}
+    'SUB': SUB(),
+    'CMP': CMP(),
+    'INC': INC(),
+    'DEC': DEC(),
+    'MOV': MOV(),
+    'JMP': JMP(),
+    'LOOP': LOOP(),
+    'PUSH': PUSH(),
+    'POP': POP(),
+    'PUSHF': PUSHF(),
+    'POPF': POPF(),
+    'CLD': CLD(),
+    'STD': STD()}
+masm_commands.update((name, Jcc(name, condition)) for name, condition in jumps.items())
+for _width in StringCommand.suffixes:
+    for _string in (MOVS, STOS, LODS, CMPS, SCAS):
+        for _prefix in (None,) + _string.prefixes:
+            _command = _string(_width, _prefix)
+            masm_commands[_command.name] = _command
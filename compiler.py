@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+from functools import partial
+from utils import *
+from register import RegisterFile
+from assembler import REG, IMM, VAR, LABEL
+from flags import conditions, jumps
+
+# Position of every register in the register file: (index of its 32-bit register, shift, mask)
+register_fields = {}
+for _index, (_extended, _word, _high, _low) in enumerate(RegisterFile.layout):
+    register_fields[_extended] = (_index, 0, 0xFFFFFFFF)
+    register_fields[_word] = (_index, 0, 0xFFFF)
+    if _high is not None:
+        register_fields[_high] = (_index, 8, 0xFF)
+        register_fields[_low] = (_index, 0, 0xFF)
+
+# Marks a block that has not been compiled yet
+PENDING = object()
+
+
+class Uncompilable(Exception):
+    pass
+
+
+class BlockBuilder:
+    """
+    Generates the python source of one basic block
+
+    ...
+    Parameters
+    ----------
+    start : int
+        Index of the first instruction of the block.
+    variables : dict(name: tuple(size, signed))
+        Type of every variable the program uses.
+
+    Notes
+    -----
+    The block keeps every register and variable it uses in a local python
+    int, loaded once when the block is entered and stored back when it is
+    left, so a block either completes or leaves the machine untouched.
+    Registers are kept as their 32-bit register, sub-registers are masked
+    out of it. Every value is kept unsigned, which gives the same bytes as
+    the wrapping numpy arithmetic of the interpreter.
+
+    The flags record is kept in the local f. A record that is replaced
+    before anything reads it is never built.
+    """
+    def __init__(self, start, variables):
+        self.start = start
+        self.variables = variables
+        self.body = []
+        self.registers = set()
+        self.written_registers = set()
+        self.locals = {}
+        self.written_variables = set()
+        self.flag_writes = []
+        self.flag_reads = []
+        self.length = 0
+        self.jumps = False
+        self.loops = False
+
+    def local(self, name):
+        if name not in self.locals:
+            self.locals[name] = len(self.locals)
+        return 'v{0}'.format(self.locals[name])
+
+    def read(self, operand):
+        """
+        Returns
+        -------
+        expression : str
+            Python expression of the unsigned value of the operand.
+        size : int or None
+            Size of the operand in bytes, None for constants.
+        signed : bool
+            Whether or not the operand is signed.
+        """
+        kind, payload = operand
+        if kind == REG:
+            index, shift, mask = register_fields[payload]
+            self.registers.add(index)
+            if mask == 0xFFFFFFFF:
+                return 'r{0}'.format(index), 4, False
+            if shift:
+                return '((r{0} >> {1}) & {2})'.format(index, shift, mask), mask.bit_length() // 8, False
+            return '(r{0} & {1})'.format(index, mask), mask.bit_length() // 8, False
+        if kind == VAR:
+            size, signed = self.variables[payload]
+            return self.local(payload), size, signed
+        if kind == IMM:
+            return repr(payload), None, False
+        raise Uncompilable()
+
+    def write(self, operand, expression):
+        kind, payload = operand
+        if kind == REG:
+            index, shift, mask = register_fields[payload]
+            self.registers.add(index)
+            self.written_registers.add(index)
+            if mask == 0xFFFFFFFF:
+                self.emit('r{0} = {1}'.format(index, expression))
+            else:
+                self.emit('r{0} = (r{0} & {1}) | ({2} << {3})'.format(
+                    index, 0xFFFFFFFF ^ (mask << shift), expression, shift))
+        elif kind == VAR:
+            self.written_variables.add(payload)
+            self.emit('{0} = {1}'.format(self.local(payload), expression))
+        else:
+            raise Uncompilable()
+
+    def destination(self, operand):
+        """
+        Returns
+        -------
+        expression : str
+            Python expression of the unsigned value of the destination.
+        size : int
+            Size of the destination in bytes.
+        minimum, maximum : int
+            Range of the constants the interpreter accepts as source.
+        """
+        expression, size, signed = self.read(operand)
+        if size is None:
+            raise Uncompilable()
+        bits = size * 8
+        if signed:
+            return expression, size, -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+        return expression, size, 0, (1 << bits) - 1
+
+    def source(self, operand, size):
+        """
+        Python expression of a source operand converted to the size of the destination.
+        """
+        expression, source_size, signed = self.read(operand)
+        if source_size is None:
+            return repr(int(expression) & ((1 << size * 8) - 1))
+        if source_size < size and signed:
+            sign = 1 << (source_size * 8 - 1)
+            return '((({0} ^ {1}) - {1}) & {2})'.format(expression, sign, (1 << size * 8) - 1)
+        if source_size > size:
+            return '({0} & {1})'.format(expression, (1 << size * 8) - 1)
+        return expression
+
+    def set_flags(self, op, destination, source, bits):
+        """
+        Record the flags of an operation, see flags.py.
+        """
+        if op == 'inc' or op == 'dec':
+            self.flag_reads.append(len(self.body))
+            carry = 'f[4] or f'
+        else:
+            carry = 'None'
+        self.flag_writes.append(len(self.body))
+        self.emit("f = ('{0}', {1}, {2}, {3}, {4})".format(op, destination, source, bits, carry))
+
+    def test_flags(self, condition):
+        """
+        Python expression of a condition code on the flags.
+        """
+        self.flag_reads.append(len(self.body))
+        return "conditions['{0}'](f)".format(condition)
+
+    def state(self):
+        return (len(self.body), set(self.registers), set(self.written_registers), dict(self.locals),
+                set(self.written_variables), list(self.flag_writes), list(self.flag_reads))
+
+    def rollback(self, state):
+        del self.body[state[0]:]
+        (self.registers, self.written_registers, self.locals, self.written_variables,
+         self.flag_writes, self.flag_reads) = state[1:]
+
+    def emit(self, line):
+        self.body.append(line)
+
+    def source_code(self) -> str:
+        """
+        Returns
+        -------
+        str
+            Source of a function block(budget) executing the block, repeatedly if it
+            jumps back to itself and the budget allows, returning the index of the
+            next instruction and the number of executed instructions.
+        """
+        loads = ['r{0} = int(R[{0}])'.format(index) for index in sorted(self.registers)]
+        loads += ['v{0} = int(V{0}[0])'.format(i) for i in self.locals.values()]
+        stores = ['R[{0}] = r{0}'.format(index) for index in sorted(self.written_registers)]
+        stores += ['V{0}[0] = v{0}'.format(self.locals[name]) for name in sorted(self.written_variables)]
+        if self.written_variables:
+            stores.append('touch()')
+        if self.flag_writes or self.flag_reads:
+            loads.append('f = F.last')
+        if self.flag_writes:
+            stores.append('F.last = f')
+        end = self.start + self.length
+
+        # Drop the records replaced before anything reads them
+        body = list(self.body)
+        reads = set(self.flag_reads)
+        writes = set(self.flag_writes)
+        for i in self.flag_writes:
+            for j in range(i + 1, len(body)):
+                if j in reads:
+                    break
+                if j in writes:
+                    body[i] = None
+                    break
+        body = [line for line in body if line is not None]
+
+        lines = ['def block(budget):']
+        lines += ['    ' + line for line in loads]
+        if self.loops:
+            lines.append('    steps = 0')
+            lines.append('    while True:')
+            lines += ['        ' + line for line in body]
+            lines.append('        steps += {0}'.format(self.length))
+            lines.append('        if ip != {0} or steps + {1} > budget:'.format(self.start, self.length))
+            lines.append('            break')
+            lines += ['    ' + line for line in stores]
+            lines.append('    return ip, steps')
+        else:
+            lines += ['    ' + line for line in body]
+            lines += ['    ' + line for line in stores]
+            lines.append('    return {0}, {1}'.format('ip' if self.jumps else end, self.length))
+        return '\n'.join(lines) + '\n'
+
+
+def compile_mov(builder, destination, source):
+    if source[0] == IMM and destination[0] == REG:
+        _, size, _, maximum = builder.destination(destination)
+        if not -((maximum + 1) >> 1) <= source[1] <= maximum:
+            raise Uncompilable()
+    elif source[0] == IMM:
+        _, size, minimum, maximum = builder.destination(destination)
+        if not minimum <= source[1] <= maximum:
+            raise Uncompilable()
+    else:
+        size = builder.destination(destination)[1]
+        if destination[0] == REG and builder.read(source)[1] > size:
+            raise Uncompilable()
+    builder.write(destination, builder.source(source, size))
+
+
+def arithmetic_operands(builder, destination, source):
+    """
+    Returns
+    -------
+    destination : str
+        Python expression of the destination.
+    source : str
+        Python expression of the source converted to the size of the destination.
+    size : int
+        Size of the destination in bytes.
+    """
+    expression, size, minimum, maximum = builder.destination(destination)
+    if source[0] == IMM:
+        if not minimum <= source[1] <= maximum:
+            raise Uncompilable()
+    elif builder.read(source)[1] > size:
+        raise Uncompilable()
+    return expression, builder.source(source, size), size
+
+
+def compile_add(builder, destination, source):
+    expression, source, size = arithmetic_operands(builder, destination, source)
+    builder.set_flags('add', expression, source, size * 8)
+    builder.write(destination, '(({0} + {1}) & {2})'.format(expression, source, (1 << size * 8) - 1))
+
+
+def compile_sub(builder, destination, source):
+    expression, source, size = arithmetic_operands(builder, destination, source)
+    builder.set_flags('sub', expression, source, size * 8)
+    builder.write(destination, '(({0} - {1}) & {2})'.format(expression, source, (1 << size * 8) - 1))
+
+
+def compile_cmp(builder, destination, source):
+    expression, source, size = arithmetic_operands(builder, destination, source)
+    builder.set_flags('sub', expression, source, size * 8)
+
+
+def compile_inc(builder, destination):
+    expression, size, minimum, maximum = builder.destination(destination)
+    builder.set_flags('inc', expression, 1, size * 8)
+    builder.write(destination, '(({0} + 1) & {1})'.format(expression, (1 << size * 8) - 1))
+
+
+def compile_dec(builder, destination):
+    expression, size, minimum, maximum = builder.destination(destination)
+    builder.set_flags('dec', expression, 1, size * 8)
+    builder.write(destination, '(({0} - 1) & {1})'.format(expression, (1 << size * 8) - 1))
+
+
+def compile_jmp(builder, target):
+    if target[0] != LABEL:
+        raise Uncompilable()
+    builder.emit('ip = {0}'.format(target[1]))
+    return target[1]
+
+
+def compile_loop(builder, target):
+    if target[0] != LABEL:
+        raise Uncompilable()
+    index = register_fields['ecx'][0]
+    builder.registers.add(index)
+    builder.written_registers.add(index)
+    builder.emit('r{0} = (r{0} - 1) & 0xFFFFFFFF'.format(index))
+    builder.emit('ip = {0} if r{1} else {2}'.format(target[1], index, builder.start + builder.length + 1))
+    return target[1]
+
+
+def compile_jcc(condition, builder, target):
+    if target[0] != LABEL:
+        raise Uncompilable()
+    builder.emit('ip = {0} if {1} else {2}'.format(
+        target[1], builder.test_flags(condition), builder.start + builder.length + 1))
+    return target[1]
+
+
+# Code generator of every compilable instruction, jumps return their target
+generators = {
+    'MOV': compile_mov,
+    'ADD': compile_add,
+    'SUB': compile_sub,
+    'CMP': compile_cmp,
+    'INC': compile_inc,
+    'DEC': compile_dec,
+    'JMP': compile_jmp,
+    'LOOP': compile_loop
+}
+generators.update((name, partial(compile_jcc, condition)) for name, condition in jumps.items())
+
+
+class BlockCompiler(Component):
+    """
+    Compiles straight-line runs of instructions into python functions
+
+    ...
+    Parameters
+    ----------
+    computer : Computer
+        Computer the compiled blocks run on.
+
+    Attributes
+    ----------
+    blocks : list
+        For every instruction, the compiled block starting there as a tuple
+        (function, length), None if it has to be interpreted, PENDING if it
+        has not been compiled yet, or the Memory.version it was last linked
+        at if it waits for one of its variables to be initialized.
+
+    Notes
+    -----
+    A block starts at the instruction where execution enters it and stops
+    before the next jump target, after the first jump or before the first
+    instruction that cannot be compiled. The generated code object is cached
+    in Program.cache, keyed by the block start and the types of the variables,
+    so only linking it to the register and memory buffers is repeated per run.
+    The types of the variables are looked up once per run.
+
+    A block using a variable that is not initialized yet is left to the
+    interpreter and linked again only once Memory.version shows that the
+    variable table changed, so a hot loop does not retry it on every visit.
+
+    Instructions the generators cannot prove to behave exactly like the
+    interpreter, for example constants the interpreter would reject,
+    are left to the interpreter. A block that raises is discarded
+    and executed by the interpreter instead.
+    """
+    def __init__(self, computer):
+        super(BlockCompiler, self).__init__('BlockCompiler')
+        self.computer = computer
+        self.program = None
+        self.blocks = []
+        self.variables = {}
+        self._types = ()
+
+    def prepare(self, program):
+        """
+        Start a run of a program, dropping the blocks linked for the previous run.
+        """
+        self.program = program
+        self.blocks = [PENDING] * len(program)
+        if 'leaders' not in program.cache:
+            program.cache['leaders'] = frozenset(payload for operands in program.operands
+                                                 for kind, payload in operands if kind == LABEL)
+        if 'variables' not in program.cache:
+            program.cache['variables'] = sorted(set(payload for operands in program.operands
+                                                    for kind, payload in operands if kind == VAR))
+        # Variables are only declared between runs, so their types hold for the whole run
+        mem = self.computer.mem
+        self.variables = {}
+        for name in program.cache['variables']:
+            offset, size, signed, init = mem.variables[name]
+            self.variables[name] = (size, bool(signed))
+        self._types = tuple(sorted(self.variables.items()))
+
+    def compile(self, start, variables):
+        """
+        Generate and compile the block starting at an instruction.
+
+        Returns
+        -------
+        tuple(code, length, variable names, written variable names) or None
+            The compiled block, None if its first instruction cannot be compiled.
+        """
+        program = self.program
+        commands = self.computer.cpu.commands
+        leaders = program.cache['leaders']
+        builder = BlockBuilder(start, variables)
+        for index in range(start, len(program)):
+            if index != start and index in leaders:
+                break
+            name = program.mnemonic(index)
+            if name not in generators:
+                break
+            state = builder.state()
+            try:
+                target = generators[name](builder, *program.operands[index])
+            except (Uncompilable, TypeError):
+                builder.rollback(state)
+                break
+            builder.length += 1
+            if commands[name].jumps:
+                builder.jumps = True
+                builder.loops = target == start
+                break
+
+        if builder.length == 0:
+            return None
+        code = compile(builder.source_code(), '<block {0}>'.format(start), 'exec')
+        return code, builder.length, sorted(builder.locals, key=builder.locals.get), sorted(builder.written_variables)
+
+    def link(self, start):
+        """
+        Compile the block starting at an instruction and bind it to the computer.
+
+        Returns
+        -------
+        tuple(function, length) or None
+            The block, None if it has to be interpreted.
+        """
+        mem = self.computer.mem
+        key = (start, self._types)
+        cache = self.program.cache
+        if key not in cache:
+            cache[key] = self.compile(start, self.variables)
+        if cache[key] is None:
+            self.blocks[start] = None
+            return None
+
+        code, length, names, written = cache[key]
+        namespace = {'R': self.computer.reg.buffer.view('>u4'), 'F': self.computer.flags,
+                     'conditions': conditions}
+        for i, name in enumerate(names):
+            offset, size, signed, init = mem.variables[name]
+            if not init:
+                # Left to the interpreter until the variable table changes
+                self.blocks[start] = mem.version
+                return None
+            namespace['V{0}'.format(i)] = mem.memory[offset:offset + size].view(descriptors[size, False].dtype)
+        if written:
+            pages = sorted(set(index for name in written for index in mem.pages.page_range(*mem.variables[name][:2])))
+            namespace['touch'] = partial(mem.pages.touch_pages, pages)
+        exec(code, namespace)
+        self.blocks[start] = (namespace['block'], length)
+        return self.blocks[start]
+
+    def run(self, program, code, ip, limit):
+        """
+        Execute a program, running compiled blocks where possible.
+
+        Parameters
+        ----------
+        program : Program
+            The program to execute.
+        code : list(callable)
+            The program bound by Processor.bind, for the interpreted instructions.
+        ip : int
+            Index of the first instruction to execute.
+        limit : int
+            Maximum number of instructions to execute.
+
+        Returns
+        -------
+        ip : int
+            Index of the next instruction to execute.
+        steps : int
+            Number of executed instructions.
+        """
+        self.prepare(program)
+        blocks = self.blocks
+        mem = self.computer.mem
+        end = len(code)
+        steps = 0
+        while ip < end and steps < limit:
+            block = blocks[ip]
+            if block is PENDING or (type(block) is int and block != mem.version):
+                block = self.link(ip)
+            if type(block) is tuple and block[1] <= limit - steps:
+                try:
+                    ip, executed = block[0](limit - steps)
+                except Exception:
+                    blocks[ip] = None
+                    continue
+                steps += executed
+            else:
+                target = code[ip]()
+                ip = ip + 1 if target is None else target
+                steps += 1
+        return ip, steps
+
+
+if __name__ == "__main__":
+    from main import Computer
+    comp = Computer()
+    program = comp.assemble('''
+        MOV ecx, 1000
+    top:
+        ADD eax, 3
+        ADD bl, al
+        LOOP top
+    ''')
+    print(comp.run(program, jit=True))
+    print(comp.reg)
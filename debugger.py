@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+from collections import namedtuple
+from utils import *
+
+# Why a debugged run stopped: the index of the instruction that stopped it,
+# 'breakpoint', 'memory', 'variable' or 'register', the breakpoint index,
+# address, variable or register name and the access, 'r' or 'w', None for
+# breakpoints
+Hit = namedtuple('Hit', ['ip', 'kind', 'location', 'access'])
+
+_accesses = ('r', 'w', 'rw')
+
+
+class Debugger(Component):
+    """
+    Breakpoints on instructions and watchpoints on memory, variables and registers
+
+    ...
+    Attributes
+    ----------
+    breakpoints : set(int)
+        Indices of the instructions execution stops before.
+    watches : list(tuple(kind, location, size, access))
+        The watchpoints, see watch_memory(), watch_variable() and watch_register().
+    hits : list(Hit)
+        Why the last run stopped, empty if it ran to the end or to max_steps.
+
+    Notes
+    -----
+    Debugging is enabled by setting Computer.debugger. Computer.run only
+    hands execution to the debugger while it has a breakpoint or a watch,
+    so an unarmed debugger costs one check per run and memory and register
+    accesses run exactly as without a debugger.
+
+    Breakpoints are a bitmap over the instructions of the program, checked
+    before every instruction. Running again from where a breakpoint stopped
+    executes the instruction instead of stopping again. Watched bytes are
+    bitmaps over the memory and the register buffer. While there are
+    watches, the bound instructions are wrapped as Profiler.instrument
+    does, and after every instruction the bytes it accessed, given by
+    Command.accesses, are looked up in the bitmaps. The instruction that
+    trips a watch completes and the run stops after it.
+
+    Only accesses made by instructions are reported: declaring variables
+    and loading a program are not, nor are those of an instruction that
+    raised. Computer.run ignores jit while debugging, since compiled
+    blocks do not go through the bound instructions.
+
+    Examples
+    --------
+    >>> from main import Computer
+    >>> comp = Computer()
+    >>> comp.debugger = Debugger()
+    >>> comp.debugger.watch_variable('total')
+    >>> result = comp.run('''
+    ... .data
+    ... total DWORD 0
+    ... .code
+    ...     MOV ecx, 3
+    ...     ADD eax, ecx
+    ...     MOV total, eax
+    ...     MOV ebx, 1
+    ... ''')
+    >>> comp.debugger.hits
+    [Hit(ip=2, kind='variable', location='total', access='w')]
+    >>> result.ip
+    3
+    """
+    def __init__(self):
+        super(Debugger, self).__init__('Debugger')
+        self.breakpoints = set()
+        self.watches = []
+        self.hits = []
+        self.ip = 0
+        self._stopped = None
+        self._maps = None
+        self._spans = ()
+
+    @property
+    def armed(self) -> bool:
+        """
+        Whether there is a breakpoint or a watch.
+        """
+        return bool(self.breakpoints or self.watches)
+
+    def add_breakpoint(self, ip: int):
+        self.breakpoints.add(ip)
+
+    def remove_breakpoint(self, ip: int):
+        self.breakpoints.discard(ip)
+
+    def _watch(self, kind, location, size, access):
+        if access not in _accesses:
+            raise ValueError('Unknown access {0}, expected one of {1}'.format(access, _accesses))
+        self.watches.append((kind, location, size, access))
+
+    def watch_memory(self, address: int, size: int=1, access: str='w'):
+        """
+        Watch a range of bytes of memory.
+
+        Parameters
+        ----------
+        address : int
+            Offset of the first byte.
+        size : int, optional
+            Number of bytes.
+        access : ['r', 'w', 'rw'], optional
+            Stop on reads, writes or both.
+        """
+        self._watch('memory', address, size, access)
+
+    def watch_variable(self, name: str, access: str='w'):
+        """
+        Watch all the bytes of a variable or array, located when a run starts.
+        """
+        self._watch('variable', name, None, access)
+
+    def watch_register(self, name: str, access: str='w'):
+        """
+        Watch a register. Accesses through its sub-registers and parent register
+        are reported when they overlap its bytes.
+        """
+        self._watch('register', name, None, access)
+
+    def clear(self):
+        """
+        Remove every breakpoint and watch.
+        """
+        self.breakpoints.clear()
+        self.watches.clear()
+
+    def _arm(self, computer):
+        """
+        Build the bitmaps of the watched bytes.
+        """
+        mem, reg = computer.mem, computer.reg
+        memory_maps = {'r': np.zeros(len(mem.memory), dtype=bool), 'w': np.zeros(len(mem.memory), dtype=bool)}
+        register_maps = {'r': np.zeros(len(reg.buffer), dtype=bool), 'w': np.zeros(len(reg.buffer), dtype=bool)}
+        spans = []
+        for kind, location, size, access in self.watches:
+            if kind == 'register':
+                maps = register_maps
+                if location not in reg.registers:
+                    raise KeyError('Unknown register {0}'.format(location))
+                span = reg[location]._range
+                start, stop = span.start, span.stop
+            else:
+                maps = memory_maps
+                if kind == 'variable':
+                    if location not in mem.variables:
+                        raise VariableNotDefined('Variable {0} has not been defined'.format(location))
+                    start = mem.variables[location][0]
+                    stop = start + mem.extent(location)
+                else:
+                    start, stop = location, location + size
+                    mem.check(start, size)
+            for mode in access:
+                maps[mode][start:stop] = True
+            spans.append((kind, location, start, stop, access))
+
+        self._maps = {'memory': memory_maps, 'register': register_maps}
+        self._spans = spans
+
+    def _trap(self, space, start, stop, access):
+        """
+        Record a hit for every watch of space overlapping bytes start to stop,
+        once per instruction however many times it accesses them.
+        """
+        for kind, location, first, last, modes in self._spans:
+            if (kind == 'register') == (space == 'register') and access in modes and first < stop and start < last:
+                hit = Hit(self.ip, kind, location, access)
+                if hit not in self.hits:
+                    self.hits.append(hit)
+
+    def instrument(self, program, computer, code) -> list:
+        """
+        Wrap the bound instructions of a program in checks of the bytes they access.
+
+        Parameters
+        ----------
+        program : Program
+            The program code was bound from.
+        computer : Computer
+            The computer code was bound to.
+        code : list(callable)
+            The bound instructions, see Processor.bind.
+
+        Returns
+        -------
+        list(callable)
+            The instructions, recording a hit for every watch they access.
+        """
+        commands = computer.cpu.commands
+        buffer = computer.reg.buffer
+        maps = self._maps
+        trap = self._trap
+
+        def watched(handler, command, operands):
+            def instruction():
+                # Addresses and string instructions need the registers from before
+                registers = buffer.copy()
+                target = handler()
+                for space, start, stop, access in command.accesses(computer, registers, *operands):
+                    if maps[space][access][start:stop].any():
+                        trap(space, start, stop, access)
+                return target
+            return instruction
+
+        return [watched(handler, commands[program.mnemonic(i)], operands)
+                for i, (handler, operands) in enumerate(zip(code, program.resolve(computer)))]
+
+    def run(self, computer, program, code, ip, limit):
+        """
+        Execute a program until a breakpoint or watch stops it.
+
+        Parameters
+        ----------
+        computer : Computer
+            The computer running the program.
+        program : Program
+            The program code was bound from.
+        code : list(callable)
+            The program bound by Processor.bind.
+        ip : int
+            Index of the first instruction to execute.
+        limit : int
+            Maximum number of instructions to execute.
+
+        Returns
+        -------
+        ip : int
+            Index of the next instruction to execute.
+        steps : int
+            Number of executed instructions.
+        """
+        end = len(code)
+        breaks = bytearray(end)
+        for index in self.breakpoints:
+            if 0 <= index < end:
+                breaks[index] = 1
+        hits = self.hits = []
+        steps = 0
+        # Resuming from a breakpoint executes the instruction it stopped before
+        resume = self._stopped == ip
+        self._stopped = None
+        if self.watches:
+            self._arm(computer)
+            code = self.instrument(program, computer, code)
+        while ip < end and steps < limit:
+            if breaks[ip] and not (resume and steps == 0):
+                hits.append(Hit(ip, 'breakpoint', ip, None))
+                self._stopped = ip
+                break
+            self.ip = ip
+            target = code[ip]()
+            ip = ip + 1 if target is None else target
+            steps += 1
+            if hits:
+                break
+        return ip, steps
+
+    def __repr__(self):
+        return "Debugger(breakpoints={0}, watches={1})".format(sorted(self.breakpoints), self.watches)
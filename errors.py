@@ -11,6 +11,14 @@ class VariableNotDefined(Exception):
 class VariableAlreadyDefined(Exception):
     pass
 
+
+class OutOfMemory(Exception):
+    pass
+
+
+class InvalidAddress(Exception):
+    pass
+
 # Variable Sizes
 
 class InvalidSize(Exception):
@@ -28,3 +36,7 @@ class NoMoreObjectsInStack(Exception):
 class StackFull(Exception):
     pass
 
+# Assembler
+class AssemblerError(Exception):
+    pass
+
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+import os
+import pickle
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from utils import *
+from register import RegisterFile
+
+# State of a worker process, set up once by _start_worker
+_worker = {}
+
+
+def _start_worker(mem_size, stack_size, cache_size):
+    from main import Computer
+    _worker['computer'] = Computer(mem_size, stack_size, stack_mode='typed')
+    _worker['programs'] = {}
+    _worker['cache_size'] = cache_size
+    _worker['shm'] = None
+
+
+def _attach(name):
+    shm = _worker['shm']
+    if shm is None or shm.name != name:
+        if shm is not None:
+            shm.close()
+        shm = shared_memory.SharedMemory(name=name)
+        _worker['shm'] = shm
+    return shm
+
+
+def _program(key, table_name):
+    """
+    The program of a key, read from the program table of the run the first time the worker sees it.
+    """
+    programs = _worker['programs']
+    if key not in programs:
+        shm = shared_memory.SharedMemory(name=table_name)
+        try:
+            table = pickle.loads(shm.buf)
+        finally:
+            shm.close()
+        comp = _worker['computer']
+        for other, program in table.items():
+            if other not in programs:
+                if isinstance(program, str):
+                    program = comp.assemble(program)
+                programs[other] = program
+        # The oldest programs not in the current run go first, a later run brings them back
+        excess = len(programs) - _worker['cache_size']
+        if excess > 0:
+            for other in [other for other in programs if other not in table][:excess]:
+                del programs[other]
+    return programs[key]
+
+
+def _run_job(task):
+    """
+    Run one job on the warm Computer of a worker and store its final
+    state in its slot of the shared result block.
+    """
+    shm_name, slot_size, index, key, table_name, state, max_steps = task
+    comp = _worker['computer']
+    program = _program(key, table_name)
+
+    comp.reset()
+    error = None
+    steps, ip = 0, 0
+    try:
+        program.load(comp)
+        for name, value in state.get('reg', {}).items():
+            comp.reg[name].value = value
+        for name, value in state.get('mem', {}).items():
+            comp.mem.set(name, value)
+        result = comp.run(program, max_steps=max_steps, load=False)
+        steps, ip = result.steps, result.ip
+    except Exception as exception:
+        error = exception
+
+    shm = _attach(shm_name)
+    slot = np.ndarray((slot_size,), dtype=np.uint8, buffer=shm.buf, offset=index * slot_size)
+    registers = comp.reg.buffer
+    memory = comp.mem.memory
+    slot[:len(registers)] = registers
+    slot[len(registers):len(registers) + len(memory)] = memory
+    slot[len(registers) + len(memory):] = comp.stack.stack
+    del slot
+    return index, steps, ip, ip >= len(program), error, dict(comp.mem.variables)
+
+
+class JobResult:
+    """
+    Final state of one job run by a Farm
+
+    ...
+    Attributes
+    ----------
+    registers : ndarray(np.uint8)
+        Register file of the computer, laid out like RegisterFile.buffer.
+    memory : ndarray(np.uint8)
+        Memory bytes of the computer.
+    stack : ndarray(np.uint8)
+        Stack bytes of the computer.
+    variables : dict(name: tuple(offset, size, signed, initialized))
+        Variable table of the computer.
+    steps : int
+        Number of executed instructions.
+    ip : int
+        Index of the next instruction.
+    halted : bool
+        Whether the program ran past its last instruction.
+    error : Exception or None
+        The exception raised by the job, if any.
+    """
+    def __init__(self, registers, memory, stack, variables, steps, ip, halted, error):
+        self.registers = registers
+        self.memory = memory
+        self.stack = stack
+        self.variables = variables
+        self.steps = steps
+        self.ip = ip
+        self.halted = halted
+        self.error = error
+
+    @property
+    def reg(self) -> dict:
+        """
+        The value of every 32-bit register.
+        """
+        names = [names[0] for names in RegisterFile.layout]
+        return dict(zip(names, combine_many(self.registers, 4)))
+
+    def variable(self, name):
+        """
+        The value of a variable.
+        """
+        offset, size, signed, init = self.variables[name]
+        return combine_number(self.memory[offset:offset + size], signed)
+
+    def __repr__(self):
+        return "JobResult(steps={}, ip={}, halted={}, error={!r})".format(
+            self.steps, self.ip, self.halted, self.error)
+
+
+class Farm(Component):
+    """
+    Runs many (program, initial state) jobs on a pool of worker processes
+
+    ...
+    Parameters
+    ----------
+    workers : int, optional
+        Number of worker processes, the number of cores by default.
+    mem_size : int, optional
+        Memory size of the computer of every worker in bytes.
+    stack_size : int, optional
+        Stack size of the computer of every worker in levels.
+    cache_size : int, optional
+        Number of programs the farm and every worker keep keys and
+        assembled programs for.
+
+    Notes
+    -----
+    Every worker builds one Computer when it starts and resets it between
+    jobs, and keeps the programs it has seen assembled and bound. Jobs only
+    carry a small key for their program: the distinct programs of a run are
+    pickled once into a shared memory table, which a worker reads when it
+    meets a key it does not know yet. The final register file, memory and
+    stack of every job are written into a multiprocessing.shared_memory
+    block, one fixed size slot per job, so only small status tuples travel
+    back through pickling.
+
+    Examples
+    --------
+    >>> with Farm(workers=2) as farm:
+    ...     results = farm.run([('ADD eax, ebx', {'reg': {'ebx': n}}) for n in range(4)])
+    >>> [int(result.reg['eax']) for result in results]
+    [0, 1, 2, 3]
+    """
+    def __init__(self, workers=None, mem_size=1024, stack_size=1024, cache_size=256):
+        super(Farm, self).__init__('Farm')
+        self.workers = workers or os.cpu_count() or 1
+        self.mem_size = mem_size
+        self.stack_size = stack_size
+        self.cache_size = cache_size
+        self._pool = None
+        # Key of every known source and program, keys are never reused
+        self._keys = {}
+        self._programs = {}
+        self._next_key = 0
+
+    @property
+    def slot_size(self) -> int:
+        return 4 * len(RegisterFile.layout) + self.mem_size + 4 * self.stack_size
+
+    def start(self):
+        if self._pool is None:
+            # Workers share the tracker of this process, which forgets the result blocks once unlinked
+            resource_tracker.ensure_running()
+            self._pool = multiprocessing.Pool(self.workers, _start_worker,
+                                              (self.mem_size, self.stack_size, self.cache_size))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._keys.clear()
+        self._programs.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _key(self, program) -> int:
+        """
+        Key identifying a program in the caches of the workers.
+        """
+        identity = program if isinstance(program, str) else id(program)
+        if identity not in self._keys:
+            if len(self._keys) >= self.cache_size:
+                # Forgotten programs get a new key if they come back, workers never see a key reused
+                self._keys.clear()
+                self._programs.clear()
+            self._keys[identity] = self._next_key
+            # Keeping the program alive keeps its id unique
+            self._programs[self._next_key] = program
+            self._next_key += 1
+        return self._keys[identity]
+
+    def run(self, jobs, max_steps=None, chunksize=None) -> list:
+        """
+        Run jobs on the worker pool.
+
+        Parameters
+        ----------
+        jobs : list(tuple(program, state))
+            Program or source of every job, with its initial state as a dict
+            {'reg': {name: value}, 'mem': {name: value}} applied after loading the program.
+        max_steps : int, optional
+            Stop every job after executing this many instructions.
+        chunksize : int, optional
+            Number of jobs sent to a worker at once.
+
+        Returns
+        -------
+        list(JobResult)
+            The final state of every job, in the order of jobs.
+        """
+        self.start()
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        slot_size = self.slot_size
+        if chunksize is None:
+            chunksize = max(1, len(jobs) // (4 * self.workers))
+
+        keys = [self._key(program) for program, state in jobs]
+        data = pickle.dumps({key: program for key, (program, state) in zip(keys, jobs)})
+        table = shared_memory.SharedMemory(create=True, size=len(data))
+        blocks = [table]
+        try:
+            table.buf[:len(data)] = data
+            shm = shared_memory.SharedMemory(create=True, size=slot_size * len(jobs))
+            blocks.append(shm)
+            tasks = [(shm.name, slot_size, index, key, table.name, state or {}, max_steps)
+                     for index, (key, (program, state)) in enumerate(zip(keys, jobs))]
+            status = self._pool.map(_run_job, tasks, chunksize)
+            block = np.ndarray((len(jobs), slot_size), dtype=np.uint8, buffer=shm.buf).copy()
+        finally:
+            for shared in blocks:
+                shared.close()
+                shared.unlink()
+
+        registers = 4 * len(RegisterFile.layout)
+        results = []
+        for index, steps, ip, halted, error, variables in status:
+            slot = block[index]
+            results.append(JobResult(slot[:registers], slot[registers:registers + self.mem_size],
+                                     slot[registers + self.mem_size:], variables, steps, ip, halted, error))
+        return results
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+    source = '''
+    .data
+    total DWORD 0
+    .code
+    top:
+        ADD total, ecx
+        LOOP top
+    '''
+    jobs = [(source, {'reg': {'ecx': n}}) for n in range(1, 65)]
+    for workers in (1, os.cpu_count()):
+        with Farm(workers) as farm:
+            begin = perf_counter()
+            results = farm.run(jobs)
+            print('{} workers: {:.3f} s'.format(workers, perf_counter() - begin))
+    print([result.variable('total') for result in results[:8]])
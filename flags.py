@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+from utils import *
+
+# Bit of every status flag in EFLAGS
+CF = 0
+PF = 2
+AF = 4
+ZF = 6
+SF = 7
+DF = 10
+OF = 11
+
+# The status flags, and bit 1 which is always set
+STATUS_MASK = (1 << CF) | (1 << PF) | (1 << AF) | (1 << ZF) | (1 << SF) | (1 << OF)
+RESERVED = 0x2
+
+
+# A flags record describes the last operation that set the status flags,
+# as a tuple (operation, destination, source, bits, carry):
+#
+#     'add', 'sub'   ADD and SUB or CMP of source to or from destination
+#     'inc', 'dec'   INC and DEC, carry is the record CF is taken from since
+#                    INC and DEC leave CF alone
+#     'set'          Flags set explicitly, for example by POPF, destination
+#                    holds the EFLAGS word
+#
+# Operands are stored as the instruction read them and only masked to bits
+# when a flag is computed, so recording costs a tuple and nothing else.
+
+# Flags right after reset
+INITIAL = ('set', RESERVED, 0, 32, None)
+
+
+def result(record) -> int:
+    """
+    The unsigned result of the operation of a record.
+    """
+    op, a, b, bits, carry = record
+    mask = (1 << bits) - 1
+    if op == 'add' or op == 'inc':
+        return (int(a) + int(b)) & mask
+    return (int(a) - int(b)) & mask
+
+
+def carry(record) -> bool:
+    op, a, b, bits, previous = record
+    if op == 'set':
+        return bool(a >> CF & 1)
+    if previous is not None:
+        return carry(previous)
+    mask = (1 << bits) - 1
+    if op == 'add':
+        return (int(a) & mask) + (int(b) & mask) > mask
+    return (int(a) & mask) < (int(b) & mask)
+
+
+def parity(record) -> bool:
+    if record[0] == 'set':
+        return bool(record[1] >> PF & 1)
+    return bin(result(record) & 0xFF).count('1') % 2 == 0
+
+
+def adjust(record) -> bool:
+    op, a, b, bits, previous = record
+    if op == 'set':
+        return bool(a >> AF & 1)
+    return bool((int(a) ^ int(b) ^ result(record)) >> 4 & 1)
+
+
+def zero(record) -> bool:
+    if record[0] == 'set':
+        return bool(record[1] >> ZF & 1)
+    return result(record) == 0
+
+
+def sign(record) -> bool:
+    if record[0] == 'set':
+        return bool(record[1] >> SF & 1)
+    return bool(result(record) >> (record[3] - 1) & 1)
+
+
+def overflow(record) -> bool:
+    op, a, b, bits, previous = record
+    if op == 'set':
+        return bool(a >> OF & 1)
+    r = result(record)
+    a, b = int(a), int(b)
+    if op == 'add' or op == 'inc':
+        return bool(((a ^ r) & (b ^ r)) >> (bits - 1) & 1)
+    return bool(((a ^ b) & (a ^ r)) >> (bits - 1) & 1)
+
+
+# Condition of every conditional jump, evaluated on a flags record
+conditions = {
+    'O': overflow,
+    'NO': lambda record: not overflow(record),
+    'B': carry,
+    'AE': lambda record: not carry(record),
+    'E': zero,
+    'NE': lambda record: not zero(record),
+    'BE': lambda record: carry(record) or zero(record),
+    'A': lambda record: not (carry(record) or zero(record)),
+    'S': sign,
+    'NS': lambda record: not sign(record),
+    'P': parity,
+    'NP': lambda record: not parity(record),
+    'L': lambda record: sign(record) != overflow(record),
+    'GE': lambda record: sign(record) == overflow(record),
+    'LE': lambda record: zero(record) or sign(record) != overflow(record),
+    'G': lambda record: not zero(record) and sign(record) == overflow(record)
+}
+
+# Every conditional jump mnemonic and the condition it tests
+jumps = {
+    'JO': 'O', 'JNO': 'NO',
+    'JB': 'B', 'JC': 'B', 'JNAE': 'B',
+    'JAE': 'AE', 'JNB': 'AE', 'JNC': 'AE',
+    'JE': 'E', 'JZ': 'E',
+    'JNE': 'NE', 'JNZ': 'NE',
+    'JBE': 'BE', 'JNA': 'BE',
+    'JA': 'A', 'JNBE': 'A',
+    'JS': 'S', 'JNS': 'NS',
+    'JP': 'P', 'JPE': 'P',
+    'JNP': 'NP', 'JPO': 'NP',
+    'JL': 'L', 'JNGE': 'L',
+    'JGE': 'GE', 'JNL': 'GE',
+    'JLE': 'LE', 'JNG': 'LE',
+    'JG': 'G', 'JNLE': 'G'
+}
+
+
+class Flags(Component):
+    """
+    The status flags of EFLAGS, computed on demand
+
+    ...
+    Attributes
+    ----------
+    last : tuple
+        Record of the last operation that set the flags, see the module notes.
+    df : bool
+        The direction flag, string instructions step down through memory when set.
+
+    Notes
+    -----
+    Arithmetic instructions only store their operands in last. A flag is
+    computed from them when something reads it, such as a conditional
+    jump, PUSHF or printing the flags, so the flags of an instruction that
+    are overwritten before being read are never computed.
+
+    Examples
+    --------
+    >>> flags = Flags()
+    >>> flags.last = ('sub', 3, 5, 8, None)
+    >>> flags.cf, flags.zf, flags.sf, flags.of
+    (True, False, True, False)
+    >>> flags.value
+    147
+    """
+    def __init__(self):
+        super(Flags, self).__init__('Flags')
+        self.last = INITIAL
+        self.df = False
+
+    def reset(self):
+        self.last = INITIAL
+        self.df = False
+
+    @property
+    def cf(self) -> bool:
+        return carry(self.last)
+
+    @property
+    def pf(self) -> bool:
+        return parity(self.last)
+
+    @property
+    def af(self) -> bool:
+        return adjust(self.last)
+
+    @property
+    def zf(self) -> bool:
+        return zero(self.last)
+
+    @property
+    def sf(self) -> bool:
+        return sign(self.last)
+
+    @property
+    def of(self) -> bool:
+        return overflow(self.last)
+
+    @property
+    def value(self) -> int:
+        """
+        The flags as an EFLAGS word.
+        """
+        if self.last[0] == 'set':
+            return self.last[1] | self.df << DF
+        return (RESERVED | self.cf << CF | self.pf << PF | self.af << AF |
+                self.zf << ZF | self.sf << SF | self.df << DF | self.of << OF)
+
+    @value.setter
+    def value(self, word):
+        self.last = ('set', (int(word) & STATUS_MASK) | RESERVED, 0, 32, None)
+        self.df = bool(int(word) >> DF & 1)
+
+    def test(self, condition: str) -> bool:
+        """
+        Evaluate a condition code such as 'E' or 'GE' on the flags.
+        """
+        return conditions[condition](self.last)
+
+    def __call__(self, val=None):
+        if val is not None:
+            self.value = val
+        return self.value
+
+    def __repr__(self):
+        return "Flags({0})".format(self.last)
+
+    def __str__(self):
+        return "CF={0:d} PF={1:d} AF={2:d} ZF={3:d} SF={4:d} DF={5:d} OF={6:d}".format(
+            self.cf, self.pf, self.af, self.zf, self.sf, self.df, self.of)
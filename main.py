@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
+import sys
+from time import perf_counter
 from utils import *
 from memory import Memory
-from register import Register
-from stack import Stack
+from register import Register, RegisterFile
+from stack import Stack, ByteStack
+from flags import Flags
 from commands import masm_commands
 
 
@@ -30,8 +33,8 @@ class VarType:
         Whether or not the variable type should be interpreted as signed
     bits : int
         Size of data-type in bits
-    _converted : dict(tuple, str, type)
-        Storage for all of the possible conversions of the data-type
+    descriptor : TypeDescriptor
+        The interned descriptor of the data-type
     type : type
         Numpy type for the given data-type
     word : str
@@ -45,19 +48,19 @@ class VarType:
         self.bytes = size
         self.bits = size * 8
         self.signed = signed
-        self._converted = variable_all(self.bytes, self.signed)
+        self.descriptor = type_descriptor(size, signed)
 
     @property
     def type(self):
-        return self._converted['type']
+        return self.descriptor.type
 
     @property
     def word(self):
-        return self._converted['word']
+        return self.descriptor.word
 
     @property
     def det(self):
-        return self._converted['det']
+        return self.descriptor.det
 
 
 class Processor(Component):
@@ -69,11 +72,120 @@ class Processor(Component):
     ----------
     command_list : dict
         List of commands with their callable names as the keys
+
+    Attributes
+    ----------
+    commands : dict
+        List of commands with their callable names as the keys
+
+    Notes
+    -----
+    Every command is also an attribute of the processor, copied from the
+    command list when the processor is made. bind() always looks the
+    commands up in the command list.
     """
     def __init__(self, command_list):
         super(Processor, self).__init__('Processor')
-        for k, v in command_list.items():
-            setattr(self, k, v)
+        self.commands = command_list
+        # One dict copy per processor, cheaper than setting the commands one by one
+        self.__dict__.update(command_list)
+
+    def __getattr__(self, name):
+        # Commands added to the command list after the processor was made
+        try:
+            return self.__dict__['commands'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def bind(self, program, computer, profiler=None) -> list:
+        """
+        Turn a program into threaded code for a computer.
+
+        Parameters
+        ----------
+        program : Program
+            Assembled program.
+        computer : Computer
+            Computer the program runs on.
+        profiler : Profiler, optional
+            Count the executions and time of every instruction.
+
+        Returns
+        -------
+        list(callable)
+            One pre-bound callable per instruction. Calling it executes the
+            instruction and returns the index of the next instruction if it jumps.
+        """
+        commands = [self.commands[name] for name in program.names]
+        code = [commands[opcode].bind(computer, *operands)
+                for opcode, operands in zip(program.opcodes, program.resolve(computer))]
+        if profiler is not None:
+            code = profiler.instrument(program, computer, code)
+        return code
+
+
+class RunResult:
+    """
+    Outcome of Computer.run
+
+    ...
+    Attributes
+    ----------
+    steps : int
+        Number of executed instructions.
+    elapsed : float
+        Wall time of the run in seconds.
+    ip : int
+        Index of the next instruction to execute.
+    halted : bool
+        Whether the program ran past its last instruction, as opposed to hitting max_steps.
+    """
+    def __init__(self, steps, elapsed, ip, halted):
+        self.steps = steps
+        self.elapsed = elapsed
+        self.ip = ip
+        self.halted = halted
+
+    @property
+    def ips(self) -> float:
+        """
+        Executed instructions per second.
+        """
+        return self.steps / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return "RunResult(steps={}, elapsed={}, ip={}, halted={})".format(
+            self.steps, self.elapsed, self.ip, self.halted)
+
+    def __str__(self):
+        return "Executed {} instructions in {:.6f} s ({:,.0f} instructions/sec)".format(
+            self.steps, self.elapsed, self.ips)
+
+
+class Snapshot:
+    """
+    Saved state of a Computer, see Computer.snapshot
+
+    ...
+    Attributes
+    ----------
+    registers : ndarray
+        Copy of the register buffer.
+    memory : tuple
+        State returned by Memory.snapshot.
+    stack : object
+        State returned by the snapshot method of the stack.
+    flags : tuple(tuple, bool)
+        The flags record and the direction flag, see Flags.
+    """
+    def __init__(self, registers, memory, stack, flags):
+        self.registers = registers
+        self.memory = memory
+        self.stack = stack
+        self.flags = flags
+
+    def __repr__(self):
+        return "Snapshot(memory pages={}, variables={})".format(len(self.memory[0]), len(self.memory[1]))
 
 
 class Computer:
@@ -89,6 +201,11 @@ class Computer:
         Size of stack in levels.
     command_list : str
         Instruction list to load.
+    stack_mode : ['object', 'typed'], optional
+        'object' keeps the stack as an array of python objects independent of esp,
+        'typed' keeps it as 32-bit values in a byte buffer addressed by esp, see
+        ByteStack. The typed stack is not mapped into memory, so memory operands
+        cannot address it through esp.
 
     Attributes
     ----------
@@ -96,10 +213,23 @@ class Computer:
         Holds the instructions for the computer.
     mem : Memory
         Memory holding variables of the computer.
-    reg : dict(name: Register)
-        Dictionary holding the registers of the computer, indexed by their names.
-    stack : Stack
+    reg : RegisterFile
+        The registers of the computer, indexed by their names. Every register
+        is a view into the same contiguous buffer.
+    flags : Flags
+        The status flags, computed from the last arithmetic instruction when read.
+    stack : ByteStack or Stack
         The processor stack.
+    stack_size : int
+        Size of stack in levels.
+    stack_mode : str
+        The stack mode the computer was created with.
+    profiler : Profiler or None
+        When set, run() counts the executions, time and bytes touched of every instruction in it.
+    tracer : Tracer or None
+        When set, run() records every executed instruction in it.
+    debugger : Debugger or None
+        When set and armed, run() stops at its breakpoints and watches, see Debugger.
     vt : dict(name: VarType)
         Stores all of the possible variable types for the computer
     """
@@ -110,55 +240,162 @@ class Computer:
         'SWORD' : VarType('SWORD', 2, True),
         'DWORD' : VarType('DWORD', 4, False),
         'SDWORD': VarType('SDWORD', 4, True),
-        'QWORD' : VarType('QWARD', 8, False)
+        'QWORD' : VarType('QWORD', 8, False)
     }
 
-    @staticmethod
-    def __make_registers():
+    def __init__(self, mem_size=1024, stack_size=1024, command_list='masm', stack_mode='object'):
+        if command_list == 'masm':
+            command_list = masm_commands
+
+        self.cpu = Processor(command_list)
+        self.mem = Memory(mem_size)
+        self.reg = RegisterFile()
+        self.flags = Flags()
+        if stack_mode == 'typed':
+            self.stack = ByteStack(stack_size, self.reg['esp'])
+        elif stack_mode == 'object':
+            self.stack = Stack(stack_size)
+        else:
+            raise ValueError('Unknown stack mode {0}'.format(stack_mode))
+        self.stack_size = stack_size
+        self.stack_mode = stack_mode
+        self.profiler = None
+        self.tracer = None
+        self.debugger = None
+        self._bound = (None, None, None)
+        self._compiler = None
+
+    def reset(self):
+        """
+        Clear the registers, flags, memory and stack.
+        """
+        self.reg.buffer[:] = 0
+        self.flags.reset()
+        self.mem.reset()
+        self.stack.reset()
+
+    def snapshot(self) -> Snapshot:
         """
-        Creates the 32-bit register set
+        Capture the registers, flags, memory, variable table and stack.
+
+        Memory and stack are copied page by page and only the pages written since
+        the last snapshot or restore are copied, the others are shared with the
+        earlier snapshots. Taking a snapshot costs the number of changed pages,
+        not the size of the memory and stack.
+
+        Examples
+        --------
+        >>> comp = Computer()
+        >>> comp.mem.set('x', 1, 4)
+        >>> snapshot = comp.snapshot()
+        >>> comp.mem.set('x', 2)
+        >>> comp.restore(snapshot)
+        >>> int(comp.mem.get('x').value)
+        1
+        """
+        return Snapshot(self.reg.save(), self.mem.snapshot(), self.stack.snapshot(),
+                        (self.flags.last, self.flags.df))
+
+    def restore(self, snapshot: Snapshot):
+        """
+        Bring the computer back to a snapshot, copying only the pages that differ from it.
+
+        Snapshots can be restored any number of times and in any order.
+        """
+        self.reg.restore(snapshot.registers)
+        self.flags.last, self.flags.df = snapshot.flags
+        self.mem.restore(snapshot.memory)
+        self.stack.restore(snapshot.stack)
+
+    def fork(self):
+        """
+        Create an independent computer in the state of this one.
+
+        The new computer starts from a snapshot, so only the pages that
+        were ever written are copied into it.
 
-        ...
         Returns
         -------
-        A dictionary of 32 bit registers, indexed by their names.
+        Computer
+            The copy, with the same instruction set, memory and stack size.
         """
-        reg = {'eax': Register('eax'),
-               'ebx': Register('ebx'),
-               'ecx': Register('ecx'),
-               'edx': Register('edx'),
-               'ebp': Register('ebp'),
-               'esi': Register('esi'),
-               'edi': Register('edi'),
-               'esp': Register('esp')}
-        _, reg['ax'] = reg['eax'].make_subregisters('_', 'ax')
-        reg['ah'], reg['al'] = reg['ax'].make_subregisters('ah', 'al')
+        snapshot = self.snapshot()
+        child = Computer(len(self.mem.memory), self.stack_size, self.cpu.commands, self.stack_mode)
+        child.restore(snapshot)
+        return child
 
-        _, reg['bx'] = reg['ebx'].make_subregisters('_', 'bx')
-        reg['bh'], reg['bl'] = reg['bx'].make_subregisters('bh', 'bl')
-
-        _, reg['cx'] = reg['ecx'].make_subregisters('_', 'cx')
-        reg['ch'], reg['cl'] = reg['cx'].make_subregisters('ch', 'cl')
+    def assemble(self, source):
+        """
+        Assemble source with the instruction set and variable types of the computer.
+        """
+        from assembler import assemble
+        return assemble(source, self.cpu.commands, self.vt)
 
-        _, reg['dx'] = reg['edx'].make_subregisters('_', 'dx')
-        reg['dh'], reg['dl'] = reg['dx'].make_subregisters('dh', 'dl')
+    def run(self, program, max_steps=None, start=0, load=True, jit=False):
+        """
+        Execute a program.
 
-        _, reg['bp'] = reg['ebp'].make_subregisters('_', 'bp')
-        _, reg['si'] = reg['esi'].make_subregisters('_', 'si')
-        _, reg['di'] = reg['edi'].make_subregisters('_', 'di')
-        _, reg['sp'] = reg['esp'].make_subregisters('_', 'sp')
+        Parameters
+        ----------
+        program : Program or str
+            Assembled program, or source to assemble.
+        max_steps : int, optional
+            Stop after executing this many instructions.
+        start : int, optional
+            Index of the first instruction to execute.
+        load : bool, optional
+            Whether or not to (re)initialize the .data variables of the program first.
+        jit : bool, optional
+            Whether or not to compile straight-line runs of instructions into
+            python functions, see BlockCompiler. Ignored while profiling, tracing or debugging.
 
-        return reg
+        Returns
+        -------
+        RunResult
+            Number of executed instructions, instructions per second and
+            where execution stopped.
+        """
+        if isinstance(program, str):
+            program = self.assemble(program)
+        if load:
+            program.load(self)
 
-    def __init__(self, mem_size=1024, stack_size=1024, command_list='masm'):
-        if command_list is 'masm':
-            command_list = masm_commands
+        profiler = self.profiler
+        if self._bound[0] is not program or self._bound[1] is not profiler:
+            self._bound = (program, profiler, self.cpu.bind(program, self, profiler))
+        code = self._bound[2]
 
-        self.cpu = Processor(command_list)
-        self.mem = Memory(mem_size)
-        self.reg = self.__make_registers()
-        self.stack = Stack(stack_size)
+        end = len(code)
+        limit = sys.maxsize if max_steps is None else max_steps
+        ip = start
+        steps = 0
+        begin = perf_counter()
+        if self.debugger is not None and self.debugger.armed:
+            ip, steps = self.debugger.run(self, program, code, ip, limit)
+        elif self.tracer is not None:
+            ip, steps = self.tracer.run(program, code, self.reg.buffer, ip, limit)
+        elif jit and profiler is None:
+            if self._compiler is None:
+                from compiler import BlockCompiler
+                self._compiler = BlockCompiler(self)
+            ip, steps = self._compiler.run(program, code, ip, limit)
+        else:
+            while ip < end and steps < limit:
+                target = code[ip]()
+                ip = ip + 1 if target is None else target
+                steps += 1
+        elapsed = perf_counter() - begin
+        return RunResult(steps, elapsed, ip, ip >= end)
 
 
 if __name__ == "__main__":
     comp = Computer()
+    result = comp.run('''
+    .code
+        MOV ecx, 100000
+    top:
+        ADD eax, 3
+        LOOP top
+    ''')
+    print(comp.reg['eax'].value)
+    print(result)
@@ -1,18 +1,24 @@
 #!/usr/bin/env python3
+import os
+from operator import index as _index
 from utils import *
-
+from allocator import Allocator
+from pages import PageTable
 
 
 class Variable(Active, Component):
-    def __init__(self, value, name, offset, size, signed, initialized):
+    def __init__(self, value, name, offset, size, signed, initialized, descriptor=None):
         super(Variable, self).__init__(name='Variable')
-        self._value = variable_det_to_type(size, signed)(value)
+        if descriptor is None:
+            descriptor = type_descriptor(size, signed)
+        self._value = descriptor.type(value)
         self.offset = offset
         self.size = size
         self.signed = signed
         self.name = name
         self.init = initialized
-        self.type = variable_det_to_type(size, signed)
+        self.descriptor = descriptor
+        self.type = descriptor.type
 
     @property
     def value(self):
@@ -28,7 +34,7 @@ class Variable(Active, Component):
         return "{}, {}, {}, {}".format(self.value, self.init, self.size, self.signed)
 
     def __str__(self):
-        base = "{} {}".format(variable_det_to_word(self.size, self.signed), self.name)
+        base = "{} {}".format(self.descriptor.word, self.name)
         if self.init:
             base = "{} = {}".format(base, self.value)
         return base
@@ -37,13 +43,371 @@ class Variable(Active, Component):
         return self.value
 
 
+class VariableHandle:
+    """
+    Cached typed access to one variable in memory
+
+    ...
+    Parameters
+    ----------
+    memory : Memory
+        Memory holding the variable.
+    name : str
+        Name of the variable.
+    entry : tuple(offset, size, signed, initialized)
+        The entry of the variable in Memory.variables.
+
+    Attributes
+    ----------
+    view : ndarray
+        One element view of the bytes of the variable, typed after its descriptor.
+    descriptor : TypeDescriptor
+        The type of the variable.
+
+    Notes
+    -----
+    Handles are made by Memory.handle(), which keeps one per variable and
+    hands it out again for as long as the entry of the variable is the same
+    object, so reading through a handle allocates nothing but the value and
+    writing goes straight into Memory.memory.
+    """
+    __slots__ = ('memory', 'name', 'entry', 'offset', 'size', 'signed', 'descriptor', 'view', 'page')
+
+    def __init__(self, memory, name, entry):
+        offset, size, signed, init = entry
+        self.memory = memory
+        self.name = name
+        self.entry = entry
+        self.offset = offset
+        self.size = size
+        self.signed = signed
+        self.descriptor = descriptors[size, bool(signed)]
+        self.view = memory.memory[offset:offset + size].view(self.descriptor.dtype)
+        # Index of the page the variable is on, or the slice of pages it spans
+        pages = memory.pages.page_range(offset, size)
+        self.page = pages[0] if len(pages) == 1 else slice(pages.start, pages.stop)
+
+    @property
+    def value(self):
+        if not self.entry[3]:
+            raise VariableNotInitialized('Variable {0} has not been initialized'.format(self.name))
+        return self.view[0]
+
+    @value.setter
+    def value(self, other):
+        if isinstance(other, Active):
+            other = other.value
+        self.view[0] = self.descriptor.convert(other)
+        pages = self.memory.pages
+        pages.written[self.page] = pages.epoch
+        if not self.entry[3]:
+            self.entry = (self.offset, self.size, self.signed, True)
+            self.memory.variables[self.name] = self.entry
+            self.memory.version += 1
+
+
+class Reference(Active, Component):
+    """
+    Write-through handle to a variable in memory
+
+    ...
+    Parameters
+    ----------
+    memory : Memory
+        Memory holding the variable.
+    name : str
+        Name of the variable.
+
+    Notes
+    -----
+    Unlike the Variable returned by Memory.get, which is a copy of the
+    variable, reading or assigning the value of a Reference always goes
+    to the memory. This is what instructions operate on.
+
+    The variable is looked up by name on every access through
+    Memory.handle(), so a Reference stays valid when the variable is
+    deleted and declared again, as loading a program after a reset does.
+    """
+    __slots__ = ('memory',)
+
+    def __init__(self, memory, name):
+        super(Reference, self).__init__(name=name)
+        if name not in memory.variables:
+            raise VariableNotDefined('Variable {0} has not been defined'.format(name))
+        self.memory = memory
+
+    @property
+    def value(self):
+        return self.memory.handle(self.name).value
+
+    @value.setter
+    def value(self, other):
+        self.memory.handle(self.name).value = other
+
+    @property
+    def size(self):
+        return self.memory.variables[self.name][1]
+
+    def __repr__(self):
+        return repr(self.memory.get(self.name))
+
+    def __str__(self):
+        return str(self.memory.get(self.name))
+
+    def __call__(self, val=None):
+        if val is not None:
+            self.value = val
+        return self.value
+
+
+class Address(Active, Component):
+    """
+    Memory operand at base + index * scale + displacement
+
+    ...
+    Parameters
+    ----------
+    memory : Memory
+        Memory the operand addresses.
+    base, index : Register, optional
+        32-bit registers added to the address, index multiplied by scale.
+    scale : [1, 2, 4, 8], optional
+        Multiplier of index.
+    disp : int, optional
+        Constant displacement.
+    variable : str, optional
+        Variable whose offset is added to the address, looked up on every access.
+    size : [1, 2, 4, 8], optional
+        Size of the operand in bytes.
+    signed : bool, optional
+        Whether or not the operand is read as signed.
+
+    Notes
+    -----
+    The address is computed from the registers on every access and wraps at
+    32 bits. Accesses go through Memory.load and Memory.store, so they read
+    and write the bytes as they are, whether or not a variable declared
+    there has been initialized.
+
+    Examples
+    --------
+    >>> from register import RegisterFile
+    >>> reg, mem = RegisterFile(), Memory(64)
+    >>> mem.declare_array('arr', 4, 2, values=[10, 20, 30, 40])
+    >>> reg['esi'].value = 2
+    >>> operand = Address(mem, index=reg['esi'], scale=2, variable='arr', size=2)
+    >>> int(operand.value)
+    30
+    """
+    __slots__ = ('memory', 'registers', 'base', 'index', 'scale', 'disp', 'variable', 'size', 'signed', 'descriptor')
+
+    def __init__(self, memory, base=None, index=None, scale=1, disp=0, variable=None, size=4, signed=False):
+        super(Address, self).__init__(name='Address')
+        if variable is not None and variable not in memory.variables:
+            raise VariableNotDefined('Variable {0} has not been defined'.format(variable))
+        dword = descriptors[4, False].dtype
+        self.memory = memory
+        self.registers = (base, index)
+        # One element views of the registers, read without recombining their bytes
+        self.base = None if base is None else base.mem.view(dword)
+        self.index = None if index is None else index.mem.view(dword)
+        self.scale = scale
+        self.disp = disp
+        self.variable = variable
+        self.size = size
+        self.signed = signed
+        self.descriptor = type_descriptor(size, signed)
+
+    def address(self, buffer=None) -> int:
+        """
+        The effective address of the operand.
+
+        Parameters
+        ----------
+        buffer : ndarray, optional
+            Copy of the RegisterFile.buffer the registers live in, to compute
+            the address from instead of their current values.
+        """
+        address = self.disp
+        if self.variable is not None:
+            try:
+                address += self.memory.variables[self.variable][0]
+            except KeyError:
+                raise VariableNotDefined('Variable {0} has not been defined'.format(self.variable))
+        if buffer is None:
+            if self.base is not None:
+                address += int(self.base[0])
+            if self.index is not None:
+                address += int(self.index[0]) * self.scale
+        else:
+            base, index = self.registers
+            if base is not None:
+                address += int(base.descriptor.unpack(buffer[base._range]))
+            if index is not None:
+                address += int(index.descriptor.unpack(buffer[index._range])) * self.scale
+        return address & 0xFFFFFFFF
+
+    @property
+    def value(self):
+        return self.memory.load(self.address(), self.size, self.signed)
+
+    @value.setter
+    def value(self, other):
+        if isinstance(other, Active):
+            other = other.value
+        self.memory.store(self.address(), self.size, self.descriptor.convert(other))
+
+    def __repr__(self):
+        return 'Address({0:#x}, {1})'.format(self.address(), self.descriptor.word)
+
+    def __str__(self):
+        return '{0} PTR [{1:#x}]'.format(self.descriptor.word, self.address())
+
+    def __call__(self, val=None):
+        if val is not None:
+            self.value = val
+        return self.value
+
+
 class Memory(Component):
-    def __init__(self, size):
+    """
+    Byte addressed memory holding the variables of a computer
+
+    ...
+    Parameters
+    ----------
+    size : int
+        Size of memory in bytes.
+    alignment : int, optional
+        Alignment of every variable in bytes.
+    path : str, optional
+        File to keep the memory in. The file is memory-mapped, so only the
+        pages that are actually touched cost RAM. An existing file is overwritten,
+        use Memory.open() to reopen an image written by flush().
+
+    Attributes
+    ----------
+    memory : ndarray or np.memmap
+        The bytes of the memory.
+    allocator : Allocator
+        Hands out the byte ranges of the variables.
+    variables : dict(name: tuple(offset, size, signed, initialized))
+        Every variable in memory.
+    path : str or None
+        File backing the memory, None for in-RAM memory.
+    arrays : dict(name: int)
+        Number of elements of every array variable. The entry of an array in
+        variables describes its first element, so an array used as an
+        operand reads and writes its first element like in MASM.
+    pages : PageTable
+        Tracks the pages written through set(), dell() and reset(), for snapshot().
+    handles : dict(name: VariableHandle)
+        The handle of every variable read or written through handle().
+    views : dict(TypeDescriptor: ndarray)
+        Typed views of the whole memory, the aligned accesses of load() and
+        store() index them instead of slicing and combining bytes.
+    version : int
+        Advanced whenever the variable table changes, by a variable being
+        declared, deleted or initialized, so derived state can tell it is stale.
+
+    Examples
+    --------
+    >>> mem = Memory(64)
+    >>> mem.declare_array('arr', 4, 2, values=[1, 2, 3, 4])
+    >>> mem.array('arr')
+    array([1, 2, 3, 4], dtype='>u2')
+    >>> mem.write_array('arr', [7, 8], start=2)
+    >>> int(mem.element('arr', 3))
+    8
+    """
+    def __init__(self, size, alignment=1, path=None):
         # super(Memory, self).__init__('Memory')
         Component.__init__(self, 'Memory')
-        self.memory = np.zeros((size,), dtype=np.uint8)
-        self.offset = 0
+        self.path = path
+        if path is None:
+            self.memory = np.zeros((size,), dtype=np.uint8)
+        else:
+            self.memory = np.memmap(path, dtype=np.uint8, mode='w+', shape=(size,))
+        self.allocator = Allocator(size, alignment)
         self.variables = {}
+        self.arrays = {}
+        self.handles = {}
+        self.views = {}
+        self.version = 0
+        self._uninitialized = None
+        self.pages = PageTable(size)
+
+    @staticmethod
+    def table_path(path):
+        """
+        Name of the file holding the variable table of the memory image at path.
+        """
+        return '{0}.vars.json'.format(path)
+
+    @classmethod
+    def open(cls, path, mode='r+'):
+        """
+        Reopen a memory image written by flush().
+
+        Parameters
+        ----------
+        path : str
+            File holding the memory image.
+        mode : ['r+', 'r', 'c'], optional
+            np.memmap mode: 'r+' writes changes back to the image, 'r' opens it
+            read only and 'c' keeps changes in private copy-on-write pages.
+
+        Returns
+        -------
+        Memory
+            Memory backed by the image, with the variable table of the last flush().
+        """
+        import json
+        with open(cls.table_path(path)) as table:
+            table = json.load(table)
+
+        memory = cls.__new__(cls)
+        Component.__init__(memory, 'Memory')
+        memory.path = path
+        memory.memory = np.memmap(path, dtype=np.uint8, mode=mode, shape=(table['allocator']['size'],))
+        memory.allocator = Allocator(0)
+        memory.allocator.load(table['allocator'])
+        memory.variables = {name: tuple(variable) for name, variable in table['variables'].items()}
+        memory.arrays = dict(table.get('arrays', {}))
+        memory.handles = {}
+        memory.views = {}
+        memory.version = 0
+        memory._uninitialized = None
+        memory.pages = PageTable(len(memory.memory))
+        memory.pages.touch_all()
+        return memory
+
+    def flush(self):
+        """
+        Write a file backed memory and its variable table to disk.
+        """
+        if self.path is None:
+            raise ValueError('Memory is not backed by a file')
+        if self.memory.mode not in ('r+', 'w+'):
+            raise ValueError('Memory image {0} was opened with mode {1}'.format(self.path, self.memory.mode))
+        self.memory.flush()
+
+        import json
+        table = {'allocator': self.allocator.dump(),
+                 'variables': {name: (offset, size, bool(signed), init)
+                               for name, (offset, size, signed, init) in self.variables.items()},
+                 'arrays': self.arrays}
+        temp_path = '{0}.tmp'.format(self.table_path(self.path))
+        with open(temp_path, 'w') as temp:
+            json.dump(table, temp)
+        os.replace(temp_path, self.table_path(self.path))
+
+    @property
+    def offset(self):
+        return self.allocator.top
+
+    def stats(self):
+        return self.allocator.stats()
 
     def __call__(self, name, *args, **kwargs):
         if len(args) == 0 and len(kwargs) == 0:
@@ -69,9 +433,7 @@ class Memory(Component):
         else:
             if name in self.variables:
                 raise VariableAlreadyDefined()
-            # update the offset
-            curr = self.offset
-            self.offset += size
+            curr = None
 
         # Not initializing, value remains 0
         if variable is None:
@@ -79,31 +441,38 @@ class Memory(Component):
                 raise VariableAlreadyDefined()
             init = False
 
-        # Setting value in memory
+        # Converting the value before allocating so a bad value does not leak memory
         else:
             if isinstance(variable, Active):
                 variable = variable.value
-            variable = variable_det_to_type(size, signed)(variable)
-            value = split_number(variable, size)
-            self.memory[curr:curr + size] = value
+            descriptor = type_descriptor(size, signed)
+            value = descriptor.pack(descriptor.type(variable))
             init = True
 
+        if curr is None:
+            curr = self.allocator.alloc(size)
+
+        # Setting value in memory
+        if init:
+            self.memory[curr:curr + size] = value
+            self.pages.touch(curr, size)
+
         # Adding variable to variable list
         self.variables[name] = (curr, size, signed, init)
+        self.version += 1
 
     def __getitem__(self, key):
         return self.get(key)
 
-    @dispatch(str, object)
+    @accepts((str, object))
     def __setitem__(self, key, value):
-        self.set(key, value.value)
-
-    @dispatch(str, int)
-    def __setitem__(self, key, value):
-        if key not in self.variables:
-            self.set(key, value, 4)
+        if isinstance(value, int):
+            if key not in self.variables:
+                self.set(key, value, 4)
+            else:
+                self.set(key, value)
         else:
-            self.set(key, value)
+            self.set(key, value.value)
 
     def get(self, name):
 
@@ -112,8 +481,274 @@ class Memory(Component):
         except KeyError:
             raise VariableNotDefined('Variable {0} has not been defined'.format(name))
 
-        value = self.memory[offset:offset + size]
-        return Variable(combine_number(value, signed), name, offset, size, signed, init)
+        descriptor = descriptors[size, bool(signed)]
+        value = descriptor.unpack(self.memory[offset:offset + size])
+        return Variable(value, name, offset, size, signed, init, descriptor)
+
+    def handle(self, name) -> VariableHandle:
+        """
+        The cached handle of a variable, made again only when its entry in variables changed.
+        """
+        try:
+            entry = self.variables[name]
+        except KeyError:
+            raise VariableNotDefined('Variable {0} has not been defined'.format(name))
+        handle = self.handles.get(name)
+        if handle is None or handle.entry is not entry:
+            handle = self.handles[name] = VariableHandle(self, name, entry)
+        return handle
+
+    def read(self, name) -> np.generic:
+        """
+        The value of a variable as a numpy scalar, without building a Variable.
+        """
+        return self.handle(name).value
+
+    def check(self, offset, size):
+        """
+        Raise InvalidAddress unless a range of bytes lies inside the memory.
+        """
+        if offset < 0 or size < 0 or offset + size > len(self.memory):
+            raise InvalidAddress('Bytes {0} to {1} are outside of memory of size {2}'.format(
+                offset, offset + size, len(self.memory)))
+
+    def read_bytes(self, offset, size):
+        """
+        Returns
+        -------
+        ndarray(np.uint8)
+            A view of a range of bytes of the memory.
+        """
+        self.check(offset, size)
+        return self.memory[offset:offset + size]
+
+    def write_bytes(self, offset, data):
+        """
+        Write raw bytes to the memory.
+
+        Variables overlapping the written bytes become initialized.
+        """
+        size = len(data)
+        self.check(offset, size)
+        if size == 0:
+            return
+        self.memory[offset:offset + size] = data
+        self.pages.touch(offset, size)
+        self._initialize(offset, size)
+
+    def _initialize(self, offset, size):
+        """
+        Mark the uninitialized variables overlapping a range of bytes initialized.
+        """
+        if self._uninitialized is None or self._uninitialized[0] != self.version:
+            # Kept until the variable table changes, so most writes check an empty list
+            self._uninitialized = (self.version, [
+                (curr, curr + self.extent(name), name)
+                for name, (curr, var_size, signed, init) in self.variables.items() if not init])
+        end = offset + size
+        for start, stop, name in self._uninitialized[1]:
+            if start < end and offset < stop:
+                curr, var_size, signed, init = self.variables[name]
+                self.variables[name] = (curr, var_size, signed, True)
+                self.version += 1
+
+    def view(self, descriptor) -> np.ndarray:
+        """
+        Returns
+        -------
+        ndarray
+            View of the whole memory as elements of a type, element i
+            holding the bytes at offset i * descriptor.size.
+        """
+        view = self.views.get(descriptor)
+        if view is None:
+            size = descriptor.size
+            view = self.views[descriptor] = self.memory[:len(self.memory) // size * size].view(descriptor.dtype)
+        return view
+
+    def load(self, address, width, signed=False) -> np.generic:
+        """
+        Read a number from an address.
+
+        Parameters
+        ----------
+        address : int
+            Offset of the first byte.
+        width : [1, 2, 4, 8]
+            Size of the number in bytes.
+        signed : bool, optional
+            Whether or not the number is signed.
+
+        Returns
+        -------
+        numpy integer type
+            The number, typed after width and signed.
+
+        Raises
+        ------
+        InvalidAddress
+            If a byte of the number is outside of memory.
+        """
+        descriptor = descriptors[width, bool(signed)]
+        if address % width == 0 and 0 <= address and address + width <= len(self.memory):
+            return self.view(descriptor)[address // width]
+        # Unaligned or out of range, which check() reports
+        self.check(address, width)
+        return descriptor.unpack(self.memory[address:address + width])
+
+    def store(self, address, width, value):
+        """
+        Write a number to an address, wrapping negative numbers to two's complement.
+
+        Variables overlapping the written bytes become initialized.
+
+        Raises
+        ------
+        ValueError
+            If the number does not fit width, see split_number().
+        InvalidAddress
+            If a byte of the number is outside of memory.
+        """
+        descriptor = descriptors[width, False]
+        value = _index(value)
+        if value > descriptor.mask or value < -((descriptor.mask + 1) >> 1):
+            raise ValueError('{0} is too big for size {1}'.format(value, width))
+        if address % width == 0 and 0 <= address and address + width <= len(self.memory):
+            self.view(descriptor)[address // width] = value & descriptor.mask
+        else:
+            self.check(address, width)
+            self.memory[address:address + width] = descriptor.pack(value)
+        pages = self.pages
+        page = address // pages.page_size
+        if (address + width - 1) // pages.page_size == page:
+            pages.written[page] = pages.epoch
+        else:
+            pages.touch(address, width)
+        self._initialize(address, width)
+
+    def extent(self, name) -> int:
+        """
+        Number of bytes of a variable, all of the elements of an array.
+        """
+        return self.variables[name][1] * self.arrays.get(name, 1)
+
+    def declare_array(self, name, length, size, signed=False, values=None):
+        """
+        Allocate an array of length elements of size bytes.
+
+        Parameters
+        ----------
+        name : str
+            Name of the array.
+        length : int
+            Number of elements.
+        size : [1, 2, 4, 8]
+            Size of every element in bytes.
+        signed : bool, optional
+            Whether or not the elements are signed.
+        values : array_like, optional
+            Initial value of every element, leaves the array uninitialized when None.
+        """
+        if name in self.variables:
+            raise VariableAlreadyDefined()
+        if length < 1:
+            raise InvalidSize('Array {0} needs at least one element'.format(name))
+        if values is not None:
+            # Converting the values before allocating so bad values do not leak memory
+            values = np.asarray(values, dtype=type_descriptor(size, signed).dtype)
+            if values.shape != (length,):
+                raise InvalidSize('Array {0} has {1} elements, got {2} values'.format(name, length, values.size))
+        offset = self.allocator.alloc(length * size)
+        self.variables[name] = (offset, size, signed, values is not None)
+        self.arrays[name] = length
+        self.version += 1
+        if values is not None:
+            self._view(name)[:] = values
+            self.pages.touch(offset, length * size)
+
+    def _view(self, name) -> np.ndarray:
+        try:
+            offset, size, signed, init = self.variables[name]
+        except KeyError:
+            raise VariableNotDefined('Variable {0} has not been defined'.format(name))
+        length = self.arrays.get(name, 1)
+        return self.memory[offset:offset + length * size].view(descriptors[size, bool(signed)].dtype)
+
+    def array(self, name) -> np.ndarray:
+        """
+        Returns
+        -------
+        ndarray
+            Read-only view of the elements of an array, typed after the
+            elements. A scalar variable is an array of one element.
+        """
+        view = self._view(name)
+        if not self.variables[name][3]:
+            raise VariableNotInitialized('Variable {0} has not been initialized'.format(name))
+        view.flags.writeable = False
+        return view
+
+    def write_array(self, name, values, start=0):
+        """
+        Write consecutive elements of an array in a single slice assignment,
+        marking the array initialized.
+
+        Parameters
+        ----------
+        name : str
+            Name of the array.
+        values : array_like
+            Values of the elements, a scalar sets every element from start on.
+        start : int, optional
+            Index of the first element written.
+        """
+        view = self._view(name)
+        values = np.asarray(values, dtype=view.dtype)
+        stop = len(view) if values.ndim == 0 else start + len(values)
+        if start < 0 or stop > len(view):
+            raise IndexError('Elements {0} to {1} are outside of array {2} of {3} elements'.format(
+                start, stop, name, len(view)))
+        view[start:stop] = values
+        offset, size, signed, init = self.variables[name]
+        self.pages.touch(offset + start * size, (stop - start) * size)
+        if not init:
+            self.variables[name] = (offset, size, signed, True)
+            self.version += 1
+
+    def element(self, name, index) -> np.generic:
+        """
+        The value of one element of an array, read straight from memory.
+        """
+        view = self._view(name)
+        if not self.variables[name][3]:
+            raise VariableNotInitialized('Variable {0} has not been initialized'.format(name))
+        if not 0 <= index < len(view):
+            raise IndexError('Element {0} is outside of array {1} of {2} elements'.format(index, name, len(view)))
+        return view[index]
+
+    def set_element(self, name, index, value):
+        """
+        Assign one element of an array.
+        """
+        self.write_array(name, [value], start=index)
+
+    def clear(self, name):
+        """
+        Zero every byte of a variable or array and mark it uninitialized, as declared without a value.
+        """
+        try:
+            offset, size, signed, init = self.variables[name]
+        except KeyError:
+            raise VariableNotDefined('Variable {0} has not been defined'.format(name))
+        extent = self.extent(name)
+        self.memory[offset:offset + extent] = 0
+        self.pages.touch(offset, extent)
+        if init:
+            self.variables[name] = (offset, size, signed, False)
+            self.version += 1
+
+    def reference(self, name):
+        return Reference(self, name)
 
     def dell(self, name):
         try:
@@ -121,8 +756,106 @@ class Memory(Component):
         except KeyError:
             raise VariableNotDefined()
 
-        self.memory[offset:offset + size] = [0] * size
+        size = self.extent(name)
+        self.memory[offset:offset + size] = 0
+        self.pages.touch(offset, size)
+        self.allocator.release(offset)
         del self.variables[name]
+        self.arrays.pop(name, None)
+        self.handles.pop(name, None)
+        self.version += 1
+
+    def reset(self):
+        """
+        Delete every variable and clear the memory.
+        """
+        self.memory[:] = 0
+        self.pages.touch_all()
+        self.allocator.reset()
+        self.variables.clear()
+        self.arrays.clear()
+        self.handles.clear()
+        self.version += 1
+
+    def snapshot(self):
+        """
+        Capture the memory bytes, variable table, arrays and allocator.
+
+        Only the pages written since the last snapshot or restore are copied,
+        see PageTable.
+
+        Returns
+        -------
+        tuple
+            State to pass to restore().
+        """
+        return (self.pages.snapshot(self.memory), dict(self.variables), dict(self.arrays),
+                self.allocator.dump())
+
+    def dirty_pages(self) -> np.ndarray:
+        """
+        Indices of the pages written since the last clear_dirty(), by set(),
+        dell(), stores, array and byte writes, handles or restore().
+
+        Multiply by pages.page_size for their offsets.
+        """
+        return self.pages.dirty_pages()
+
+    def clear_dirty(self):
+        """
+        Start tracking dirty_pages() afresh.
+        """
+        self.pages.clear_dirty()
+
+    def diff(self, since):
+        """
+        The bytes that changed since a snapshot.
+
+        Only the pages written since the snapshot are compared, so the cost
+        follows the amount of memory written rather than the size of the
+        memory. The variable table is not compared.
+
+        Parameters
+        ----------
+        since : tuple
+            State returned by snapshot().
+
+        Returns
+        -------
+        offsets : ndarray(np.int64)
+            Offset of every changed byte, in increasing order.
+        before : ndarray(np.uint8)
+            Their values in the snapshot.
+        after : ndarray(np.uint8)
+            Their current values.
+
+        Examples
+        --------
+        >>> mem = Memory(1024)
+        >>> mem.set('x', 1, 2)
+        >>> checkpoint = mem.snapshot()
+        >>> mem.set('x', 258)
+        >>> offsets, before, after = mem.diff(checkpoint)
+        >>> offsets.tolist(), before.tolist(), after.tolist()
+        ([0, 1], [0, 1], [1, 2])
+        """
+        return self.pages.diff(self.memory, since[0])
+
+    def restore(self, state):
+        """
+        Bring the memory back to a state returned by snapshot().
+        """
+        pages, variables, arrays, allocator = state
+        self.pages.restore(self.memory, pages)
+        self.variables.clear()
+        self.variables.update(variables)
+        self.version += 1
+        self.arrays.clear()
+        self.arrays.update(arrays)
+        self.allocator.load(allocator)
+
+
+dispatch_classes.append(Memory)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+from utils import *
+
+
+class PageSnapshot:
+    """
+    Copy-on-write image of a paged buffer
+
+    ...
+    Parameters
+    ----------
+    parent : PageSnapshot or None
+        The snapshot the buffer was derived from when this one was taken,
+        None for a buffer that only held zeros.
+    pages : dict(index: ndarray)
+        Copies of the pages written since parent.
+
+    Attributes
+    ----------
+    depth : int
+        Number of snapshots in the chain up to and including this one.
+
+    Notes
+    -----
+    A snapshot only holds the pages that changed since its parent, every
+    other page is looked up along the chain of parents, and a page found
+    in none of them is all zeros. PageTable collapses chains longer than
+    its max_depth, see collapse().
+    """
+    def __init__(self, parent, pages):
+        self.parent = parent
+        self.pages = pages
+        self.depth = 1 if parent is None else parent.depth + 1
+
+    def page(self, index):
+        """
+        Returns
+        -------
+        ndarray or None
+            The content of a page, None if it is all zeros.
+        """
+        snapshot = self
+        while snapshot is not None:
+            if index in snapshot.pages:
+                return snapshot.pages[index]
+            snapshot = snapshot.parent
+        return None
+
+    def collapse(self) -> 'PageSnapshot':
+        """
+        An equivalent snapshot without parent, holding the pages of the whole chain.
+
+        The pages are shared with the chain rather than copied, and the
+        ancestors are no longer kept alive by the new snapshot.
+        """
+        pages = {}
+        snapshot = self
+        while snapshot is not None:
+            for index, page in snapshot.pages.items():
+                pages.setdefault(index, page)
+            snapshot = snapshot.parent
+        return PageSnapshot(None, pages)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __repr__(self):
+        return "PageSnapshot(depth={}, pages={})".format(self.depth, sorted(self.pages))
+
+
+class PageTable(Component):
+    """
+    Tracks which pages of a byte buffer were written, for copy-on-write snapshots
+
+    ...
+    Parameters
+    ----------
+    size : int
+        Size of the tracked buffer in bytes.
+    page_size : int, optional
+        Size of every page in bytes.
+    max_depth : int, optional
+        Longest chain of snapshots, a snapshot that would be deeper is collapsed.
+
+    Attributes
+    ----------
+    page_size : int
+        Size of every page in bytes.
+    written : ndarray(np.uint64)
+        For every page, the epoch it was last written in, 0 if never.
+    epoch : int
+        The current epoch, advanced by every snapshot and restore.
+    base : PageSnapshot or None
+        The snapshot the buffer was last taken as or restored to.
+    base_epoch : int
+        The epoch base was taken or restored in, pages written after it are dirty.
+    cleared_epoch : int
+        The epoch of the last clear_dirty(), pages written after it are
+        returned by dirty_pages().
+
+    Notes
+    -----
+    Whoever writes the buffer has to touch() the written bytes, writes that
+    bypass the table are missed by snapshots and restores.
+
+    Looking a page up costs the depth of the snapshot chain, and a snapshot
+    keeps all of its ancestors alive. Every max_depth snapshots, the new
+    snapshot is collapsed into one holding the pages of its whole chain,
+    which bounds both and lets the ancestors nobody else holds go.
+
+    The table keeps two independent notions of dirty: dirty() is relative
+    to the last snapshot or restore and drives copy-on-write, dirty_pages()
+    is relative to the last clear_dirty() and is left to the user. Pages
+    copied by a restore count as written for dirty_pages() only.
+
+    Examples
+    --------
+    >>> buffer = np.zeros(16, dtype=np.uint8)
+    >>> pages = PageTable(16, page_size=4)
+    >>> buffer[5] = 1; pages.touch(5, 1)
+    >>> snapshot = pages.snapshot(buffer)
+    >>> sorted(snapshot.pages)
+    [1]
+    >>> buffer[5] = buffer[12] = 2; pages.touch(5, 1); pages.touch(12, 1)
+    >>> pages.restore(buffer, snapshot)
+    [1, 3]
+    >>> buffer.tolist()[4:8], int(buffer[12])
+    ([0, 1, 0, 0], 0)
+    """
+    def __init__(self, size, page_size=256, max_depth=64):
+        super(PageTable, self).__init__('PageTable')
+        self.page_size = page_size
+        self.max_depth = max_depth
+        self.written = np.zeros(((size + page_size - 1) // page_size,), dtype=np.uint64)
+        self.epoch = 1
+        self.base = None
+        self.base_epoch = 0
+        self.cleared_epoch = 0
+
+    def __len__(self):
+        return len(self.written)
+
+    def page_range(self, offset, size):
+        """
+        Indices of the pages holding a range of bytes.
+        """
+        if size <= 0:
+            return range(0)
+        return range(offset // self.page_size, (offset + size - 1) // self.page_size + 1)
+
+    def touch(self, offset, size):
+        """
+        Mark a range of bytes as written.
+        """
+        if size > 0:
+            self.written[offset // self.page_size:(offset + size - 1) // self.page_size + 1] = self.epoch
+
+    def touch_pages(self, indices):
+        """
+        Mark pages as written.
+        """
+        self.written[indices] = self.epoch
+
+    def touch_all(self):
+        self.written[:] = self.epoch
+
+    def dirty(self):
+        """
+        Returns
+        -------
+        ndarray
+            Indices of the pages written since the last snapshot or restore.
+        """
+        return np.flatnonzero(self.written > self.base_epoch)
+
+    def dirty_pages(self):
+        """
+        Returns
+        -------
+        ndarray
+            Indices of the pages written since the last clear_dirty().
+        """
+        return np.flatnonzero(self.written > self.cleared_epoch)
+
+    def clear_dirty(self):
+        """
+        Forget the pages written so far, for dirty_pages().
+        """
+        self.cleared_epoch = self.epoch
+        self.epoch += 1
+
+    def snapshot(self, buffer) -> PageSnapshot:
+        """
+        Take a snapshot of the buffer, copying only the pages written since the last snapshot or restore.
+        """
+        size = self.page_size
+        pages = {}
+        for index in self.dirty().tolist():
+            pages[index] = buffer[index * size:(index + 1) * size].copy()
+        snapshot = PageSnapshot(self.base, pages)
+        if snapshot.depth > self.max_depth:
+            snapshot = snapshot.collapse()
+        self._rebase(snapshot)
+        return snapshot
+
+    def restore(self, buffer, snapshot: PageSnapshot) -> list:
+        """
+        Bring the buffer back to a snapshot, copying only the pages that differ from it.
+
+        The snapshot may have been taken from another buffer of the same
+        size, which is how a computer is forked.
+
+        Returns
+        -------
+        list(int)
+            Indices of the copied pages.
+        """
+        changed = self.changed(snapshot)
+        size = self.page_size
+        for index in changed:
+            page = snapshot.page(index)
+            if page is None:
+                buffer[index * size:(index + 1) * size] = 0
+            else:
+                buffer[index * size:(index + 1) * size] = page
+        # Written in the epoch the rebase closes, so they are not dirty for the next snapshot
+        self.touch_pages(sorted(changed))
+        self._rebase(snapshot)
+        return sorted(changed)
+
+    def changed(self, snapshot: PageSnapshot) -> set:
+        """
+        Indices of the pages in which the buffer may differ from a snapshot.
+
+        These are the pages written since the last snapshot or restore and
+        the pages stored between the common ancestor of base and snapshot
+        and either of them, every other page is shared.
+        """
+        changed = set(self.dirty().tolist())
+        current = self.base
+        target = snapshot
+        while current is not target:
+            if target is None or (current is not None and current.depth >= target.depth):
+                changed.update(current.pages)
+                current = current.parent
+            else:
+                changed.update(target.pages)
+                target = target.parent
+        return changed
+
+    def diff(self, buffer, snapshot: PageSnapshot) -> tuple:
+        """
+        The bytes in which the buffer differs from a snapshot.
+
+        Only the pages returned by changed() are compared, so the cost is
+        that of the pages written since the snapshot, not of the buffer.
+
+        Returns
+        -------
+        offsets : ndarray(np.int64)
+            Offset of every differing byte, in increasing order.
+        before : ndarray(np.uint8)
+            Their values in the snapshot.
+        after : ndarray(np.uint8)
+            Their values in the buffer.
+
+        Examples
+        --------
+        >>> buffer = np.zeros(16, dtype=np.uint8)
+        >>> pages = PageTable(16, page_size=4)
+        >>> snapshot = pages.snapshot(buffer)
+        >>> buffer[9] = 7; pages.touch(8, 4)
+        >>> offsets, before, after = pages.diff(buffer, snapshot)
+        >>> offsets.tolist(), before.tolist(), after.tolist()
+        ([9], [0], [7])
+        """
+        size = self.page_size
+        offsets, before, after = [], [], []
+        for index in sorted(self.changed(snapshot)):
+            current = buffer[index * size:(index + 1) * size]
+            page = snapshot.page(index)
+            if page is None:
+                page = np.zeros(len(current), dtype=np.uint8)
+            differ = np.flatnonzero(current != page)
+            if len(differ):
+                offsets.append(differ + index * size)
+                before.append(page[differ])
+                after.append(current[differ])
+        if not offsets:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.uint8)
+        return np.concatenate(offsets).astype(np.int64), np.concatenate(before), np.concatenate(after)
+
+    def _rebase(self, snapshot):
+        self.base = snapshot
+        self.base_epoch = self.epoch
+        self.epoch += 1
+
+    def __repr__(self):
+        return "PageTable(pages={}, page_size={}, dirty={})".format(
+            len(self), self.page_size, self.dirty().tolist())
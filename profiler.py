@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+from time import perf_counter
+from utils import *
+
+
+class ProgramProfile:
+    """
+    Counters of every instruction of one program
+
+    ...
+    Attributes
+    ----------
+    program : Program
+        The profiled program.
+    counts : list(int)
+        Number of completed executions of every instruction.
+    times : list(float)
+        Cumulative wall time of every instruction in seconds.
+    footprints : list(tuple(int, int))
+        Bytes of memory and registers one execution of every instruction touches.
+    """
+    def __init__(self, program, footprints):
+        self.program = program
+        self.counts = [0] * len(program)
+        self.times = [0.0] * len(program)
+        self.footprints = footprints
+
+    def reset(self):
+        self.counts[:] = [0] * len(self.counts)
+        self.times[:] = [0.0] * len(self.times)
+
+
+class Profiler(Component):
+    """
+    Per-instruction execution counters and cost accounting
+
+    ...
+    Attributes
+    ----------
+    profiles : dict(id: ProgramProfile)
+        The counters of every program run while the profiler was enabled.
+
+    Notes
+    -----
+    Profiling is enabled by setting Computer.profiler. Processor.bind then
+    wraps every bound instruction in a counting closure; without a profiler
+    the plain bound instructions run, so a disabled profiler costs nothing.
+    Computer.run ignores jit while profiling, since compiled blocks bypass
+    the instructions. An instruction that raises is not counted.
+
+    Examples
+    --------
+    >>> from main import Computer
+    >>> comp = Computer()
+    >>> comp.profiler = Profiler()
+    >>> result = comp.run('''
+    ...     MOV ecx, 10
+    ... top:
+    ...     ADD eax, ecx
+    ...     LOOP top
+    ... ''')
+    >>> {name: row['count'] for name, row in comp.profiler.by_opcode().items()}
+    {'MOV': 1, 'ADD': 10, 'LOOP': 10}
+    """
+    def __init__(self):
+        super(Profiler, self).__init__('Profiler')
+        self.profiles = {}
+
+    def instrument(self, program, computer, code) -> list:
+        """
+        Wrap the bound instructions of a program in counters.
+
+        Parameters
+        ----------
+        program : Program
+            The program code was bound from.
+        computer : Computer
+            The computer code was bound to.
+        code : list(callable)
+            The bound instructions, see Processor.bind.
+
+        Returns
+        -------
+        list(callable)
+            The instructions, counting their executions and time.
+        """
+        if id(program) not in self.profiles:
+            commands = computer.cpu.commands
+            footprints = [commands[program.mnemonic(i)].footprint(computer, *operands)
+                          for i, operands in enumerate(program.resolve(computer))]
+            self.profiles[id(program)] = ProgramProfile(program, footprints)
+        profile = self.profiles[id(program)]
+        counts = profile.counts
+        times = profile.times
+
+        def counted(index, handler):
+            def instruction():
+                begin = perf_counter()
+                target = handler()
+                times[index] += perf_counter() - begin
+                counts[index] += 1
+                return target
+            return instruction
+
+        return [counted(index, handler) for index, handler in enumerate(code)]
+
+    def reset(self):
+        """
+        Zero every counter.
+        """
+        for profile in self.profiles.values():
+            profile.reset()
+
+    def _rows(self, key) -> dict:
+        rows = {}
+        for profile in self.profiles.values():
+            program = profile.program
+            for i, (count, time) in enumerate(zip(profile.counts, profile.times)):
+                row = rows.setdefault(key(program, i), {'count': 0, 'time': 0.0,
+                                                        'memory_bytes': 0, 'register_bytes': 0})
+                memory, registers = profile.footprints[i]
+                row['count'] += count
+                row['time'] += time
+                row['memory_bytes'] += count * memory
+                row['register_bytes'] += count * registers
+        return rows
+
+    def by_opcode(self) -> dict:
+        """
+        Returns
+        -------
+        dict(mnemonic: dict)
+            For every opcode, its execution count, cumulative time in seconds and
+            bytes of memory and registers touched, summed over every program.
+        """
+        return self._rows(lambda program, i: program.mnemonic(i))
+
+    def by_line(self) -> dict:
+        """
+        Returns
+        -------
+        dict(tuple(Program, line): dict)
+            The counters of by_opcode() for every source line of every program.
+        """
+        return self._rows(lambda program, i: (program, program.lines[i]))
+
+    def report(self, limit: int=20) -> str:
+        """
+        Tables of the opcodes and source lines that took the most time.
+        """
+        header = '{0:<32}{1:>12}{2:>12}{3:>12}{4:>12}'.format('', 'count', 'time (s)', 'mem bytes', 'reg bytes')
+        row = '{0:<32}{1[count]:>12}{1[time]:>12.6f}{1[memory_bytes]:>12}{1[register_bytes]:>12}'
+
+        lines = ['opcode' + header[6:]]
+        opcodes = sorted(self.by_opcode().items(), key=lambda item: -item[1]['time'])
+        lines += [row.format(name, counters) for name, counters in opcodes[:limit]]
+
+        lines += ['', 'line' + header[4:]]
+        for (program, number), counters in sorted(self.by_line().items(), key=lambda item: -item[1]['time'])[:limit]:
+            source = program.source.splitlines()[number - 1].strip() if program.source else ''
+            lines.append(row.format('{0:>4}  {1}'.format(number, source)[:31], counters))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.report()
@@ -29,10 +29,14 @@ class Register(Component, Active):
         The size of the register in bits
     size : int
         The size of the register in bytes
+    descriptor : TypeDescriptor
+        The unsigned type of the register
     _range : slice
         The range the current register has on the main memory array
     _value : ndarray
-        The current value of the register stored as an array of bytes
+        The memory the register lives in, shared with its parent and sub-registers
+    _view : ndarray
+        Precomputed view of the bytes of _value covered by _range
     value : ?
         The current value of the register converted into the registers dtype
     mem : ndarray
@@ -65,24 +69,43 @@ class Register(Component, Active):
         self.use = use
         self.bits = size
         self.size = size // 8
+        self.descriptor = type_descriptor(self.size)
         if subregister is None:
             self._range = slice(0, size // 8)
             self._value = np.zeros((size // 8,), dtype=np.uint8)
         else:
             self._range = subregister[0]
             self._value = subregister[1]
+        self._view = self._value[self._range]
+
+    def clone(self, buffer: np.ndarray) -> 'Register':
+        """
+        A register with the same name, size and byte range as this one over another buffer.
+
+        Skips __init__, which makes cloning much cheaper than building a register.
+        """
+        reg = Register.__new__(Register)
+        reg.name = self.name
+        reg.use = self.use
+        reg.bits = self.bits
+        reg.size = self.size
+        reg.descriptor = self.descriptor
+        reg._range = self._range
+        reg._value = buffer
+        reg._view = buffer[self._range]
+        return reg
 
     @property
     def value(self):
-        return combine_number(self._value[self._range])
+        return self.descriptor.unpack(self._view)
 
     @value.setter
     def value(self, val):
-        self._value[self._range] = split_number(val, self.size)
+        self._view[:] = self.descriptor.pack(val)
 
     @property
     def mem(self):
-        return self._value[self._range]
+        return self._view
 
     def make_subregisters(self, high: str, low: str):
         """
@@ -143,7 +166,7 @@ class Register(Component, Active):
         return high_register, low_register
 
     def __repr__(self):
-        return "{}\n{}\n{}".format(self.bits, self.value, self._value[self._range])
+        return "{}\n{}\n{}".format(self.bits, self.value, self._view)
 
     def __str__(self):
         return "{0}\nUsage: {1}\nSize: {2} bits\nCurrent Value: {3}".format(self.name, self.use, self.bits,
@@ -155,6 +178,145 @@ class Register(Component, Active):
         return self.value
 
 
+class RegisterFile(Component):
+    """
+    The full 32-bit register set stored in a single contiguous buffer
+
+    ...
+    Attributes
+    ----------
+    buffer : ndarray
+        Bytes of every register, four bytes per 32-bit register in the order of layout.
+    registers : dict(name: Register)
+        Every register and sub-register, all of them views into buffer.
+    layout : tuple
+        The 32-bit registers in buffer order, each followed by its 16-bit
+        sub-register and the high and low 8-bit sub-registers if it has them.
+
+    Notes
+    -----
+    Since every register shares the same buffer, saving, restoring or comparing
+    the whole register state is a single array operation.
+
+    The registers of the first register file are kept as a template and later
+    register files clone them, so only the first one builds its registers.
+
+    Examples
+    --------
+    >>> reg = RegisterFile()
+    >>> reg['al'].value = 5
+    >>> state = reg.save()
+    >>> reg['eax'].value = 300
+    >>> reg.diff(state)
+    ['eax']
+    >>> reg.restore(state)
+    >>> reg['eax'].value
+    5
+    """
+    layout = (('eax', 'ax', 'ah', 'al'),
+              ('ebx', 'bx', 'bh', 'bl'),
+              ('ecx', 'cx', 'ch', 'cl'),
+              ('edx', 'dx', 'dh', 'dl'),
+              ('ebp', 'bp', None, None),
+              ('esi', 'si', None, None),
+              ('edi', 'di', None, None),
+              ('esp', 'sp', None, None))
+
+    # Register file built once per class, new register files clone its registers
+    _template = None
+
+    def __init__(self):
+        super(RegisterFile, self).__init__('RegisterFile')
+        self.buffer = np.zeros((4 * len(self.layout),), dtype=np.uint8)
+        self.names = tuple(names[0] for names in self.layout)
+        template = type(self).__dict__.get('_template')
+        if template is None:
+            self._build()
+            type(self)._template = self.registers
+        else:
+            self.registers = {name: reg.clone(self.buffer) for name, reg in template.items()}
+
+    def _build(self):
+        """
+        Create every register and sub-register from layout.
+        """
+        self.registers = {}
+        for i, (extended, word, high, low) in enumerate(self.layout):
+            reg = Register(extended, subregister=(slice(4 * i, 4 * i + 4), self.buffer))
+            _, self.registers[word] = reg.make_subregisters('_', word)
+            if high is not None:
+                self.registers[high], self.registers[low] = self.registers[word].make_subregisters(high, low)
+            self.registers[extended] = reg
+
+    def save(self) -> np.ndarray:
+        """
+        Returns
+        -------
+        ndarray
+            A copy of the register buffer.
+        """
+        return self.buffer.copy()
+
+    def restore(self, state: np.ndarray):
+        """
+        Overwrite every register with a state returned by save().
+        """
+        self.buffer[:] = state
+
+    def diff(self, state: np.ndarray) -> list:
+        """
+        Compare the registers with a state returned by save().
+
+        Returns
+        -------
+        list(str)
+            Names of the 32-bit registers whose value differs from the state.
+        """
+        changed = (self.buffer != state).reshape(-1, 4).any(axis=1)
+        return [self.names[i] for i in np.flatnonzero(changed)]
+
+    def dump(self) -> dict:
+        """
+        Returns
+        -------
+        dict(name: np.uint32)
+            The value of every 32-bit register.
+        """
+        return dict(zip(self.names, combine_many(self.buffer, 4)))
+
+    def __getitem__(self, name):
+        return self.registers[name]
+
+    def __setitem__(self, name, value):
+        register = self.registers[name]
+        if value is not register:
+            register.value = value.value if isinstance(value, Active) else value
+
+    def __contains__(self, name):
+        return name in self.registers
+
+    def __iter__(self):
+        return iter(self.registers)
+
+    def __len__(self):
+        return len(self.registers)
+
+    def keys(self):
+        return self.registers.keys()
+
+    def values(self):
+        return self.registers.values()
+
+    def items(self):
+        return self.registers.items()
+
+    def __repr__(self):
+        return str(self.dump())
+
+    def __str__(self):
+        return '\n'.join('{0}: {1}'.format(name, hex(value)) for name, value in self.dump().items())
+
+
 if __name__ == '__main__':
     eax = Register('eax')
     _, ax = eax.make_subregisters('_', 'ax')
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 from utils import *
+from register import Register
+from pages import PageTable
 
 
 class Stack(Component):
@@ -30,6 +32,20 @@ class Stack(Component):
         self.stack[self.pointer] = np.int32(0)
         return value
 
+    def reset(self):
+        self.stack[:] = 0
+        self.pointer = len(self.stack) - 1
+
+    def snapshot(self):
+        """
+        Capture the stack. The stack holds python objects, so it is copied whole.
+        """
+        return self.stack.copy(), self.pointer
+
+    def restore(self, state):
+        stack, self.pointer = state
+        self.stack[:] = stack
+
     def __call__(self, value=None):
         if value is not None:
             self.push(value)
@@ -45,6 +61,118 @@ class Stack(Component):
                                     self.stack[self.pointer + 1:self.pointer + 6]))
 
 
+class ByteStack(Component):
+    """
+    Stack of fixed width integers kept in a byte buffer and addressed through a stack pointer
+
+    ...
+    Parameters
+    ----------
+    size : int
+        Size of stack in levels.
+    pointer : Register, optional
+        Stack pointer register, usually esp. A standalone register is created if not given.
+    width : [1, 2, 4, 8], optional
+        Size of every level in bytes.
+    signed : bool, optional
+        Whether or not popped values are interpreted as signed.
+
+    Attributes
+    ----------
+    stack : ndarray
+        The bytes of the stack. The stack grows down from the end of the buffer.
+    pointer : Register
+        Byte offset into stack of the most recently pushed value. Equal to
+        len(stack) when the stack is empty.
+    width : int
+        Size of every level in bytes.
+    signed : bool
+        Whether or not popped values are interpreted as signed.
+    pages : PageTable
+        Tracks the pages written by push, for snapshot().
+
+    Notes
+    -----
+    Values are stored with split_number(), so push accepts the same range of
+    values as a register of the same width.
+
+    Examples
+    --------
+    >>> esp = Register('esp')
+    >>> stack = ByteStack(4, esp)
+    >>> stack.push(7)
+    >>> int(esp.value)
+    12
+    >>> int(stack.pop())
+    7
+    """
+    def __init__(self, size, pointer=None, width=4, signed=False):
+        Component.__init__(self, 'Stack')
+        self.stack = np.zeros((size * width,), dtype=np.uint8)
+        self.pointer = Register('esp') if pointer is None else pointer
+        self.pointer.value = len(self.stack)
+        self.width = width
+        self.signed = signed
+        self.pages = PageTable(len(self.stack))
+
+    @property
+    def value(self):
+        return self.pop()
+
+    def push(self, value):
+        if isinstance(value, Active):
+            value = value.value
+        width = self.width
+        pointer = int(self.pointer.value) - width
+        if pointer < 0:
+            raise StackFull()
+        self.stack[pointer:pointer + width] = split_number(value, width)
+        self.pages.touch(pointer, width)
+        self.pointer.value = pointer
+
+    def pop(self):
+        width = self.width
+        pointer = int(self.pointer.value)
+        if pointer + width > len(self.stack):
+            raise NoMoreObjectsInStack()
+        value = combine_number(self.stack[pointer:pointer + width], self.signed)
+        self.pointer.value = pointer + width
+        return value
+
+    def reset(self):
+        self.stack[:] = 0
+        self.pages.touch_all()
+        self.pointer.value = len(self.stack)
+
+    def snapshot(self):
+        """
+        Capture the stack bytes, copying only the pages pushed to since the
+        last snapshot or restore. The stack pointer belongs to the registers.
+        """
+        return self.pages.snapshot(self.stack)
+
+    def restore(self, state):
+        self.pages.restore(self.stack, state)
+
+    def __len__(self):
+        return (len(self.stack) - int(self.pointer.value)) // self.width
+
+    def __call__(self, value=None):
+        if value is not None:
+            self.push(value)
+        else:
+            return self.pop()
+
+    def __repr__(self):
+        return "{}, {}".format(self.pointer.value, self.stack)
+
+    def __str__(self):
+        pointer = int(self.pointer.value)
+        top = self.stack[pointer:pointer + 5 * self.width]
+        return ("Currently {} items on the stack\nFive most recent "
+                "items:\n{}".format(len(self), combine_many(top, self.width, self.signed)))
+
+
 if __name__ == "__main__":
     stack = Stack(50)
     print(repr(stack))
@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+import os
+import tempfile
 from nose.tools import *
 from nose import run
 import sys
@@ -6,7 +8,17 @@ import numpy as np
 from register import Register
 from memory import Memory, Variable
 from utils import *
-from stack import Stack
+from stack import Stack, ByteStack
+from register import RegisterFile
+from allocator import Allocator
+from assembler import assemble, parse_number, REG, IMM, VAR, LABEL
+from main import Computer
+from batch import BatchComputer
+from farm import Farm
+from flags import Flags
+from profiler import Profiler
+from tracer import Tracer, TraceReader
+from debugger import Debugger, Hit
 
 
 
@@ -63,6 +75,1073 @@ def test_register_other_types():
     ax + var
 
 
+def test_split_combine_number():
+    assert split_number(5, 4) == [0, 0, 0, 5]
+    assert split_number(-5, 4) == [255, 255, 255, 251]
+    assert split_number(np.int8(-128), 1) == [128]
+
+    assert combine_number([1, 10]) == 266
+    assert type(combine_number([1, 10])) is np.uint16
+    assert combine_number([255, 255, 255, 251], signed=True) == -5
+    assert type(combine_number(np.zeros(8, dtype=np.uint8), True)) is np.int64
+    # Arrays of wider integers hold one byte per element too
+    assert combine_number(np.array([1, 2])) == 258
+    assert combine_number(np.array([255, 251], dtype=np.int64), signed=True) == -5
+
+
+@raises(ValueError)
+def test_split_number_too_big():
+    split_number(-129, 1)
+
+
+@raises(InvalidSize)
+def test_split_number_invalid_size():
+    split_number(1, 3)
+
+
+def test_split_combine_many():
+    values = [0, 1, -1, 32767, -32768]
+    memory_seg = split_many(values, 2)
+    assert memory_seg.shape == (5, 2)
+    assert (memory_seg[2] == split_number(-1, 2)).all()
+    assert (combine_many(memory_seg, 2, signed=True) == values).all()
+    assert combine_many(memory_seg, 2).dtype == np.uint16
+
+def test_type_descriptors():
+    import pickle
+    sword = type_descriptor(2, True)
+    assert sword is descriptors_by_word['SWORD'] is descriptors_by_type[np.int16]
+    assert (sword.min, sword.max, sword.mask, sword.dtype) == (-32768, 32767, 0xFFFF, np.dtype('>i2'))
+    assert sword.unpack(sword.pack(-2)) == -2 and sword.pack(-2) == split_number(-2, 2)
+    assert pickle.loads(pickle.dumps(sword)) is sword
+    assert variable_all('qword') == {'word': 'QWORD', 'type': np.uint64, 'det': (8, False)}
+    assert variable_type_to_word(np.int8) == 'SBYTE' and variable_word_to_det('dword') == (4, False)
+    assert Computer.vt['QWORD'].word == 'QWORD'
+    assert_raises(InvalidSize, type_descriptor, 3)
+
+
+def test_register_file():
+    reg = RegisterFile()
+    assert len(reg) == 24
+    reg['al'](5)
+    reg['bh'](1)
+    assert reg['eax']() == 5
+    assert reg['ebx']() == 256
+    assert (reg.buffer[:8] == [0, 0, 0, 5, 0, 0, 1, 0]).all()
+
+    state = reg.save()
+    reg['ax'] += 300
+    reg['esp'](1024)
+    assert reg.diff(state) == ['eax', 'esp']
+    assert reg.dump()['eax'] == 305
+
+    reg.restore(state)
+    assert reg.diff(state) == []
+    assert reg['eax']() == 5
+    assert reg['al'].mem.base is reg['esp'].mem.base
+
+def test_operators_return_values():
+    reg = RegisterFile()
+    reg['eax'](7)
+    reg['bx'](3)
+
+    result = reg['eax'] + reg['bx']
+    assert isinstance(result, Value)
+    assert type(result()) is np.uint32
+    assert result() == 10
+    assert reg['eax']() == 7
+
+    assert ((result - 4) * 3 / 2)() == 9
+    result += 1
+    assert result() == 11
+    assert (reg['eax'] + result)() == 18
+
+
+@raises(IncompatibleVariableSizes)
+def test_value_incompatible_sizes():
+    reg = RegisterFile()
+    reg['ax'] + (reg['eax'] + 1)
+
+def test_set_dispatch():
+    reg = RegisterFile()
+    mem = Memory(16)
+    try:
+        for mode in ('multipledispatch', 'fast'):
+            set_dispatch(mode)
+            reg['eax'](1)
+            reg['eax'] += reg['bx'] + 2
+            mem['x'] = 3
+            mem['x'] = reg['eax']
+            assert reg['eax']() == 3
+            assert (reg['eax'] * np.int8(2))() == 6
+            assert mem['x']() == 3
+    finally:
+        set_dispatch('fast')
+    assert Active.__add__ is Active.__dict__['__add__']
+    assert not hasattr(Memory.__setitem__, 'dispatch')
+
+
+@raises(TypeError)
+def test_unsupported_operand():
+    reg = RegisterFile()
+    reg['eax'] + 'one'
+
+def test_allocator_coalescing():
+    alloc = Allocator(32)
+    blocks = [alloc.alloc(4) for _ in range(4)]
+    assert blocks == [0, 4, 8, 12]
+
+    alloc.release(4)
+    alloc.release(8)
+    assert alloc.free == {4: 8}
+    assert alloc.alloc(6) == 4
+    assert alloc.free == {10: 2}
+
+    alloc.release(12)
+    assert alloc.top == 10
+    assert alloc.free == {}
+
+    stats = alloc.stats()
+    assert stats['used'] == 10
+    assert stats['high_water'] == 16
+    assert stats['fragmentation'] == 0
+
+
+def test_allocator_alignment():
+    alloc = Allocator(32, alignment=4)
+    assert alloc.alloc(1) == 0
+    assert alloc.alloc(2) == 4
+    assert alloc.alloc(1, alignment=1) == 1
+    assert alloc.stats()['holes'] == 1
+
+
+def test_memory_reuses_deleted_space():
+    mem = Memory(8)
+    for _ in range(10):
+        mem('x', 5, size=4)
+        mem('y', 7, size=4)
+        mem.dell('x')
+        mem.dell('y')
+    assert mem.offset == 0
+    assert (mem.memory == 0).all()
+
+
+def test_variable_handles():
+    mem = Memory(64)
+    mem.set('x', -5, 2, True)
+    mem.set('y', None, 4)
+    handle = mem.handle('x')
+    assert mem.handle('x') is handle and mem.read('x') == -5 and type(mem.read('x')) is np.int16
+    handle.value = 300
+    assert list(mem.memory[0:2]) == [1, 44] and mem['x']() == 300
+    assert_raises(OverflowError, setattr, handle, 'value', 40000)
+
+    ref = mem.reference('y')
+    assert_raises(VariableNotInitialized, lambda: ref.value)
+    ref.value = 7
+    assert mem.variables['y'][3] and mem.read('y') == 7
+    # Redeclaring a variable makes a new handle, references follow it
+    mem.dell('y')
+    mem.set('y', 9, 1)
+    assert mem.handle('y').size == 1 and ref.value == 9
+
+
+def test_addressing():
+    mem = Memory(16)
+    mem.set('x', None, 4)
+    mem.store(1, 4, -2)
+    assert list(mem.memory[0:6]) == [0, 255, 255, 255, 254, 0]
+    assert mem.load(1, 4) == 0xFFFFFFFE and mem.load(1, 4, True) == -2
+    assert mem.load(0, 2) == 0xFF and type(mem.load(0, 2, True)) is np.int16
+    # Storing over part of a variable initializes it
+    assert mem.variables['x'][3]
+    mem.store(12, 4, 0x01020304)
+    assert mem.load(12, 4) == 0x01020304 and mem.load(14, 2) == 0x0304
+    assert_raises(InvalidAddress, mem.load, 14, 4)
+    assert_raises(InvalidAddress, mem.store, -1, 1, 0)
+    assert_raises(ValueError, mem.store, 0, 1, 256)
+
+    comp = Computer()
+    comp.run('''
+    .data
+    arr WORD 1, 2, 3, 4
+    buf BYTE 4 DUP(?)
+    .code
+        MOV esi, OFFSET arr
+        MOV ecx, 3
+        MOV ax, [esi + ecx*2 - 2]
+        MOV bx, arr[ecx*2]
+        MOV edi, OFFSET buf
+        MOV BYTE PTR [edi + 1], 0FFh
+        ADD WORD PTR arr[2], 10
+        MOV edx, DWORD PTR arr
+    ''')
+    assert comp.reg['ax']() == 3 and comp.reg['bx']() == 4
+    assert comp.mem.array('buf').tolist() == [0, 255, 0, 0]
+    assert comp.mem.array('arr').tolist() == [1, 12, 3, 4]
+    assert comp.reg['edx']() == 0x1000C
+    assert_raises(AssemblerError, comp.assemble, 'MOV [esi], 1')
+    assert_raises(AssemblerError, comp.assemble, 'MOV eax, [si]')
+    assert_raises(AssemblerError, comp.assemble, 'MOV eax, [esi*3]')
+
+
+@raises(OutOfMemory)
+def test_memory_out_of_memory():
+    mem = Memory(8)
+    mem('x', 5, size=4)
+    mem('y', 5, size=4)
+    mem('z', 5, size=1)
+
+def test_memory_image():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'memory.img')
+        mem = Memory(1 << 20, path=path)
+        mem('x', -5, size=4, signed=True)
+        mem('y', 7, size=2)
+        mem('z', size=1)
+        mem.dell('y')
+        mem.flush()
+        assert os.path.getsize(path) == 1 << 20
+
+        image = Memory.open(path)
+        assert image['x']() == -5
+        assert not image['z'].init
+        assert image.stats() == mem.stats()
+        image['x'] = 9
+        image.flush()
+
+        copy = Memory.open(path, mode='c')
+        assert copy['x']() == 9
+        copy['x'] = 1
+        assert Memory.open(path)['x']() == 9
+
+def test_byte_stack():
+    reg = RegisterFile()
+    stack = ByteStack(3, reg['esp'])
+    assert reg['esp']() == 12
+
+    stack.push(5)
+    stack(-1)
+    reg['eax'](300)
+    stack.push(reg['eax'])
+    assert reg['esp']() == 0
+    assert len(stack) == 3
+    assert (stack.stack[4:8] == [255, 255, 255, 255]).all()
+
+    assert stack.pop() == 300
+    assert stack() == 4294967295
+    assert stack.value == 5
+    assert reg['esp']() == 12
+
+
+@raises(StackFull)
+def test_byte_stack_full():
+    stack = ByteStack(1)
+    stack.push(1)
+    stack.push(2)
+
+
+@raises(NoMoreObjectsInStack)
+def test_byte_stack_empty():
+    stack = ByteStack(1, width=2)
+    stack.push(1)
+    stack.pop()
+    stack.pop()
+
+def test_parse_number():
+    assert parse_number('10') == 10
+    assert parse_number('-0Ah') == -10
+    assert parse_number('1010b') == 10
+    assert parse_number('17o') == 15
+    assert parse_number("'A'") == 65
+    assert parse_number('0x1F') == 31
+    assert parse_number('eax') is None
+    assert parse_number('ah') is None
+
+
+def test_assemble():
+    program = assemble('''
+    .386
+    .data
+    x    DWORD 5      ; comment
+    y    SWORD -2
+    z    BYTE ?
+    .code
+    main PROC
+    start:
+        MOV eax, x
+        ADD AL, 0FFh
+        MOV z, al
+        MOV ebx, start
+    main ENDP
+    END main
+    ''')
+    assert len(program) == 4
+    assert program.names == ('MOV', 'ADD')
+    assert list(program.opcodes) == [0, 1, 0, 0]
+    assert program.operands[0] == ((REG, 'eax'), (VAR, 'x'))
+    assert program.operands[1] == ((REG, 'al'), (IMM, 255))
+    assert program.operands[3] == ((REG, 'ebx'), (LABEL, 0))
+    assert program.labels == {'main': 0, 'start': 0}
+    assert program.data == (('x', 'DWORD', 5), ('y', 'SWORD', -2), ('z', 'BYTE', None))
+
+    comp = Computer()
+    program.load(comp)
+    for index, operands in enumerate(program.resolve(comp)):
+        comp.cpu.__getattribute__(program.mnemonic(index))(*operands)
+    assert comp.reg['eax']() == 4
+    assert comp.mem['z']() == 4
+    assert comp.mem['y']() == -2
+
+
+@raises(AssemblerError)
+def test_assemble_unknown_instruction():
+    assemble('FOO eax, 1')
+
+
+@raises(AssemblerError)
+def test_assemble_unknown_operand():
+    assemble('MOV eax, nothing')
+
+
+def test_assemble_declarations():
+    assert_raises(AssemblerError, assemble, '.data\nx DWORD -1')
+    assert_raises(AssemblerError, assemble, '.data\nx SBYTE 128')
+    assert_raises(AssemblerError, assemble, 'main PROC\nmain ENDP\nmain PROC\nmain ENDP')
+    assert_raises(AssemblerError, assemble, 'main:\nmain PROC\nmain ENDP')
+    assemble('.data\nx SDWORD -1\ny BYTE 255')
+
+    # Loading again resets the variables declared with ? to uninitialized zeros
+    comp = Computer()
+    program = comp.assemble('''
+    .data
+    x   DWORD ?
+    buf BYTE 4 DUP(?)
+    .code
+        MOV x, 3
+        MOV buf, 7
+    ''')
+    comp.run(program)
+    assert comp.mem['x']() == 3 and comp.mem.variables['buf'][3]
+    comp.run(program, max_steps=0)
+    assert_raises(VariableNotInitialized, comp.mem['x'])
+    assert_raises(VariableNotInitialized, comp.mem.array, 'buf')
+    assert not comp.mem.memory.any()
+
+def test_run():
+    comp = Computer()
+    result = comp.run('''
+    .data
+    total DWORD 0
+    .code
+        MOV ecx, 10
+    again:
+        ADD total, ecx
+        LOOP again
+        JMP done
+        MOV total, 0
+    done:
+    ''')
+    assert comp.mem['total']() == 55
+    assert comp.reg['ecx']() == 0
+    assert result.steps == 22
+    assert result.halted
+    assert result.ips > 0
+
+
+def test_run_max_steps():
+    comp = Computer()
+    program = comp.assemble('''
+    top:
+        ADD eax, 1
+        JMP top
+    ''')
+    result = comp.run(program, max_steps=101)
+    assert not result.halted
+    assert result.ip == 1
+    assert comp.reg['eax']() == 51
+
+    comp.run(program, max_steps=2, start=result.ip)
+    assert comp.reg['eax']() == 52
+
+def test_run_jit():
+    source = '''
+    .data
+    total  SDWORD 0
+    small  SBYTE  -3
+    result WORD   ?
+    .code
+        MOV ecx, 50
+    top:
+        ADD eax, 7
+        ADD bx, ax
+        MOV dh, bl
+        ADD total, small
+        ADD total, dh
+        LOOP top
+        MOV result, bx
+        ADD al, 255
+        ADD eax, -1
+    '''
+    states = []
+    for jit in (False, True):
+        comp = Computer()
+        try:
+            comp.run(source, jit=jit)
+        except OverflowError:
+            pass
+        states.append((comp.reg.save(), comp.mem.memory.copy(), comp.mem['result']()))
+    assert (states[0][0] == states[1][0]).all()
+    assert (states[0][1] == states[1][1]).all()
+    assert states[0][2] == states[1][2] != 0
+
+
+def test_run_jit_uninitialized():
+    from compiler import BlockCompiler
+    comp = Computer()
+    comp._compiler = BlockCompiler(comp)
+    program = comp.assemble('''
+    .data
+    x DWORD ?
+    .code
+        MOV ecx, 100
+    top:
+        MOV x, ecx
+        ADD eax, x
+        LOOP top
+    ''')
+    # The block at top waits for x, marked with the memory version it was tried at
+    comp.run(program, max_steps=2, jit=True)
+    version = comp._compiler.blocks[1]
+    assert type(version) is int and version != comp.mem.version
+
+    comp.reset()
+    links = []
+    link = comp._compiler.link
+    comp._compiler.link = lambda start: links.append(start) or link(start)
+    comp.run(program, jit=True)
+    assert comp.reg['eax']() == 5050
+    # The loop waits for x once, then is linked again after MOV x initializes it
+    assert links.count(1) == 2 and comp._compiler.blocks[1][1] == 3
+
+
+def test_run_jit_max_steps():
+    comp = Computer()
+    program = comp.assemble('''
+        MOV ecx, 1000
+    top:
+        ADD eax, 1
+        LOOP top
+    ''')
+    result = comp.run(program, max_steps=102, jit=True)
+    assert result.steps == 102
+    assert comp.reg['eax']() == 51
+    assert 'leaders' in program.cache
+
+def test_push_pop():
+    for mode in ('object', 'typed'):
+        comp = Computer(stack_mode=mode)
+        comp.run('''
+            MOV eax, 5
+            PUSH eax
+            PUSH -2
+            POP ebx
+            POP ecx
+        ''')
+        assert comp.reg['ebx']() == 4294967294
+        assert comp.reg['ecx']() == 5
+        assert comp.reg['esp']() == (4096 if mode == 'typed' else 0)
+
+    # The object stack takes any python object, the typed stack only 32-bit values
+    comp = Computer()
+    comp.stack.push('frame')
+    assert comp.stack.pop() == 'frame'
+    assert_raises(ValueError, Computer(stack_mode='typed').stack.push, 1 << 32)
+    assert_raises(AssemblerError, assemble, 'MOV eax, [esp+4]')
+    assert_raises(AssemblerError, assemble, 'MOV eax, [ebx+esp*2]')
+
+
+def test_batch_matches_computers():
+    source = '''
+    .data
+    total SDWORD 0
+    small BYTE   ?
+    .code
+    top:
+        ADD total, ecx
+        PUSH total
+        LOOP top
+        POP ebx
+        MOV small, bl
+        MOV al, ebx
+    '''
+    batch = BatchComputer(4, stack_size=16)
+    program = batch.assemble(source)
+    batch.load(program)
+    batch.reg['ecx'][:] = [1, 3, 9, 30]
+    batch.set('total', [0, -10, 5, 0])
+    computers = [batch.computer(lane) for lane in range(4)]
+
+    result = batch.run(program, load=False)
+    assert list(result.steps) == [6, 11, 30, 49]
+    assert list(result.halted) == [True, False, True, False]
+    assert result.errors[0] is None and result.errors[2] is None
+    assert isinstance(result.errors[1], ValueError)
+    assert isinstance(result.errors[3], StackFull)
+    assert list(batch.variable('total')) == [1, -4, 50, 374]
+
+    for lane, comp in enumerate(computers):
+        try:
+            comp.run(program, load=False)
+        except Exception as error:
+            assert type(error) is type(result.errors[lane])
+        else:
+            assert result.errors[lane] is None
+        assert (comp.reg.buffer == batch.buffer[lane]).all()
+        assert (comp.mem.memory == batch.memory[lane]).all()
+        assert (comp.stack.stack == batch.stack[lane]).all()
+
+    # Lanes branch apart on their own flags
+    program = batch.assemble('''
+    .data
+    above SDWORD 0
+    below SBYTE  -126
+    .code
+    top:
+        CMP ecx, edx
+        JLE low
+        INC above
+        JMP next
+    low:
+        DEC below
+        SUB edx, 1
+    next:
+        PUSHF
+        POPF
+        LOOP top
+        CMP below, -127
+        JG done
+        ADD bl, 200
+    done:
+    ''')
+    batch.load(program)
+    batch.reg['ecx'][:] = [1, 4, 6, 9]
+    batch.reg['edx'][:] = [0, 2, 3, 8]
+    batch.reg['bl'][:] = [100, 100, 60, 0]
+    batch.reg['esp'][:] = batch.stack.shape[1]
+    computers = [batch.computer(lane) for lane in range(4)]
+    result = batch.run(program, load=False)
+    assert result.halted.all() and not any(result.errors)
+    assert list(batch.variable('above')) == [1, 2, 3, 1] and list(batch.variable('below')) == [-126, -128, 127, 122]
+    assert list(batch.reg['bl']) == [100, 44, 60, 0]
+    for lane, comp in enumerate(computers):
+        comp.run(program, load=False)
+        assert (comp.reg.buffer == batch.buffer[lane]).all()
+        assert (comp.mem.memory == batch.memory[lane]).all()
+        assert comp.flags.value == batch.flags.value[lane]
+
+
+def test_batch_memory_operands():
+    # Memory operands are vectorized, string instructions run lane by lane
+    batch = BatchComputer(3, mem_size=64, stack_size=16)
+    program = batch.assemble('''
+    .data
+    src BYTE 1, 2, 3, 4, 5, 6, 7, 8
+    dst BYTE 8 DUP(?)
+    .code
+        MOV esi, OFFSET src
+        MOV edi, OFFSET dst
+        REP MOVSB
+        MOV al, [dst+ebx]
+        ADD BYTE PTR dst[ebx], 10
+        MOV eax, DWORD PTR [edx]
+    ''')
+    batch.load(program)
+    batch.reg['ecx'][:] = [0, 3, 8]
+    batch.reg['ebx'][:] = [0, 1, 2]
+    batch.reg['edx'][:] = [0, 4, 62]
+    computers = [batch.computer(lane) for lane in range(3)]
+    result = batch.run(program, load=False)
+    assert result.errors[:2] == [None, None] and isinstance(result.errors[2], InvalidAddress)
+    assert batch.memory[:, 8:12].tolist() == [[10, 0, 0, 0], [1, 12, 3, 0], [1, 2, 13, 4]]
+    assert list(batch.reg['eax']) == [0x01020304, 0x05060708, 3] and batch.initialized['dst'].all()
+    for lane, comp in enumerate(computers):
+        try:
+            comp.run(program, load=False)
+        except InvalidAddress:
+            assert lane == 2
+        assert (comp.reg.buffer == batch.buffer[lane]).all()
+        assert (comp.mem.memory == batch.memory[lane]).all()
+        assert comp.flags.value == batch.flags.value[lane]
+    assert_raises(VariableNotDefined, BatchComputer(1).run, program, load=False)
+
+
+def test_snapshot_chain():
+    from pages import PageTable
+    buffer = np.zeros(64, dtype=np.uint8)
+    pages = PageTable(64, page_size=4, max_depth=8)
+    snapshots = []
+    for step in range(100):
+        buffer[step % 64] = step + 1
+        pages.touch(step % 64, 1)
+        snapshots.append((pages.snapshot(buffer), buffer.copy()))
+    assert max(snapshot.depth for snapshot, _ in snapshots) == 8
+    # Collapsed snapshots hold the pages of their whole chain and no parent
+    collapsed = snapshots[8][0]
+    assert collapsed.depth == 1 and collapsed.parent is None and len(collapsed) == 3
+    for index in (0, 7, 8, 50, 99, 3):
+        snapshot, expected = snapshots[index]
+        pages.restore(buffer, snapshot)
+        assert (buffer == expected).all()
+
+
+def test_dirty_pages():
+    mem = Memory(4096)
+    mem.set('x', 1, 4)
+    mem.declare_array('arr', 300, 2)
+    assert mem.dirty_pages().tolist() == [0]
+    mem.clear_dirty()
+    assert mem.dirty_pages().tolist() == []
+    mem.store(1000, 2, 5)
+    mem.handle('x').value = 3
+    assert mem.dirty_pages().tolist() == [0, 3]
+
+    checkpoint = mem.snapshot()
+    mem.clear_dirty()
+    mem.set_element('arr', 299, 0x0102)
+    mem.dell('x')
+    assert mem.dirty_pages().tolist() == [0, 2]
+    offsets, before, after = mem.diff(checkpoint)
+    assert offsets.tolist() == [3, 602, 603]
+    assert before.tolist() == [3, 0, 0] and after.tolist() == [0, 1, 2]
+
+    # Restoring writes the pages it copies, and leaves nothing to diff
+    later = mem.snapshot()
+    mem.clear_dirty()
+    mem.restore(checkpoint)
+    assert mem.dirty_pages().tolist() == [0, 2]
+    assert len(mem.diff(checkpoint)[0]) == 0
+    assert mem.diff(later)[0].tolist() == [3, 602, 603]
+
+
+def test_snapshot_restore():
+    comp = Computer(mem_size=4096, stack_size=256, stack_mode='typed')
+    program = comp.assemble('''
+    .data
+    total DWORD 0
+    .code
+    top:
+        ADD total, ecx
+        PUSH ecx
+        LOOP top
+    ''')
+    comp.reg['ecx'].value = 3
+    comp.run(program)
+    first = comp.snapshot()
+    registers, memory, stack = comp.reg.save(), comp.mem.memory.copy(), comp.stack.stack.copy()
+    # Only the written pages of memory and stack are copied
+    assert sorted(first.memory[0].pages) == [0]
+    assert sorted(first.stack.pages) == [3]
+
+    comp.mem.set('y', 7, 2)
+    comp.reg['ecx'].value = 2
+    comp.run(program, load=False, jit=True)
+    second = comp.snapshot()
+    assert int(comp.mem.get('total').value) == 9
+
+    comp.restore(first)
+    assert (comp.reg.buffer == registers).all()
+    assert (comp.mem.memory == memory).all()
+    assert (comp.stack.stack == stack).all()
+    assert 'y' not in comp.mem.variables
+    assert int(comp.mem.get('total').value) == 6
+
+    comp.restore(second)
+    assert int(comp.mem.get('total').value) == 9
+    assert int(comp.mem.get('y').value) == 7
+    assert len(comp.stack) == 5
+
+    child = comp.fork()
+    child.stack.pop()
+    child.mem.set('total', 0)
+    assert int(comp.mem.get('total').value) == 9 and len(comp.stack) == 5
+    assert int(child.mem.get('y').value) == 7 and len(child.stack) == 4
+
+
+def test_flags():
+    flags = Flags()
+    flags.last = ('add', 0xFF, 1, 8, None)
+    assert (flags.cf, flags.zf, flags.sf, flags.of, flags.pf, flags.af) == (True, True, False, False, True, True)
+    flags.last = ('add', 0x7F, 1, 8, None)
+    assert (flags.cf, flags.zf, flags.sf, flags.of) == (False, False, True, True)
+    flags.last = ('sub', -128, 1, 8, None)
+    assert (flags.cf, flags.sf, flags.of) == (False, False, True)
+    assert flags.test('NE') and flags.test('L') and not flags.test('GE')
+    # INC and DEC keep the carry of the previous operation
+    flags.last = ('inc', 0xFFFFFFFF, 1, 32, ('sub', 0, 1, 32, None))
+    assert flags.cf and flags.zf
+    flags.value = 0xFFFF
+    assert flags.value == 0xCD7
+    assert flags.cf and flags.of and flags.test('E')
+
+
+def test_conditional_jumps():
+    source = '''
+    .data
+    n SDWORD -3
+    count DWORD 0
+    .code
+    top:
+        INC count
+        ADD n, 1
+        CMP n, 2
+        JL top
+        MOV eax, 5
+    down:
+        DEC eax
+        JNZ down
+        SUB ebx, 1
+        PUSHF
+        POP edx
+    '''
+    results = []
+    for jit in (False, True):
+        comp = Computer()
+        comp.run(source, jit=jit)
+        assert int(comp.mem.get('count').value) == 5
+        assert comp.reg['eax'].value == 0
+        assert comp.flags.cf and comp.flags.sf and not comp.flags.zf
+        assert comp.reg['edx'].value == comp.flags.value
+        results.append((comp.reg.buffer.tobytes(), comp.mem.memory.tobytes(), comp.flags.value))
+    assert results[0] == results[1]
+
+
+def test_arrays():
+    comp = Computer(mem_size=4096)
+    program = comp.assemble('''
+    .data
+    arr   DWORD 1000 DUP(7)
+    list  SWORD -1, 2, 2 DUP(3, ?)
+    msg   BYTE "hi", 0
+    buf   BYTE 16 DUP(?)
+    .code
+        MOV eax, arr
+        ADD list, 5
+    ''')
+    assert program.data[1] == ('list', 'SWORD', program.data[1][2])
+    assert program.data[3][2] == (16, None)
+    comp.run(program)
+    assert comp.mem.extent('arr') == 4000
+    assert (comp.mem.array('arr') == 7).all() and len(comp.mem.array('arr')) == 1000
+    # An array used as an operand is its first element
+    assert comp.reg['eax'].value == 7
+    assert comp.mem.array('list').tolist() == [4, 2, 3, 0, 3, 0]
+    assert comp.mem.array('msg').tolist() == [104, 105, 0]
+    assert_raises(VariableNotInitialized, comp.mem.array, 'buf')
+    assert_raises(ValueError, comp.mem.array('arr').__setitem__, 0, 1)
+
+    comp.mem.write_array('arr', np.arange(1000))
+    comp.mem.set_element('arr', 999, 0xFFFFFFFF)
+    assert int(comp.mem.element('arr', 10)) == 10 and int(comp.mem.element('arr', 999)) == 0xFFFFFFFF
+    assert_raises(IndexError, comp.mem.element, 'arr', 1000)
+    offset = comp.mem.variables['arr'][0]
+    assert list(comp.mem.memory[offset + 40:offset + 44]) == [0, 0, 0, 10]
+
+    # Snapshots and deletion cover every element
+    snapshot = comp.snapshot()
+    comp.mem.write_array('buf', 1)
+    comp.mem.dell('arr')
+    assert 'arr' not in comp.mem.arrays and not comp.mem.memory[offset:offset + 4000].any()
+    comp.restore(snapshot)
+    assert comp.mem.array('arr')[500] == 500 and 'buf' in comp.mem.arrays
+    assert_raises(VariableNotInitialized, comp.mem.array, 'buf')
+    assert_raises(AssemblerError, assemble, '.data\nx BYTE 2 DUP(300)')
+
+
+def test_string_instructions():
+    comp = Computer(mem_size=64)
+    comp.mem.memory[:8] = np.arange(1, 9)
+    # Overlapping forward copy repeats the first bytes like a byte-by-byte copy
+    comp.reg['esi'].value, comp.reg['edi'].value, comp.reg['ecx'].value = 0, 2, 6
+    comp.run('REP MOVSB')
+    assert list(comp.mem.memory[:8]) == [1, 2, 1, 2, 1, 2, 1, 2]
+    assert [int(comp.reg[name].value) for name in ('esi', 'edi', 'ecx')] == [6, 8, 0]
+
+    comp.run('''
+        STD
+        MOV eax, 0AABBCCDDh
+        MOV edi, 20
+        MOV ecx, 3
+        REP STOSD
+        CLD
+    ''')
+    assert list(comp.mem.memory[12:24]) == [0xAA, 0xBB, 0xCC, 0xDD] * 3
+    assert int(comp.reg['edi'].value) == 8 and not comp.flags.df
+
+    # REPNE SCASB stops on the first match
+    comp.mem.memory[30:36] = [5, 6, 7, 8, 7, 0]
+    comp.run('''
+        MOV al, 7
+        MOV edi, 30
+        MOV ecx, 6
+        REPNE SCASB
+    ''')
+    assert int(comp.reg['edi'].value) == 33 and int(comp.reg['ecx'].value) == 3 and comp.flags.zf
+
+    # REPE CMPSB stops on the first difference
+    comp.mem.memory[40:44] = [1, 2, 3, 4]
+    comp.mem.memory[50:54] = [1, 2, 9, 4]
+    comp.run('''
+        MOV esi, 40
+        MOV edi, 50
+        MOV ecx, 4
+        REPE CMPSB
+        JB less
+        MOV ebx, 1
+    less:
+    ''')
+    assert int(comp.reg['ecx'].value) == 1 and int(comp.reg['esi'].value) == 43
+    assert int(comp.reg['ebx'].value) == 0
+
+    # A fault leaves the registers at the faulting element
+    comp.reg['esi'].value, comp.reg['edi'].value, comp.reg['ecx'].value = 0, 60, 8
+    assert_raises(InvalidAddress, comp.run, 'REP MOVSB')
+    assert [int(comp.reg[name].value) for name in ('esi', 'edi', 'ecx')] == [4, 64, 4]
+
+
+def test_benchmark_suite():
+    import json
+    from benchmark import run_suite
+    report = json.loads(json.dumps(run_suite(['stack', 'memory'], scale=0.001)))
+    assert set(report['results']) == {'stack', 'memory'}
+    for result in report['results']['stack'].values():
+        assert result['ops_per_sec'] > 0
+        assert set(result) == {'ops_per_sec', 'allocations', 'allocated_bytes', 'peak_bytes'}
+
+
+def test_startup():
+    import subprocess
+    # Modules only needed by some features are not imported up front
+    script = 'import sys, main; main.Computer(); print(" ".join(sorted(sys.modules)))'
+    modules = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+    for module in ('json', 'multipledispatch', 'assembler', 'compiler', 'farm', 'tracer'):
+        assert module not in modules
+
+    # Register files cloned from the template are independent of each other
+    first, second = RegisterFile(), RegisterFile()
+    first['ah'].value = 1
+    assert first['eax'].value == 0x100 and second['eax'].value == 0
+    assert second['ax']._value is second.buffer and second['al'].size == 1
+    assert Computer().cpu.MOV is Computer().cpu.commands['MOV']
+    # Commands replaced in a command list show in processors made afterwards
+    from commands import masm_commands
+    commands = dict(masm_commands)
+    assert Computer(command_list=commands).cpu.MOV is masm_commands['MOV']
+    commands['MOV'] = masm_commands['ADD']
+    assert Computer(command_list=commands).cpu.MOV is masm_commands['ADD']
+
+
+def test_profiler():
+    from functools import partial
+    comp = Computer()
+    program = comp.assemble('''
+    .data
+    total DWORD 0
+    .code
+        MOV ecx, 10
+    top:
+        ADD total, ecx
+        PUSH ecx
+        POP ebx
+        LOOP top
+    ''')
+    comp.profiler = Profiler()
+    comp.run(program, jit=True)
+    opcodes = comp.profiler.by_opcode()
+    assert {name: row['count'] for name, row in opcodes.items()} == {'MOV': 1, 'ADD': 10, 'PUSH': 10, 'POP': 10, 'LOOP': 10}
+    assert opcodes['ADD']['memory_bytes'] == 40 and opcodes['ADD']['register_bytes'] == 40
+    assert opcodes['PUSH']['memory_bytes'] == 40 and opcodes['PUSH']['register_bytes'] == 80
+    assert comp.profiler.by_line()[program, 7]['count'] == 10
+    assert 'ADD total, ecx' in comp.profiler.report()
+
+    # Disabled profiling runs the plain bound instructions
+    comp.profiler = None
+    comp.run(program)
+    assert all(isinstance(instruction, partial) for instruction in comp._bound[2])
+
+
+def test_tracer():
+    source = '''
+    top:
+        ADD eax, ecx
+        MOV bl, al
+        LOOP top
+    '''
+    path = os.path.join(tempfile.mkdtemp(), 'run.trace')
+    comp = Computer()
+    comp.tracer = Tracer(capacity=8, path=path)
+    comp.reg['ecx'].value = 5
+    comp.run(source)
+    comp.reg['ecx'].value = 2
+    comp.run(source)
+    comp.tracer.close()
+    assert comp.tracer.count == 22
+
+    trace = TraceReader.open(path)
+    assert len(trace) == 22
+    assert trace[0] == (0, 0, 'ADD', {'eax': (0, 5)})
+    assert trace[2] == (2, 2, 'LOOP', {'ecx': (5, 4)})
+    assert trace[15] == (15, 4294967295, '(registers)', {'ecx': (0, 2)})
+    assert [entry.opcode for entry in trace][-3:] == ['ADD', 'MOV', 'LOOP']
+    assert (trace.states()[-1] == comp.reg.buffer).all()
+
+    # The ring only keeps the last records, decoded against the same states
+    ring = comp.tracer.reader()
+    assert len(ring) == 8 and ring.first == 14
+    assert list(ring) == list(trace)[14:]
+    assert (ring.states() == trace.states(14)).all()
+
+
+def test_tracer_full_ring():
+    # A ring filled exactly once or several times over wraps back to position 0
+    for passes in (1, 3):
+        comp = Computer()
+        comp.tracer = Tracer(capacity=4)
+        comp.run('\n'.join('MOV eax, {0}'.format(n) for n in range(1, 4 * passes + 1)))
+        ring = comp.tracer.reader()
+        assert comp.tracer.count == 4 * passes and comp.tracer.position == 0
+        assert len(ring) == 4 and ring.first == 4 * (passes - 1)
+        assert [entry.changes['eax'][1] for entry in ring] == list(range(4 * passes - 3, 4 * passes + 1))
+        assert (ring.states()[-1] == comp.reg.buffer).all()
+
+def test_debugger():
+    source = '''
+    .data
+    arr BYTE 1, 2, 3, 4
+    total DWORD 0
+    .code
+        MOV ecx, 4
+        MOV esi, OFFSET arr
+    top:
+        MOV al, [esi]
+        ADD total, eax
+        INC esi
+        LOOP top
+    '''
+    comp = Computer(mem_size=64)
+    debugger = comp.debugger = Debugger()
+    assert not debugger.armed
+    debugger.add_breakpoint(4)
+    result = comp.run(source)
+    assert debugger.hits == [Hit(4, 'breakpoint', 4, None)] and result.ip == 4 and not result.halted
+    # Resuming executes the instruction the breakpoint stopped before
+    result = comp.run(source, start=4, load=False)
+    assert result.ip == 4 and result.steps == 4 and comp.reg['esi']() == 1
+    debugger.clear()
+
+    # Reads of the third byte of arr, through an address operand
+    debugger.watch_memory(2, access='r')
+    result = comp.run(source)
+    assert debugger.hits == [Hit(2, 'memory', 2, 'r')] and comp.reg['al']() == 3
+    debugger.clear()
+
+    # Writes to ah through eax are writes to ax
+    debugger.watch_register('ax')
+    debugger.watch_variable('total', access='rw')
+    comp.run(source)
+    assert debugger.hits == [Hit(2, 'register', 'ax', 'w')]
+    comp.reg['eax'].value = 0
+    debugger.watches.pop(0)
+    comp.run(source)
+    assert debugger.hits == [Hit(3, 'variable', 'total', 'r'), Hit(3, 'variable', 'total', 'w')]
+
+    # Base and index registers of address operands are read through the registers
+    debugger.clear()
+    debugger.watch_register('esi', access='r')
+    comp.run(source)
+    assert debugger.hits == [Hit(2, 'register', 'esi', 'r')]
+
+    # REPE CMPSB stopping at the second byte reads nothing past it
+    debugger.clear()
+    debugger.watch_memory(2, 2, access='r')
+    compare = '''
+    .data
+    first BYTE 1, 2, 3, 4
+    second BYTE 1, 9, 3, 4
+    .code
+        MOV esi, OFFSET first
+        MOV edi, OFFSET second
+        MOV ecx, 4
+        REPE CMPSB
+    '''
+    other = Computer(mem_size=64)
+    other.debugger = debugger
+    result = other.run(compare)
+    assert debugger.hits == [] and result.halted and other.reg['ecx']() == 2
+    debugger.watch_memory(5, access='r')
+    other.run(compare)
+    assert debugger.hits == [Hit(3, 'memory', 5, 'r')]
+
+    # Stores of a repeated instruction and pushes through esp
+    debugger.clear()
+    debugger.watch_memory(10, access='w')
+    debugger.watch_register('esp', access='w')
+    result = other.run('''
+        MOV edi, 8
+        MOV ecx, 3
+        MOV al, 7
+        REP STOSB
+        PUSH eax
+    ''')
+    assert debugger.hits == [Hit(3, 'memory', 10, 'w')] and result.ip == 4
+    assert other.mem.memory[8:12].tolist() == [7, 7, 7, 0]
+    typed = Computer(mem_size=64, stack_mode='typed')
+    typed.debugger = debugger
+    typed.run('PUSH eax')
+    assert debugger.hits == [Hit(0, 'register', 'esp', 'w')]
+    assert_raises(ValueError, debugger.watch_memory, 0, 1, 'x')
+
+
+def test_farm():
+    source = '''
+    .data
+    total DWORD 0
+    .code
+    top:
+        ADD total, ecx
+        LOOP top
+    '''
+    program = assemble(source)
+    jobs = [(source, {'reg': {'ecx': n}}) for n in range(1, 6)]
+    jobs.append((program, {'reg': {'ecx': 3}, 'mem': {'total': 100}}))
+    jobs.append(('MOV al, ebx', {'reg': {'ebx': 300}}))
+    with Farm(workers=2, mem_size=64, stack_size=16) as farm:
+        results = farm.run(jobs)
+        assert [int(result.variable('total')) for result in results[:6]] == [1, 3, 6, 10, 15, 106]
+        assert all(result.halted and result.error is None for result in results[:6])
+        assert results[2].steps == 6 and int(results[2].reg['ecx']) == 0
+        assert isinstance(results[6].error, ValueError)
+        assert not results[6].halted
+
+        # Workers are reused across runs, a program compiled by a jit run can be sent too
+        comp = Computer()
+        comp.reg['ecx'].value = 2
+        comp.run(program, jit=True)
+        assert program.cache
+        results = farm.run([(program, {'reg': {'ecx': 4}})])
+        assert int(results[0].variable('total')) == 10
+        assert farm._keys == {source: 0, id(program): 1, 'MOV al, ebx': 2}
+    assert not farm._keys and not farm._programs
+
+    # Programs beyond cache_size are forgotten and sent again under a new key
+    sources = ['MOV eax, {0}'.format(n) for n in range(4)]
+    with Farm(workers=1, mem_size=64, stack_size=16, cache_size=2) as farm:
+        for _ in range(2):
+            results = farm.run([(source, None) for source in sources])
+            assert [int(result.reg['eax']) for result in results] == [0, 1, 2, 3]
+        assert len(farm._keys) <= 2 and farm._next_key == 8
+
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+import os
+import json
+from collections import namedtuple
+from utils import *
+from register import RegisterFile
+
+# One executed instruction: its index in the program, its opcode in Tracer.names,
+# a bitmask of the 32-bit registers it changed and the XOR of the register file
+# before and after it
+record_type = np.dtype([('ip', '<u4'), ('opcode', '<u2'), ('changed', 'u1'),
+                        ('delta', 'u1', (4 * len(RegisterFile.layout),))])
+
+# Index of the records of register changes made between runs, under the opcode EXTERNAL_NAME
+EXTERNAL = 0xFFFFFFFF
+EXTERNAL_NAME = '(registers)'
+
+# Start of every trace file, followed by the register file before the first record
+MAGIC = b'MASMTRC1'
+HEADER_SIZE = len(MAGIC) + record_type['delta'].shape[0]
+
+_registers = tuple(names[0] for names in RegisterFile.layout)
+
+TraceEntry = namedtuple('TraceEntry', ['index', 'ip', 'opcode', 'changes'])
+
+
+def names_path(path):
+    """
+    Name of the file holding the opcode names of the trace at path.
+    """
+    return '{0}.names.json'.format(path)
+
+
+def encode(states, before):
+    """
+    Turn register files into XOR deltas in place.
+
+    Parameters
+    ----------
+    states : ndarray(np.uint8)
+        Register file after every record, shape (n, 32).
+    before : ndarray(np.uint8)
+        Register file before the first record.
+
+    Returns
+    -------
+    after : ndarray(np.uint8)
+        Register file after the last record.
+    changed : ndarray(np.uint8)
+        The changed register bitmask of every record.
+    """
+    after = states[-1].copy()
+    states[1:] ^= states[:-1]
+    states[0] ^= before
+    changed = states.reshape(len(states), -1, 4).any(axis=2)
+    return after, np.packbits(changed, axis=1, bitorder='little')[:, 0]
+
+
+class TraceReader:
+    """
+    Lazily decoded sequence of trace records
+
+    ...
+    Parameters
+    ----------
+    records : ndarray(record_type)
+        The records, oldest first, possibly a np.memmap of a trace file.
+    base : ndarray(np.uint8)
+        Register file before the first record.
+    names : list(str)
+        Mnemonic of every opcode.
+    first : int, optional
+        Number of the first record in the whole trace.
+
+    Notes
+    -----
+    Register files are rebuilt by XOR-ing the deltas onto base. The register
+    file before every block of records is remembered once computed, so
+    decoding any record costs at most one block of deltas.
+    """
+    block = 4096
+
+    def __init__(self, records, base, names, first=0):
+        self.records = records
+        self.base = np.asarray(base, dtype=np.uint8)
+        self.names = list(names)
+        self.first = first
+        self._checkpoints = [self.base]
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open a trace file written by a Tracer, without reading its records.
+        """
+        with open(path, 'rb') as trace:
+            header = trace.read(HEADER_SIZE)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError('{0} is not a trace file'.format(path))
+        base = np.frombuffer(header[len(MAGIC):], dtype=np.uint8)
+        count = (os.path.getsize(path) - HEADER_SIZE) // record_type.itemsize
+        records = np.memmap(path, dtype=record_type, mode='r', offset=HEADER_SIZE, shape=(count,))
+        with open(names_path(path)) as names:
+            names = json.load(names)
+        return cls(records, base, names)
+
+    def __len__(self):
+        return len(self.records)
+
+    def before(self, index: int) -> np.ndarray:
+        """
+        The register file before a record.
+        """
+        block = self.block
+        while len(self._checkpoints) <= index // block:
+            start = (len(self._checkpoints) - 1) * block
+            deltas = self.records['delta'][start:start + block]
+            self._checkpoints.append(self._checkpoints[-1] ^ np.bitwise_xor.reduce(deltas, axis=0))
+        start = index // block * block
+        state = self._checkpoints[index // block]
+        if index > start:
+            state = state ^ np.bitwise_xor.reduce(self.records['delta'][start:index], axis=0)
+        return state
+
+    def states(self, start: int=0, stop: int=None) -> np.ndarray:
+        """
+        The register file after every record in a range.
+
+        Returns
+        -------
+        ndarray(np.uint8)
+            Shape (stop - start, 32), laid out like RegisterFile.buffer.
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        deltas = np.array(self.records['delta'][start:stop])
+        if len(deltas):
+            deltas[0] ^= self.before(start)
+            np.bitwise_xor.accumulate(deltas, axis=0, out=deltas)
+        return deltas
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('trace record {0} out of range'.format(index))
+        record = self.records[index]
+        before = combine_many(self.before(index), 4).tolist()
+        after = combine_many(self.before(index) ^ record['delta'], 4).tolist()
+        changes = {_registers[i]: (before[i], after[i])
+                   for i in range(len(_registers)) if record['changed'] >> i & 1}
+        return TraceEntry(self.first + index, int(record['ip']), self.names[record['opcode']], changes)
+
+    def __iter__(self):
+        for start in range(0, len(self), self.block):
+            stop = min(start + self.block, len(self))
+            states = combine_many(self.states(start, stop), 4).reshape(stop - start, -1).tolist()
+            previous = combine_many(self.before(start), 4).tolist()
+            records = self.records[start:stop]
+            for i in range(stop - start):
+                record = records[i]
+                changed = int(record['changed'])
+                changes = {}
+                for register in range(len(_registers)):
+                    if changed >> register & 1:
+                        changes[_registers[register]] = (previous[register], states[i][register])
+                yield TraceEntry(self.first + start + i, int(record['ip']), self.names[record['opcode']], changes)
+                previous = states[i]
+
+    def __repr__(self):
+        return "TraceReader({0} records)".format(len(self))
+
+
+class Tracer(Component):
+    """
+    Records every executed instruction in a preallocated ring buffer
+
+    ...
+    Parameters
+    ----------
+    capacity : int, optional
+        Number of records kept in memory, older records are overwritten.
+    path : str, optional
+        File every record is also streamed to, so nothing is lost when the
+        ring wraps. Read it back with TraceReader.open().
+
+    Attributes
+    ----------
+    ring : ndarray(record_type)
+        The ring buffer.
+    count : int
+        Number of records written so far.
+    names : list(str)
+        Mnemonic of every opcode in the records.
+
+    Notes
+    -----
+    Setting Computer.tracer makes Computer.run execute through Tracer.run,
+    which only copies the index and the register file into the ring after
+    every instruction. The register files are turned into XOR deltas and
+    the opcodes filled in with a few vectorized operations when the ring
+    wraps or the run ends. jit is ignored while tracing.
+
+    Examples
+    --------
+    >>> from main import Computer
+    >>> comp = Computer()
+    >>> comp.tracer = Tracer(capacity=16)
+    >>> result = comp.run('''
+    ...     MOV eax, 5
+    ...     ADD eax, 7
+    ... ''')
+    >>> [(entry.opcode, entry.changes) for entry in comp.tracer.reader()]
+    [('MOV', {'eax': (0, 5)}), ('ADD', {'eax': (5, 12)})]
+    """
+    def __init__(self, capacity=65536, path=None):
+        super(Tracer, self).__init__('Tracer')
+        self.ring = np.zeros((capacity,), dtype=record_type)
+        self.capacity = capacity
+        self.path = path
+        self.count = 0
+        self.names = []
+        self.position = 0
+        # Records before encoded are register files, not yet deltas
+        self.encoded = 0
+        self._state = None
+        self._pass_base = None
+        self._codes = None
+        self._file = None
+        if path is not None:
+            self._file = open(path, 'wb')
+
+    def _start(self, program, registers):
+        codes = []
+        for name in program.names:
+            if name not in self.names:
+                self.names.append(name)
+            codes.append(self.names.index(name))
+        self._codes = np.array(codes, dtype=np.uint16)[program.opcodes]
+        if self._state is None:
+            self._state = registers.copy()
+            self._pass_base = registers.copy()
+            if self._file is not None:
+                self._file.write(MAGIC + registers.tobytes())
+        elif (self._state != registers).any():
+            # Registers changed between runs, keep the change as a record of its own
+            if EXTERNAL_NAME not in self.names:
+                self.names.append(EXTERNAL_NAME)
+            self.ring[self.position] = (EXTERNAL, 0, 0, registers)
+            self.position += 1
+            self.count += 1
+            if self.position == self.capacity:
+                self._wrap()
+            else:
+                self._encode()
+
+    def _encode(self):
+        """
+        Turn the records written since the last call into deltas.
+        """
+        start, stop = self.encoded, self.position
+        if stop > start:
+            records = self.ring[start:stop]
+            ips = records['ip']
+            external = ips == EXTERNAL
+            if len(self._codes):
+                records['opcode'] = self._codes[np.where(external, 0, ips)]
+            if external.any():
+                records['opcode'][external] = self.names.index(EXTERNAL_NAME)
+            self._state, records['changed'] = encode(records['delta'], self._state)
+            if self._file is not None:
+                records.tofile(self._file)
+        self.encoded = stop
+
+    def _wrap(self):
+        self._encode()
+        self._pass_base = self._state.copy()
+        self.position = self.encoded = 0
+
+    def run(self, program, code, registers, ip, limit):
+        """
+        Execute a program, recording every instruction.
+
+        Parameters
+        ----------
+        program : Program
+            The program to execute.
+        code : list(callable)
+            The program bound by Processor.bind.
+        registers : ndarray
+            The register buffer of the computer.
+        ip : int
+            Index of the first instruction to execute.
+        limit : int
+            Maximum number of instructions to execute.
+
+        Returns
+        -------
+        ip : int
+            Index of the next instruction to execute.
+        steps : int
+            Number of executed instructions.
+        """
+        self._start(program, registers)
+        ips = self.ring['ip']
+        states = self.ring['delta']
+        capacity = self.capacity
+        position = self.position
+        end = len(code)
+        steps = 0
+        try:
+            while ip < end and steps < limit:
+                target = code[ip]()
+                ips[position] = ip
+                states[position] = registers
+                position += 1
+                if position == capacity:
+                    self.position = position
+                    self._wrap()
+                    position = 0
+                ip = ip + 1 if target is None else target
+                steps += 1
+        finally:
+            self.count += steps
+            self.position = position
+            self._encode()
+        return ip, steps
+
+    def flush(self):
+        """
+        Write the opcode names and every streamed record to disk.
+        """
+        if self._file is not None:
+            self._file.flush()
+            with open(names_path(self.path), 'w') as names:
+                json.dump(self.names, names)
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def reader(self) -> TraceReader:
+        """
+        The records still in the ring buffer, oldest first.
+        """
+        position = self.position
+        if self._state is None:
+            return TraceReader(self.ring[:0], np.zeros(record_type['delta'].shape, dtype=np.uint8), self.names)
+        if self.count < self.capacity:
+            return TraceReader(self.ring[:position].copy(), self._pass_base, self.names, self.count - position)
+        # The oldest records are the end of the previous pass through the ring, which ended in _pass_base
+        older = self.ring[position:]
+        base = self._pass_base ^ np.bitwise_xor.reduce(older['delta'], axis=0)
+        records = np.concatenate((older, self.ring[:position]))
+        return TraceReader(records, base, self.names, self.count - len(records))
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __repr__(self):
+        return "Tracer({0} records, capacity {1})".format(self.count, self.capacity)
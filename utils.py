@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
 import warnings
 import numpy as np
-from multipledispatch import dispatch
-from copy import deepcopy
+from operator import index as _index
 from errors import *
 
 warnings.filterwarnings("ignore")
@@ -20,11 +19,105 @@ class Component:
         Name of a given component.
 
     """
+    __slots__ = ('name',)
 
     def __init__(self, name: str):
         self.name = name
 
 
+SCALAR = 'scalar'
+COMPONENT = 'component'
+
+# Operand kind of every type seen by the Active operators, filled by operand_kind()
+operand_kinds = {int: SCALAR, bool: SCALAR}
+for _type in (np.int8, np.int16, np.int32, np.int64, np.uint8, np.uint16, np.uint32, np.uint64):
+    operand_kinds[_type] = SCALAR
+
+
+def operand_kind(operand) -> str:
+    """
+    Resolve and cache the operand kind of a type not yet in operand_kinds.
+
+    Parameters
+    ----------
+    operand : any
+        Right hand side of an Active operator.
+
+    Returns
+    -------
+    str or None
+        SCALAR for ints and numpy scalars, COMPONENT for components,
+        None for unsupported types.
+
+    """
+    _type = type(operand)
+    if issubclass(_type, (int, np.generic)):
+        kind = SCALAR
+    elif issubclass(_type, Component):
+        kind = COMPONENT
+    else:
+        return None
+    operand_kinds[_type] = kind
+    return kind
+
+
+def accepts(*signatures):
+    """
+    Record the argument types a fast dispatched method accepts.
+
+    The method itself is left untouched, the signatures are only used
+    by set_dispatch() to build the equivalent multipledispatch dispatcher.
+
+    Parameters
+    ----------
+    signatures : tuple(type)
+        The types of every argument after self, one tuple per accepted signature.
+
+    """
+    def decorator(function):
+        function.signatures = signatures
+        return function
+    return decorator
+
+
+# Classes whose accepts() methods are swapped by set_dispatch()
+dispatch_classes = []
+_fast_methods = {}
+
+
+def set_dispatch(mode: str='fast'):
+    """
+    Select how operators and stores are dispatched on their argument types.
+
+    Parameters
+    ----------
+    mode : ['fast', 'multipledispatch'], optional
+        'fast' uses the inline type checks of every method. 'multipledispatch'
+        routes every call through a multipledispatch dispatcher with the same
+        signatures and is only meant as a reference for benchmarks.
+
+    """
+    if mode not in ('fast', 'multipledispatch'):
+        raise ValueError('Unknown dispatch mode {0}'.format(mode))
+
+    if mode == 'multipledispatch':
+        from multipledispatch.dispatcher import MethodDispatcher
+
+    for cls in dispatch_classes:
+        for name, method in list(vars(cls).items()):
+            method = _fast_methods.get((cls, name), method)
+            if not hasattr(method, 'signatures'):
+                continue
+            _fast_methods[cls, name] = method
+            if mode == 'fast':
+                setattr(cls, name, method)
+            else:
+                dispatcher = MethodDispatcher(name)
+                for signature in method.signatures:
+                    dispatcher.add(signature, method)
+                setattr(cls, name, dispatcher)
+
+
 class Active:
     """
     Main superclass for all components that hold values
@@ -47,119 +140,318 @@ class Active:
     All magic methods raise IncompatibleVariableSizes when calling
     one of the methods with two Actives that hold variables of two
     different sizes
+
+    The non in-place methods never modify or copy self, they
+    return a new Value holding the result instead.
+
+    Operand types are resolved through the operand_kinds table,
+    so the common int and numpy scalar cases cost a single dict lookup.
     """
+    __slots__ = ()
 
-    @dispatch((int, np.generic))
+    @accepts((int,), (np.generic,), (Component,))
     def __add__(self, other):
-        temp = deepcopy(self)
-        temp.value = temp.value + type(self.value)(other)
-        return temp
-
-    @dispatch((int, np.generic))
+        value = self.value
+        kind = operand_kinds.get(type(other)) or operand_kind(other)
+        if kind is SCALAR:
+            return Value(value + type(value)(other))
+        if kind is COMPONENT:
+            other = other.value
+            if value.nbytes < other.nbytes:
+                raise IncompatibleVariableSizes
+            return Value(value + type(value)(other))
+        return NotImplemented
+
+    @accepts((int,), (np.generic,), (Component,))
     def __iadd__(self, other):
-        self.value = self.value + type(self.value)(other)
-        return self
-
-    @dispatch((int, np.generic))
+        value = self.value
+        kind = operand_kinds.get(type(other)) or operand_kind(other)
+        if kind is SCALAR:
+            self.value = value + type(value)(other)
+            return self
+        if kind is COMPONENT:
+            other = other.value
+            if value.nbytes < other.nbytes:
+                raise IncompatibleVariableSizes
+            self.value = value + type(value)(other)
+            return self
+        return NotImplemented
+
+    @accepts((int,), (np.generic,), (Component,))
     def __sub__(self, other):
-        temp = deepcopy(self)
-        temp.value = temp.value - type(self.value)(other)
-        return temp
-
-    @dispatch((int, np.generic))
+        value = self.value
+        kind = operand_kinds.get(type(other)) or operand_kind(other)
+        if kind is SCALAR:
+            return Value(value - type(value)(other))
+        if kind is COMPONENT:
+            other = other.value
+            if value.nbytes < other.nbytes:
+                raise IncompatibleVariableSizes
+            return Value(value - type(value)(other))
+        return NotImplemented
+
+    @accepts((int,), (np.generic,), (Component,))
     def __isub__(self, other):
-        self.value = self.value - type(self.value)(other)
-        return self
-
-    @dispatch((int, np.generic))
+        value = self.value
+        kind = operand_kinds.get(type(other)) or operand_kind(other)
+        if kind is SCALAR:
+            self.value = value - type(value)(other)
+            return self
+        if kind is COMPONENT:
+            other = other.value
+            if value.nbytes < other.nbytes:
+                raise IncompatibleVariableSizes
+            self.value = value - type(value)(other)
+            return self
+        return NotImplemented
+
+    @accepts((int,), (np.generic,), (Component,))
     def __mul__(self, other):
-        temp = deepcopy(self)
-        temp.value = temp.value * type(self.value)(other)
-        return temp
-
-    @dispatch((int, np.generic))
+        value = self.value
+        kind = operand_kinds.get(type(other)) or operand_kind(other)
+        if kind is SCALAR:
+            return Value(value * type(value)(other))
+        if kind is COMPONENT:
+            other = other.value
+            if value.nbytes < other.nbytes:
+                raise IncompatibleVariableSizes
+            return Value(value * type(value)(other))
+        return NotImplemented
+
+    @accepts((int,), (np.generic,), (Component,))
     def __imul__(self, other):
-        self.value = self.value * type(self.value)(other)
-        return self
-
-    @dispatch((int, np.generic))
+        value = self.value
+        kind = operand_kinds.get(type(other)) or operand_kind(other)
+        if kind is SCALAR:
+            self.value = value * type(value)(other)
+            return self
+        if kind is COMPONENT:
+            other = other.value
+            if value.nbytes < other.nbytes:
+                raise IncompatibleVariableSizes
+            self.value = value * type(value)(other)
+            return self
+        return NotImplemented
+
+    @accepts((int,), (np.generic,), (Component,))
     def __truediv__(self, other):
-        temp = deepcopy(self)
-        temp.value = temp.value // type(self.value)(other)
-        return temp
-
-    @dispatch((int, np.generic))
+        value = self.value
+        kind = operand_kinds.get(type(other)) or operand_kind(other)
+        if kind is SCALAR:
+            return Value(value // type(value)(other))
+        if kind is COMPONENT:
+            other = other.value
+            if value.nbytes < other.nbytes:
+                raise IncompatibleVariableSizes
+            return Value(value // type(value)(other))
+        return NotImplemented
+
+    @accepts((int,), (np.generic,), (Component,))
     def __itruediv__(self, other):
-        self.value = self.value // type(self.value)(other)
-        return self
+        value = self.value
+        kind = operand_kinds.get(type(other)) or operand_kind(other)
+        if kind is SCALAR:
+            self.value = value // type(value)(other)
+            return self
+        if kind is COMPONENT:
+            other = other.value
+            if value.nbytes < other.nbytes:
+                raise IncompatibleVariableSizes
+            self.value = value // type(value)(other)
+            return self
+        return NotImplemented
+
+
+class Value(Active, Component):
+    """
+    Immutable result of an operation between Actives.
 
-    @dispatch(Component)
-    def __add__(self, other):
-        if self.value.nbytes < other.value.nbytes:
-            raise IncompatibleVariableSizes
-        temp = deepcopy(self)
-        temp.value = temp.value + type(temp.value)(other.value)
-        return temp
+    ...
+    Parameters
+    ----------
+    value : np.generic
+        The result of the operation.
 
-    @dispatch(Component)
-    def __iadd__(self, other):
-        if self.value.nbytes < other.value.nbytes:
-            raise IncompatibleVariableSizes
-        self.value = self.value + type(self.value)(other.value)
-        return self
+    Attributes
+    ----------
+    value : np.generic
+        The result of the operation, read only.
 
-    @dispatch(Component)
-    def __sub__(self, other):
-        if self.value.nbytes < other.value.nbytes:
-            raise IncompatibleVariableSizes
-        temp = deepcopy(self)
-        temp.value = temp.value - type(temp.value)(other.value)
-        return temp
+    Notes
+    -----
+    In-place operators on a Value return a new Value rather than
+    modifying the existing one.
+
+    Examples
+    --------
+    >>> eax = Register('eax')
+    >>> eax(5)
+    >>> result = eax + 5
+    >>> result()
+    10
+    >>> eax()
+    5
+    """
+    __slots__ = ('_value',)
+    name = 'Value'
 
-    @dispatch(Component)
-    def __isub__(self, other):
-        if self.value.nbytes < other.value.nbytes:
-            raise IncompatibleVariableSizes
-        self.value = self.value - type(self.value)(other.value)
-        return self
+    def __init__(self, value):
+        self._value = value
 
-    @dispatch(Component)
-    def __mul__(self, other):
-        if self.value.nbytes < other.value.nbytes:
-            raise IncompatibleVariableSizes
-        temp = deepcopy(self)
-        temp.value = temp.value * type(temp.value)(other.value)
-        return temp
+    @property
+    def value(self):
+        return self._value
 
-    @dispatch(Component)
-    def __imul__(self, other):
-        if self.value.nbytes < other.value.nbytes:
-            raise IncompatibleVariableSizes
-        self.value = self.value * type(self.value)(other.value)
-        return self
+    __iadd__ = Active.__add__
+    __isub__ = Active.__sub__
+    __imul__ = Active.__mul__
+    __itruediv__ = Active.__truediv__
 
-    @dispatch(Component)
-    def __truediv__(self, other):
-        if self.value.nbytes < other.value.nbytes:
-            raise IncompatibleVariableSizes
-        temp = deepcopy(self)
-        temp.value = temp.value // type(temp.value)(other.value)
-        return temp
+    def __repr__(self):
+        return repr(self._value)
 
-    @dispatch(Component)
-    def __itruediv__(self, other):
-        if self.value.nbytes < other.value.nbytes:
-            raise IncompatibleVariableSizes
-        self.value = self.value // type(self.value)(other.value)
-        return self
+    def __str__(self):
+        return str(self._value)
+
+    def __call__(self):
+        return self._value
 
 
-max_value = {
-    1: 255,
-    2: 65535,
-    4: 4294967295,
-    8: 18446744073709551615
-}
+dispatch_classes.extend((Active, Value))
+
+
+class TypeDescriptor:
+    """
+    Interned description of an integer variable type
+
+    ...
+    Parameters
+    ----------
+    size : [1, 2, 4, 8]
+        Size of the type in bytes.
+    signed : bool
+        Whether or not the type is signed.
+
+    Attributes
+    ----------
+    size : int
+        Size of the type in bytes.
+    bits : int
+        Size of the type in bits.
+    signed : bool
+        Whether or not the type is signed.
+    type : type
+        Numpy scalar type of values.
+    dtype : np.dtype
+        Big-endian dtype of the type in memory.
+    word : str
+        MASM word of the type, such as 'SDWORD'.
+    det : tuple(int, bool)
+        The size and signedness.
+    min, max : int
+        Range of the values of the type.
+    mask : int
+        Mask of the bits of the type.
+
+    Notes
+    -----
+    There is exactly one descriptor per type, created when utils is imported
+    and looked up with type_descriptor() or the descriptors tables, so
+    descriptors can be compared by identity and every conversion between
+    sizes, words and numpy types is an attribute load.
+
+    Examples
+    --------
+    >>> sdword = type_descriptor(4, True)
+    >>> sdword.word, sdword.min, sdword.dtype
+    ('SDWORD', -2147483648, dtype('>i4'))
+    >>> sdword is descriptors_by_word['SDWORD']
+    True
+    """
+    __slots__ = ('size', 'bits', 'signed', 'type', 'dtype', 'word', 'det', 'min', 'max', 'mask')
+
+    def __init__(self, size: int, signed: bool, _type: type, word: str):
+        self.size = size
+        self.bits = size * 8
+        self.signed = signed
+        self.type = _type
+        self.dtype = np.dtype('>{0}{1}'.format('i' if signed else 'u', size))
+        self.word = 'S' + word if signed else word
+        self.det = (size, signed)
+        self.mask = (1 << self.bits) - 1
+        self.min = -(1 << (self.bits - 1)) if signed else 0
+        self.max = self.mask >> 1 if signed else self.mask
+
+    def pack(self, number) -> list:
+        """
+        The bytes of a number, see split_number().
+        """
+        number = _index(number)
+        if number > self.mask or number < -((self.mask + 1) >> 1):
+            raise ValueError('{0} is too big for size {1}'.format(number, self.size))
+        return list((number & self.mask).to_bytes(self.size, 'big'))
+
+    def convert(self, value):
+        """
+        Convert a value the way storing it in a variable of the type does.
+
+        Python ints out of range raise OverflowError like converting them to
+        type would, but are returned as they are, which saves building a
+        numpy scalar. Anything else is converted to type.
+        """
+        if type(value) is int:
+            if value < self.min or value > self.max:
+                raise OverflowError('Python integer {0} out of bounds for {1}'.format(value, self.type.__name__))
+            return value
+        return self.type(value)
+
+    def unpack(self, memory_seg) -> np.generic:
+        """
+        The value of the bytes of a number, see combine_number().
+        """
+        if isinstance(memory_seg, np.ndarray) and memory_seg.dtype != np.uint8:
+            # bytes() of a wider array would read its raw buffer, not one byte per element
+            memory_seg = memory_seg.astype(np.uint8)
+        return self.type(int.from_bytes(bytes(memory_seg), 'big', signed=self.signed))
+
+    def __reduce__(self):
+        # Unpickle to the interned descriptor
+        return type_descriptor, self.det
+
+    def __repr__(self):
+        return 'TypeDescriptor({0})'.format(self.word)
+
+
+# The registry of every type descriptor, by size and signedness, MASM word and numpy type
+descriptors = {}
+for _size, _word, _types in ((1, 'BYTE', (np.uint8, np.int8)),
+                             (2, 'WORD', (np.uint16, np.int16)),
+                             (4, 'DWORD', (np.uint32, np.int32)),
+                             (8, 'QWORD', (np.uint64, np.int64))):
+    for _signed in (False, True):
+        descriptors[_size, _signed] = TypeDescriptor(_size, _signed, _types[_signed], _word)
+descriptors_by_word = {descriptor.word: descriptor for descriptor in descriptors.values()}
+descriptors_by_type = {descriptor.type: descriptor for descriptor in descriptors.values()}
+
+
+def type_descriptor(size: int, signed: bool=False) -> TypeDescriptor:
+    """
+    Look up the descriptor of a type.
+
+    Raises
+    ------
+    InvalidSize
+        The size given is not in the list of allowed sizes.
+    """
+    try:
+        return descriptors[size, bool(signed)]
+    except KeyError:
+        raise InvalidSize(size)
+
+
+max_value = {size: descriptor.mask for (size, signed), descriptor in descriptors.items() if not signed}
+
+integer_types = {det: descriptor.type for det, descriptor in descriptors.items()}
 
 
 def binary(number, size: int=32) -> str:
@@ -203,7 +495,7 @@ def binary_arr(arr: list) -> str:
     return ''.join([binary(val, 8) for val in arr])
 
 
-def split_number(number, size: int) -> str:
+def split_number(number, size: int) -> list:
     """
     Split a number into an 8-bit array for easy storage in memory.
 
@@ -216,8 +508,9 @@ def split_number(number, size: int) -> str:
 
     Returns
     -------
-    list(np.int8)
-        The byte list representation of the number.
+    list(int)
+        The byte list representation of the number, most significant byte first.
+        Negative numbers are stored in two's complement.
 
     Raises
     ------
@@ -228,14 +521,10 @@ def split_number(number, size: int) -> str:
     """
 
     try:
-        if abs(number) > max_value[size]:
-            raise ValueError('{0} is too big for size {1}'.format(number, size))
+        descriptor = descriptors[size, False]
     except KeyError:
         raise InvalidSize(size)
-
-    binary = np.binary_repr(number, width=(size * 8))[:size * 8]
-    binary = [binary[curr * 8:(curr + 1) * 8] for curr in range(size)]
-    return [eval('0b{0}'.format(num)) for num in binary]
+    return descriptor.pack(number)
 
 
 def combine_number(memory_seg, signed: bool=False) -> np.generic:
@@ -256,10 +545,79 @@ def combine_number(memory_seg, signed: bool=False) -> np.generic:
 
     """
 
-    binary = [np.binary_repr(number, width=8) for number in memory_seg]
-    binary = ''.join(binary)
-    size = len(memory_seg)
-    return variable_det_to_type(size, signed)(eval('0b{}'.format(binary)))
+    return descriptors[len(memory_seg), bool(signed)].unpack(memory_seg)
+
+
+def split_many(numbers, size: int) -> np.ndarray:
+    """
+    Vectorized version of split_number().
+
+    Parameters
+    ----------
+    numbers : array_like(int)
+        Numbers to convert.
+    size : [1, 2, 4, 8]
+        Size of each number in bytes.
+
+    Returns
+    -------
+    ndarray(np.uint8)
+        Array of shape (len(numbers), size) holding the byte representation
+        of every number, most significant byte first.
+
+    Raises
+    ------
+    ValueError
+        If any number does not fit in the given size.
+    InvalidSize
+        The size given is not in the list of allowed sizes.
+    """
+
+    maximum = type_descriptor(size).mask
+
+    numbers = np.asarray(numbers)
+    if numbers.dtype.kind == 'O':
+        return np.array([split_number(number, size) for number in numbers.ravel()],
+                        dtype=np.uint8).reshape(-1, size)
+    if numbers.dtype.kind not in 'biu':
+        raise TypeError('Cannot split numbers of type {0}'.format(numbers.dtype))
+
+    if numbers.size:
+        if numbers.max() > maximum:
+            raise ValueError('{0} is too big for size {1}'.format(numbers.max(), size))
+        if numbers.dtype.kind == 'i' and numbers.min() < -((maximum + 1) >> 1):
+            raise ValueError('{0} is too big for size {1}'.format(numbers.min(), size))
+
+    return numbers.astype(descriptors[size, False].dtype).view(np.uint8).reshape(-1, size)
+
+
+def combine_many(memory_seg, size: int, signed: bool=False) -> np.ndarray:
+    """
+    Vectorized version of combine_number().
+
+    Parameters
+    ----------
+    memory_seg : array_like(int)
+        Bytes of consecutive numbers, either flat or of shape (n, size).
+    size : [1, 2, 4, 8]
+        Size of each number in bytes.
+    signed : [False, True], optional
+        Whether or not the numbers are signed or unsigned.
+
+    Returns
+    -------
+    ndarray
+        The numbers in their appropriate numpy integer format.
+
+    Raises
+    ------
+    InvalidSize
+        The size given is not in the list of allowed sizes.
+    """
+
+    descriptor = type_descriptor(size, signed)
+    memory_seg = np.ascontiguousarray(memory_seg, dtype=np.uint8).reshape(-1)
+    return memory_seg.view(descriptor.dtype).astype(descriptor.type)
 
 
 def hex(value, size: int=8) -> str:
@@ -294,28 +652,21 @@ def variable_det_to_word(size: int, signed: bool) -> str:
     """
     Convert a description of a variable type to the
     assembly word description of the type.
-    
+
     Parameters
     ----------
     size : [1,2,4,8]
         Size of variable type in bytes.
     signed : [True, False]
         Whether or not the variable is signed.
-    
+
     Returns
     -------
     Word : str
         Assembly word form of variable.
-    
+
     """
-    
-    size = {1: 'BYTE',
-            2: 'WORD',
-            4: 'DWORD',
-            8: 'QWORD'}[size]
-    if signed:
-        size = "S{}".format(size)
-    return size
+    return descriptors[size, bool(signed)].word
 
 
 def variable_det_to_type(size: int, signed: bool) -> type:
@@ -336,13 +687,7 @@ def variable_det_to_type(size: int, signed: bool) -> type:
         Numpy type matching variable description.
 
     """
-    word = {1: 'int8',
-            2: 'int16',
-            4: 'int32',
-            8: 'int64'}[size]
-    if not signed:
-        word = "u{}".format(word)
-    return eval('np.{}'.format(word))
+    return descriptors[size, bool(signed)].type
 
 
 def variable_word_to_type(word: str) -> type:
@@ -361,21 +706,7 @@ def variable_word_to_type(word: str) -> type:
         Numpy type matching variable description.
 
     """
-
-    word = word.upper()
-    signed = False
-    if word[0] == 'S':
-        signed = True
-        word = word[1:]
-
-    word = {'BYTE' : 'int8',
-            'WORD' : 'int16',
-            'DWORD': 'int32',
-            'QWORD': 'int64'}[word]
-    if not signed:
-        word = "u{}".format(word)
-
-    return eval('np.{}'.format(word))
+    return descriptors_by_word[word.upper()].type
 
 
 def variable_word_to_det(word: str) -> tuple:
@@ -396,18 +727,7 @@ def variable_word_to_det(word: str) -> tuple:
         Whether or not the variable type is signed
 
     """
-    word = word.upper()
-    signed = False
-    if word[0] == 'S':
-        signed = True
-        word = word[1:]
-
-    size = {'BYTE' : 1,
-            'WORD' : 2,
-            'DWORD': 4,
-            'QWORD': 8}[word]
-
-    return size, signed
+    return descriptors_by_word[word.upper()].det
 
 
 def variable_type_to_det(_type):
@@ -428,31 +748,18 @@ def variable_type_to_det(_type):
         Whether or not the variable type is signed
 
     """
-    det = str(_type)[14:].split("'")[0]
-    signed = True
-    if det[0] == 'u':
-        signed = False
-        det = det[1:]
-
-    size = {'int8' : 1,
-           'int16': 2,
-           'int32': 4,
-           'int64': 8}[det]
-
-    return size, signed
+    return descriptors_by_type[_type].det
 
 
 def variable_type_to_word(_type):
     """
-    Convert a description of a variable type to the
+    Convert the numpy type into the
     assembly word description of the type.
 
     Parameters
     ----------
-    size : [1,2,4,8]
-        Size of variable type in bytes.
-    signed : [True, False]
-        Whether or not the variable is signed.
+    _type : type
+        Numpy type equivalent to the variable type
 
     Returns
     -------
@@ -460,27 +767,11 @@ def variable_type_to_word(_type):
         Assembly word form of variable.
 
     """
-    word = str(_type)[14:].split("'")[0]
-    signed = True
-    if word[0] == 'u':
-        signed = False
-        word = word[1:]
-
-    word = {'int8' : 'BYTE',
-            'int16': 'WORD',
-            'int32': 'DWORD',
-            'int64': 'QWORD'}[word]
-
-    if signed:
-        word = 'S{}'.format(word)
-
-    return word
+    return descriptors_by_type[_type].word
 
 
 def variable_all(*args, **kwargs):
     if (len(args) + len(kwargs)) == 2:
-        word = variable_det_to_word(*args, **kwargs)
-        _type = variable_det_to_type(*args, **kwargs)
         try:
             size = kwargs['size']
         except KeyError:
@@ -491,37 +782,24 @@ def variable_all(*args, **kwargs):
         except KeyError:
             signed = args[1]
 
-        return {'word': word,
-                'type': _type,
-                'det' : (size, bool(signed))}
+        descriptor = descriptors[size, bool(signed)]
 
-    elif len(kwargs) == 1:
-        try:
-            var = kwargs['word']
-        except KeyError:
-            var = kwargs['_type']
-            word_conv = False
+    else:
+        if len(kwargs) == 1:
+            try:
+                var = kwargs['word']
+            except KeyError:
+                var = kwargs['_type']
+        elif len(args) == 1:
+            var = args[0]
         else:
-            word_conv = True
+            raise Exception('No match found for conversion')
 
-    elif len(args) == 1:
-        var = args[0]
         if isinstance(var, str):
-            word_conv = True
+            descriptor = descriptors_by_word[var.upper()]
         else:
-            word_conv = False
-    else:
-        raise Exception('No match found for conversion')
-
-    if word_conv:
-        word = var.upper()
-        _type = variable_word_to_type(word)
-        det = variable_word_to_det(word)
-    else:
-        _type = var
-        word = variable_type_to_word(_type)
-        det = variable_type_to_det(_type)
+            descriptor = descriptors_by_type[var]
 
-    return {'word': word,
-            'type': _type,
-            'det' : det}
+    return {'word': descriptor.word,
+            'type': descriptor.type,
+            'det' : descriptor.det}